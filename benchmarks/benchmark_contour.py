@@ -0,0 +1,18 @@
+from glue_exp.tools.contour_selection.contour_selection import contour_to_roi
+
+from .common import SIZES, DTYPES, REGION_FRACTIONS, make_bowl_image
+
+
+class ContourToRoi(object):
+
+    params = [SIZES, DTYPES[1:], REGION_FRACTIONS]
+    param_names = ['size', 'dtype', 'region_fraction']
+
+    def setup(self, size, dtype, region_fraction):
+        self.data, (self.x, self.y) = make_bowl_image(size, dtype, region_fraction)
+
+    def time_contour_to_roi(self, size, dtype, region_fraction):
+        contour_to_roi(self.x, self.y, self.data)
+
+    def peakmem_contour_to_roi(self, size, dtype, region_fraction):
+        contour_to_roi(self.x, self.y, self.data)
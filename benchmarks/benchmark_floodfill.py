@@ -0,0 +1,37 @@
+from glue_exp.tools.floodfill_selection.floodfill_scipy import floodfill_scipy
+from glue_exp.tools.floodfill_selection.backends import FLOODFILL_BACKENDS, floodfill
+
+from .common import SIZES, DTYPES, NDIMS, REGION_FRACTIONS, make_region_image
+
+
+class FloodfillScipy(object):
+
+    params = [SIZES, DTYPES, NDIMS, REGION_FRACTIONS]
+    param_names = ['size', 'dtype', 'ndim', 'region_fraction']
+
+    def setup(self, size, dtype, ndim, region_fraction):
+        self.data = make_region_image(size, dtype, ndim, region_fraction)
+        self.start = (0,) * ndim
+
+    def time_floodfill_scipy(self, size, dtype, ndim, region_fraction):
+        floodfill_scipy(self.data, self.start, 1.5)
+
+    def peakmem_floodfill_scipy(self, size, dtype, ndim, region_fraction):
+        floodfill_scipy(self.data, self.start, 1.5)
+
+
+class FloodfillBackends(object):
+
+    params = [SIZES[:2], list(FLOODFILL_BACKENDS), REGION_FRACTIONS]
+    param_names = ['size', 'backend', 'region_fraction']
+
+    def setup(self, size, backend, region_fraction):
+        self.data = make_region_image(size, 'float32', 2, region_fraction)
+        # Run once so that any compilation is not included in the timings
+        floodfill(self.data[:4, :4], (0, 0), 1.5, backend=backend)
+
+    def time_floodfill(self, size, backend, region_fraction):
+        floodfill(self.data, (0, 0), 1.5, backend=backend)
+
+    def peakmem_floodfill(self, size, backend, region_fraction):
+        floodfill(self.data, (0, 0), 1.5, backend=backend)
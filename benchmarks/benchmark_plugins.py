@@ -0,0 +1,31 @@
+"""
+Benchmarks of the time taken to import the package and to set up the plugins
+at glue startup. Each benchmark runs in a new Python process.
+"""
+
+# Modules imported by glue at startup, before external plugins are loaded,
+# which are not included in the timings
+STARTUP = """
+import glue.config
+import glue.logger
+import glue.viewers.image.qt
+"""
+
+PLUGINS = ['glue_exp.importers.webcam', 'glue_exp.importers.vizier',
+           'glue_exp.tools.contour_selection', 'glue_exp.tools.floodfill_selection',
+           'glue_exp.tools.zoom_buttons']
+
+
+class Import(object):
+
+    def timeraw_import(self):
+        return "import glue_exp", "import importlib.metadata"
+
+
+class PluginSetup(object):
+
+    params = [PLUGINS]
+    param_names = ['plugin']
+
+    def timeraw_setup(self, plugin):
+        return "from {0} import setup; setup()".format(plugin), STARTUP
@@ -0,0 +1,90 @@
+"""
+End-to-end benchmarks of the tools in a glue image viewer, including the
+conversion of the selection to a subset and the redrawing of the viewer.
+"""
+
+from .common import (SIZES, NDIMS, REGION_FRACTIONS, make_region_image,
+                     get_application, Event)
+
+
+class ViewerBenchmark(object):
+
+    def setup_viewer(self, data):
+
+        from glue.core import Data
+        from glue.viewers.image.qt import ImageViewer
+
+        self.data = Data(label='data', x=data)
+        self.application = get_application()
+        self.application.data_collection.append(self.data)
+        self.viewer = self.application.new_data_viewer(ImageViewer)
+        self.viewer.add_data(self.data)
+        self.canvas = self.viewer.axes.figure.canvas
+
+    def teardown(self, *args):
+        self.viewer.close(warn=False)
+        self.application.close()
+
+
+class FloodfillTool(ViewerBenchmark):
+
+    params = [SIZES[:2], NDIMS, REGION_FRACTIONS]
+    param_names = ['size', 'ndim', 'region_fraction']
+
+    def setup(self, size, ndim, region_fraction):
+
+        self.setup_viewer(make_region_image(size, 'float32', ndim, region_fraction))
+
+        self.viewer.toolbar.active_tool = 'Flood fill'
+        self.tool = self.viewer.toolbar.tools['Flood fill']
+        self.tool.background = False
+        self.tool.time_budget = None
+
+        # The whole cube is filled rather than only the slice shown
+        self.tool.volumetric = True
+
+        # Dragging by 5% of the width of the figure gives a threshold of about
+        # 1.3, so that only the region is selected.
+        width, height = self.canvas.get_width_height()
+        self.start_event = Event(0, 0, 0, 0, self.canvas)
+        self.end_event = Event(0.05 * width, 0, canvas=self.canvas)
+
+        # Select once so that any calibration is not included in the timings
+        self._select()
+
+    def _select(self):
+        self.tool.press(self.start_event)
+        self.tool.release(self.end_event)
+
+    def time_floodfill_roi(self, size, ndim, region_fraction):
+        self._select()
+
+    def peakmem_floodfill_roi(self, size, ndim, region_fraction):
+        self._select()
+
+
+class AutoZoom(ViewerBenchmark):
+
+    params = [SIZES]
+    param_names = ['size']
+
+    def setup(self, size):
+        self.setup_viewer(make_region_image(size, 'float32', 2, 0.1))
+        self.canvas.draw()
+
+    def time_auto_zoom(self, size):
+        from glue_exp.tools.zoom_buttons.zoom_buttons import auto_zoom
+        auto_zoom(self.viewer.axes, zoom_type='in')
+        self.canvas.draw()
+        auto_zoom(self.viewer.axes, zoom_type='out')
+        self.canvas.draw()
+
+    def time_pending_zoom(self, size):
+        # Ten zoom requests in quick succession, as when holding down the
+        # shortcut, which should only cause one redraw
+        from glue_exp.tools.zoom_buttons.zoom_buttons import PendingZoom
+        zoom = PendingZoom(self.viewer.axes)
+        for index in range(10):
+            zoom.zoom(0.5 if index % 2 == 0 else 2.)
+        zoom.flush()
+        self.canvas.draw()
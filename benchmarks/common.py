@@ -0,0 +1,96 @@
+"""
+Synthetic datasets and helpers shared by the benchmarks.
+"""
+
+import os
+
+import numpy as np
+
+# Parameters used by the benchmarks. Images range from 1k to 16k pixels on a
+# side, and cubes have the same total number of pixels as the equivalent
+# image.
+SIZES = [1024, 4096, 16384]
+DTYPES = ['int16', 'float32', 'float64']
+NDIMS = [2, 3]
+REGION_FRACTIONS = [0.001, 0.1, 1.]
+
+# Benchmarks for which the data would use more than this many bytes are
+# skipped. This can be changed with the GLUE_EXP_BENCHMARK_MAX_BYTES
+# environment variable.
+MAX_BYTES = int(os.environ.get('GLUE_EXP_BENCHMARK_MAX_BYTES', 4 * 1024 ** 3))
+
+# The application has to always be referenced to avoid being shut down
+_app = None
+
+
+def check_size(size, dtype):
+    """
+    Skip the benchmark (by raising `NotImplementedError`, as expected by asv)
+    if the data would be too large.
+    """
+    if size ** 2 * np.dtype(dtype).itemsize > MAX_BYTES:
+        raise NotImplementedError("Data would exceed {0} bytes".format(MAX_BYTES))
+
+
+def get_shape(size, ndim):
+    """
+    Return a shape with ``ndim`` dimensions and ``size ** 2`` pixels in total
+    (approximately for three dimensions).
+    """
+    side = int(round(size ** (2. / ndim)))
+    return (side,) * ndim
+
+
+def make_region_image(size, dtype, ndim, region_fraction):
+    """
+    Make data with a value of 1 in a box in the corner occupying
+    ``region_fraction`` of the data and a value of 2 elsewhere, so that
+    flood filling from the first pixel with a threshold below 2 selects the
+    box.
+    """
+    check_size(size, dtype)
+    shape = get_shape(size, ndim)
+    data = np.full(shape, 2, dtype=dtype)
+    box = tuple(slice(0, max(1, int(round(n * region_fraction ** (1. / ndim))))) for n in shape)
+    data[box] = 1
+    return data
+
+
+def make_bowl_image(size, dtype, region_fraction):
+    """
+    Make a 2D image which decreases away from the center and return it along
+    with the (x, y) position of a pixel whose contour encloses
+    ``region_fraction`` of the image.
+    """
+    check_size(size, dtype)
+    y, x = np.ogrid[:size, :size]
+    center = size / 2
+    data = (2 * size ** 2 - (x - center) ** 2 - (y - center) ** 2).astype(dtype)
+    radius = min(np.sqrt(region_fraction * size ** 2 / np.pi), center - 1)
+    return data, (int(center + radius), int(center))
+
+
+def get_application():
+    """
+    Return a glue application running without a display.
+    """
+    global _app
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from glue.utils.qt import get_qapp
+    from glue.app.qt import GlueApplication
+    _app = get_qapp()
+    return GlueApplication()
+
+
+class Event(object):
+    """
+    A minimal Matplotlib mouse event.
+    """
+
+    def __init__(self, x, y, xdata=None, ydata=None, canvas=None):
+        self.x = x
+        self.y = y
+        self.xdata = xdata
+        self.ydata = ydata
+        self.canvas = canvas
+        self.button = 1
@@ -1,10 +1,12 @@
 def setup():
 
-    from .qt_widget import QtVizierImporter
     from glue.config import importer
 
     @importer("Import from VizieR")
     def vizier_importer():
+        # The dialog and its dependencies (requests and astropy) are only
+        # imported once the importer is used
+        from .qt_widget import QtVizierImporter
         wi = QtVizierImporter()
         wi.exec_()
         return wi.datasets
@@ -1,20 +1,38 @@
 import os
+import threading
 
 from qtpy import QtWidgets
-from qtpy.QtCore import Qt
+from qtpy.QtCore import Qt, Signal
 
 from glue.utils.qt.helpers import load_ui
-from glue.utils.qt import get_qapp
 
-from .vizier_helpers import query_vizier, fetch_vizier_catalog
+from .vizier_helpers import (iter_query_vizier, fetch_vizier_catalogs, Cancellation,
+                             FetchCancelled, CatalogOptions, parse_constraints)
 
 __all__ = ["QtVizierImporter"]
 
 UI_MAIN = os.path.join(os.path.dirname(__file__), 'vizier.ui')
+SEARCH_BATCH = 20  # number of sets of catalogs sent at a time from the search thread
 
 
 class QtVizierImporter(QtWidgets.QDialog):
 
+    # Signals used to report on searches and downloads from the background
+    # threads. The first argument of the search signals is the cancellation
+    # flag of the search, which identifies the search.
+    _search_results = Signal(object, object)
+    _search_done = Signal(object, object)
+    _fetch_progress = Signal(object, object)
+    _fetch_done = Signal(object, object)
+
+    # Whether to request catalogs in the BINARY2 VOTable serialization, which
+    # is smaller to download and faster to parse.
+    binary2 = False
+
+    # The number of sets of catalogs shown at a time in the search results.
+    # More can be shown with the 'Show more results' button.
+    page_size = 100
+
     def __init__(self):
 
         super(QtVizierImporter, self).__init__()
@@ -24,6 +42,8 @@ class QtVizierImporter(QtWidgets.QDialog):
         self.cancel.clicked.connect(self.reject)
         self.ok.clicked.connect(self.finalize)
         self.search_button.clicked.connect(self.search)
+        self.more_button.clicked.connect(self.show_more)
+        self.tree.itemExpanded.connect(self._populate)
 
         # Focus on anything other than query line otherwise the placeholder
         # text disappears straight away.
@@ -32,65 +52,259 @@ class QtVizierImporter(QtWidgets.QDialog):
         self.query.setPlaceholderText("Enter a search term here to search for "
                                       "authors, titles, descriptions, etc.")
 
-        self._checkboxes = {}
+        self._results = []
+        self._n_shown = 0
+        self._search_cancellation = None
+        self._cancellation = None
         self.datasets = []
 
+        self._search_results.connect(self._on_search_results)
+        self._search_done.connect(self._on_search_done)
+        self._fetch_progress.connect(self._on_fetch_progress)
+        self._fetch_done.connect(self._on_fetch_done)
+
+        self._update_more_button()
+
     def clear(self):
-        self._checkboxes.clear()
+        self._results = []
+        self._n_shown = 0
         self.tree.clear()
+        self._update_more_button()
 
     def search(self):
+        """
+        Search VizieR for the text in the query box.
+
+        The search runs on a background thread, and the results are added to
+        the tree as they are received. Any search still in progress is
+        cancelled.
+        """
+
+        self._cancel_search()
+        self.clear()
 
-        self.search_button.setEnabled(False)
         self.search_button.setText("Searching")
+        self.progress.setRange(0, 0)
+
+        cancellation = self._search_cancellation = Cancellation()
+        query_text = self.query.text()
+
+        def run():
+            batch = []
+            try:
+                for catalog_set in iter_query_vizier(query_text, cancellation=cancellation):
+                    batch.append(catalog_set)
+                    if len(batch) == SEARCH_BATCH:
+                        self._search_results.emit(cancellation, batch)
+                        batch = []
+            except Exception as exc:
+                self._search_results.emit(cancellation, batch)
+                self._search_done.emit(cancellation, exc)
+            else:
+                self._search_results.emit(cancellation, batch)
+                self._search_done.emit(cancellation, None)
+
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+
+    def _cancel_search(self):
+        if self._search_cancellation is not None:
+            self._search_cancellation.cancel()
+            self._search_cancellation = None
+            self.search_button.setText("Search")
+            self.progress.setRange(0, 100)
+
+    def _on_search_results(self, cancellation, results):
+        if cancellation is not self._search_cancellation:
+            return
+        self._results.extend(results)
+        if self._n_shown < self.page_size:
+            self._show(self.page_size - self._n_shown)
+        self._update_more_button()
+
+    def _on_search_done(self, cancellation, error):
+
+        if cancellation is not self._search_cancellation:
+            return
+
+        self._search_cancellation = None
+        self.search_button.setText("Search")
+        self.progress.setRange(0, 100)
 
-        app = get_qapp()
-        app.processEvents()
+        if error is not None and not isinstance(error, FetchCancelled):
+            QtWidgets.QMessageBox.critical(self, "Error",
+                                           "Could not search VizieR: {0}".format(error))
 
-        self.clear()
+    def show_more(self):
+        """
+        Show the next page of search results.
+        """
+        self._show(self.page_size)
+        self._update_more_button()
+
+    def _show(self, n_sets):
 
-        results = query_vizier(self.query.text())
+        # Add top-level items for the next sets of catalogs. The items for the
+        # catalogs themselves are only created once a set is expanded.
+        start = self._n_shown
+        self._n_shown = min(len(self._results), start + n_sets)
 
-        for catalog_set in results:
+        for index in range(start, self._n_shown):
+            catalog_set = self._results[index]
             main = QtWidgets.QTreeWidgetItem(self.tree.invisibleRootItem(),
                                              [catalog_set['description'], ""])
-            main.setFlags(main.flags() | Qt.ItemIsTristate)
+            main.setFlags(main.flags() | Qt.ItemIsTristate | Qt.ItemIsUserCheckable)
             main.setCheckState(2, Qt.Unchecked)
-            for catalog in catalog_set['tables']:
-                sub = QtWidgets.QTreeWidgetItem(main)
-                sub.setFlags(sub.flags() | Qt.ItemIsUserCheckable)
-                sub.setCheckState(2, Qt.Unchecked)
-                sub.setText(0, catalog['description'])
-                sub.setText(1, catalog['nrows'])
-                sub.setText(2, "")
-                self._checkboxes[catalog['name']] = sub
-
-        self.tree.resizeColumnToContents(0)
-        self.tree.resizeColumnToContents(1)
-        self.tree.resizeColumnToContents(2)
-
-        self.search_button.setEnabled(True)
-        self.search_button.setText("Search")
+            main.setData(0, Qt.UserRole, index)
+            if catalog_set['tables']:
+                main.setChildIndicatorPolicy(QtWidgets.QTreeWidgetItem.ShowIndicator)
+
+        if start == 0 and self._n_shown > 0:
+            self.tree.resizeColumnToContents(0)
+            self.tree.resizeColumnToContents(1)
+            self.tree.resizeColumnToContents(2)
+
+    def _update_more_button(self):
+        n_hidden = len(self._results) - self._n_shown
+        self.more_button.setVisible(n_hidden > 0)
+        self.more_button.setText("Show more results ({0} more)".format(n_hidden))
+
+    def _populate(self, main):
+
+        if main.childCount() > 0:
+            return
+
+        # New items take the state of the set, so that a set checked before
+        # being expanded stays checked.
+        state = main.checkState(2)
+
+        for catalog in self._results[main.data(0, Qt.UserRole)]['tables']:
+            sub = QtWidgets.QTreeWidgetItem(main)
+            sub.setFlags(sub.flags() | Qt.ItemIsUserCheckable)
+            sub.setCheckState(2, state)
+            sub.setText(0, catalog['description'])
+            sub.setText(1, catalog['nrows'])
+            sub.setText(2, "")
+            sub.setData(0, Qt.UserRole, catalog['name'])
+
+    def selected_catalogs(self):
+        """
+        Return the catalogs selected in the search results.
+
+        Returns
+        -------
+        catalogs : list of dict
+            The selected catalogs, as dictionaries with a ``description``, a
+            ``name``, and a number of rows ``nrows``.
+        """
+
+        selected = []
+
+        for i in range(self.tree.topLevelItemCount()):
+            main = self.tree.topLevelItem(i)
+            tables = self._results[main.data(0, Qt.UserRole)]['tables']
+            if main.childCount() == 0:
+                # Sets which have not been expanded are entirely selected or not
+                if main.checkState(2) == Qt.Checked:
+                    selected.extend(tables)
+            else:
+                for j in range(main.childCount()):
+                    if main.child(j).checkState(2) == Qt.Checked:
+                        selected.append(tables[j])
+
+        return selected
 
     def finalize(self):
 
         retrieve = []
+        n_rows = {}
 
-        for name in self._checkboxes:
-            if self._checkboxes[name].checkState(2) > 0:
-                retrieve.append(name)
+        for catalog in self.selected_catalogs():
+            retrieve.append(catalog['name'])
+            try:
+                n_rows[catalog['name']] = int(catalog['nrows'])
+            except ValueError:
+                pass
 
-        self.datasets = []
+        try:
+            options = self.options()
+        except ValueError as exc:
+            QtWidgets.QMessageBox.critical(self, "Error", str(exc))
+            return
 
-        for iname, name in enumerate(retrieve):
+        self._cancel_search()
 
-            self.progress.setValue(iname / float(len(retrieve)) * 100.)
+        self.datasets = []
 
-            # update progress bar
-            app = get_qapp()
-            app.processEvents()
+        self.ok.setEnabled(False)
+        self.search_button.setEnabled(False)
+        self.progress.setValue(0)
+
+        # The catalogs are downloaded in parallel on a background thread so
+        # that the dialog stays responsive, and the download can be cancelled.
+        cancellation = self._cancellation = Cancellation()
+
+        def fetch():
+            try:
+                datasets = fetch_vizier_catalogs(retrieve, progress=self._fetch_progress.emit,
+                                                 cancellation=cancellation,
+                                                 binary2=self.binary2, options=options,
+                                                 n_rows=n_rows)
+            except Exception as exc:
+                self._fetch_done.emit(None, exc)
+            else:
+                self._fetch_done.emit(datasets, None)
+
+        thread = threading.Thread(target=fetch)
+        thread.daemon = True
+        thread.start()
+
+    def options(self):
+        """
+        Return the :class:`~glue_exp.importers.vizier.vizier_helpers.CatalogOptions`
+        set in the dialog.
+        """
+        columns = [name.strip() for name in self.columns.text().split(',') if name.strip()]
+        return CatalogOptions(columns=columns or None,
+                              max_rows=self.max_rows.value() or None,
+                              center=self.cone_center.text().strip() or None,
+                              radius=self.cone_radius.value(),
+                              constraints=parse_constraints(self.constraints.text()) or None,
+                              batch_size=self.batch_size.value() or None)
+
+    def _on_fetch_progress(self, n_bytes, total):
+        if total:
+            self.progress.setRange(0, 100)
+            self.progress.setValue(int(n_bytes / total * 100))
+        else:
+            # Show a busy indicator if the size of the catalogs is not known
+            self.progress.setRange(0, 0)
+
+    def _on_fetch_done(self, datasets, error):
+
+        self._cancellation = None
+        self.progress.setRange(0, 100)
+
+        if isinstance(error, FetchCancelled):
+            return
+
+        self.ok.setEnabled(True)
+        self.search_button.setEnabled(True)
 
-            self.datasets.append(fetch_vizier_catalog(name))
+        if error is not None:
+            self.progress.setValue(0)
+            QtWidgets.QMessageBox.critical(self, "Error",
+                                           "Could not download the catalogs: {0}".format(error))
+            return
 
+        self.datasets = datasets
         self.progress.setValue(100)
         self.accept()
+
+    def reject(self):
+        # Stop any searches or downloads still in progress
+        self._cancel_search()
+        if self._cancellation is not None:
+            self._cancellation.cancel()
+        super(QtVizierImporter, self).reject()
@@ -0,0 +1,94 @@
+import time
+
+import pytest
+from qtpy.QtCore import Qt
+
+from glue.utils.qt import get_qapp
+
+from ..qt_widget import QtVizierImporter
+from .test_vizier_helpers import (VizierHandler, make_search_votable,  # noqa
+                                  vizier_server, vizier_cache)
+
+
+def test_options():
+
+    dialog = QtVizierImporter()
+
+    options = dialog.options()
+    assert options.params() == {}
+    assert options.batch_size is None
+
+    dialog.columns.setText('RAJ2000, DEJ2000,Vmag')
+    dialog.max_rows.setValue(1000)
+    dialog.cone_center.setText('M31')
+    dialog.cone_radius.setValue(2)
+    dialog.constraints.setText('Vmag=<10')
+    dialog.batch_size.setValue(500)
+
+    options = dialog.options()
+    assert options.params() == {'-out': 'RAJ2000,DEJ2000,Vmag', '-out.max': 1000,
+                                '-c': 'M31', '-c.rm': 2, 'Vmag': '<10'}
+    assert options.batch_size == 500
+
+    dialog.constraints.setText('Vmag')
+    with pytest.raises(ValueError):
+        dialog.options()
+
+
+def wait_for(condition, timeout=10):
+    app = get_qapp()
+    start = time.time()
+    while not condition():
+        assert time.time() - start < timeout
+        app.processEvents()
+        time.sleep(0.01)
+
+
+def test_search(vizier_server):  # noqa: F811
+
+    VizierHandler.searches['galaxy'] = make_search_votable(250, 2), 1
+
+    dialog = QtVizierImporter()
+    dialog.page_size = 100
+    dialog.query.setText('galaxy')
+    dialog.search()
+
+    # The first results are shown before the search is complete
+    wait_for(lambda: dialog.tree.topLevelItemCount() > 0)
+    assert dialog._search_cancellation is not None
+
+    wait_for(lambda: dialog._search_cancellation is None)
+
+    # Results are shown one page at a time
+    assert dialog.tree.topLevelItemCount() == 100
+    assert not dialog.more_button.isHidden()
+    dialog.show_more()
+    dialog.show_more()
+    assert dialog.tree.topLevelItemCount() == 250
+    assert dialog.more_button.isHidden()
+
+    # Catalogs are only added to the tree once a set is expanded
+    first, second = dialog.tree.topLevelItem(0), dialog.tree.topLevelItem(1)
+    assert first.text(0) == 'Set 0'
+    assert first.childCount() == 0
+
+    first.setCheckState(2, Qt.Checked)
+    dialog.tree.expandItem(first)
+    assert first.childCount() == 2
+    assert first.child(1).checkState(2) == Qt.Checked
+
+    dialog.tree.expandItem(second)
+    second.child(1).setCheckState(2, Qt.Checked)
+    assert second.checkState(2) == Qt.PartiallyChecked
+
+    dialog.tree.topLevelItem(2).setCheckState(2, Qt.Checked)
+
+    assert [catalog['name'] for catalog in dialog.selected_catalogs()] == [
+        'J/test/0/0', 'J/test/0/1', 'J/test/1/1', 'J/test/2/0', 'J/test/2/1']
+
+    # A new search replaces the results
+    VizierHandler.searches['star'] = make_search_votable(2, 1), 0
+    dialog.query.setText('star')
+    dialog.search()
+    wait_for(lambda: dialog._search_cancellation is None)
+    assert dialog.tree.topLevelItemCount() == 2
@@ -0,0 +1,72 @@
+import os
+
+import numpy as np
+
+from glue.core.data import Data
+
+from ..vizier_cache import VizierCache
+
+
+def test_store_load(tmp_path):
+
+    cache = VizierCache(str(tmp_path))
+
+    data = Data(ra=[1., 2., 3.], name=['a', 'b', 'c'], label='J/test/1')
+    data.get_component('ra').units = 'deg'
+
+    key = cache.key('http://vizier', {'-source': 'J/test/1'})
+    assert cache.load(key) is None
+
+    cache.store(key, data, etag='"abc"')
+
+    entry = cache.load(key)
+    assert entry.etag == '"abc"'
+    assert entry.last_modified is None
+    assert cache.is_fresh(entry)
+
+    loaded = entry.value
+    assert loaded.label == 'J/test/1'
+    np.testing.assert_equal(loaded['ra'], [1., 2., 3.])
+    assert loaded.get_component('ra').units == 'deg'
+    assert loaded.get_component('name').categorical
+    np.testing.assert_equal(loaded['name'], ['a', 'b', 'c'])
+
+    key = cache.key('http://vizier', {'-words': ['galaxies']})
+    cache.store(key, [{'description': 'Galaxies', 'tables': []}])
+    assert cache.load(key).value == [{'description': 'Galaxies', 'tables': []}]
+
+
+def test_ttl(tmp_path):
+
+    cache = VizierCache(str(tmp_path), ttl=0)
+
+    cache.store('key', [1, 2])
+    entry = cache.load('key')
+    assert not cache.is_fresh(entry)
+
+    cache.ttl = 1000
+    cache.refresh('key')
+    assert cache.is_fresh(cache.load('key'))
+
+
+def test_evict(tmp_path):
+
+    cache = VizierCache(str(tmp_path))
+
+    for key in 'abc':
+        cache.store(key, Data(x=np.arange(1000.)))
+    os.utime(os.path.join(str(tmp_path), 'a', 'meta.json'), (0, 0))
+    os.utime(os.path.join(str(tmp_path), 'b', 'meta.json'), (1, 1))
+
+    # Using an entry marks it as recently used
+    cache.load('a')
+
+    # The least recently used entry is removed once the cache is too large
+    cache.max_size = cache.size() - 1
+    cache.store('d', [])
+    assert cache.load('b') is None
+    assert cache.load('a') is not None
+    assert cache.load('c') is not None
+
+    cache.clear()
+    assert cache.size() == 0
@@ -0,0 +1,366 @@
+import time
+import hashlib
+import threading
+from io import BytesIO
+from urllib.parse import parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+import pytest
+import requests
+from astropy.table import Table
+
+from .. import vizier_helpers
+from ..vizier_cache import VizierCache, set_cache
+from ..vizier_helpers import (query_vizier, iter_query_vizier, fetch_vizier_catalog,
+                              fetch_vizier_catalogs, Cancellation, FetchCancelled,
+                              CatalogOptions, parse_constraints)
+
+
+def make_votable(n_rows, tabledata_format='tabledata'):
+    table = Table()
+    table['ra'] = np.linspace(0, 10, n_rows)
+    table['dec'] = np.linspace(-5, 5, n_rows)
+    content = BytesIO()
+    table.write(content, format='votable', tabledata_format=tabledata_format)
+    return content.getvalue()
+
+
+def make_search_votable(n_sets, n_tables):
+    resources = []
+    for i in range(n_sets):
+        tables = ''.join('<TABLE name="J/test/{0}/{1}" nrows="{2}">'
+                         '<DESCRIPTION>Table {1}</DESCRIPTION>'
+                         '<FIELD name="x" datatype="double"/></TABLE>'.format(i, j, 10 * j)
+                         for j in range(n_tables))
+        resources.append('<RESOURCE name="J/test/{0}"><DESCRIPTION> Set {0} </DESCRIPTION>'
+                         '{1}<RESOURCE><TABLE name="nested"/></RESOURCE></RESOURCE>'
+                         .format(i, tables))
+    return ('<?xml version="1.0"?>'
+            '<VOTABLE version="1.3" xmlns="http://www.ivoa.net/xml/VOTable/v1.3">'
+            '<INFO name="QUERY_STATUS" value="OK"/>{0}</VOTABLE>'
+            .format(''.join(resources))).encode('utf-8')
+
+
+class VizierHandler(BaseHTTPRequestHandler):
+
+    # Catalogs served, as a mapping from name to (content, delay), where the
+    # delay (in seconds) is applied after sending the first half of the content
+    catalogs = {}
+
+    # Search results served, as a mapping from the words searched for to
+    # (content, delay)
+    searches = {}
+
+    # Paths and parameters of the requests received
+    paths = []
+    params = []
+
+    @staticmethod
+    def select(table, params):
+        # Emulate the VizieR column and row selection for tables
+        table = table.copy()
+        table['recno'] = np.arange(1, len(table) + 1)
+        if 'recno' in params:
+            start, stop = map(int, params['recno'][0].split('..'))
+            table = table[(table['recno'] >= start) & (table['recno'] <= stop)]
+        if 'x' in params:
+            table = table[table['x'] < float(params['x'][0].lstrip('<'))]
+        if '-out.max' in params:
+            table = table[:int(params['-out.max'][0])]
+        if '-out' in params:
+            table = table[params['-out'][0].split(',')]
+        content = BytesIO()
+        table.write(content, format='votable')
+        return content.getvalue()
+
+    def do_POST(self):
+        self.paths.append(self.path)
+        length = int(self.headers['Content-Length'])
+        params = parse_qs(self.rfile.read(length).decode('ascii'))
+        self.params.append(params)
+        if '-words' in params:
+            content, delay = self.searches[' '.join(params['-words'])]
+        else:
+            content, delay = self.catalogs[params['-source'][0]]
+        if isinstance(content, Table):
+            content = self.select(content, params)
+        etag = '"{0}"'.format(hashlib.md5(content).hexdigest())
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/xml')
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        try:
+            self.wfile.write(content[:len(content) // 2])
+            self.wfile.flush()
+            time.sleep(delay)
+            self.wfile.write(content[len(content) // 2:])
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def vizier_cache(tmp_path):
+    cache = VizierCache(str(tmp_path))
+    set_cache(cache)
+    yield cache
+    set_cache(None)
+
+
+@pytest.fixture
+def vizier_server(monkeypatch, vizier_cache):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), VizierHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    monkeypatch.setattr(vizier_helpers, 'VIZIER_URL',
+                        'http://127.0.0.1:{0}/viz-bin/votable'.format(server.server_port))
+    yield VizierHandler.catalogs
+    server.shutdown()
+    server.server_close()
+    VizierHandler.catalogs.clear()
+    VizierHandler.searches.clear()
+    del VizierHandler.paths[:]
+    del VizierHandler.params[:]
+
+
+def test_query(vizier_server):
+
+    VizierHandler.searches['galaxy survey'] = make_search_votable(3, 2), 0
+
+    results = query_vizier('galaxy survey')
+
+    descriptions = [catalog_set['description'] for catalog_set in results]
+    assert descriptions == ['Set 0', 'Set 1', 'Set 2']
+    assert results[1]['tables'] == [{'description': 'Table 0', 'nrows': '0',
+                                     'name': 'J/test/1/0'},
+                                    {'description': 'Table 1', 'nrows': '10',
+                                     'name': 'J/test/1/1'}]
+
+    # Results are cached
+    assert list(iter_query_vizier('galaxy survey')) == results
+    assert len(VizierHandler.params) == 1
+
+
+def test_query_cancel(vizier_server):
+
+    VizierHandler.searches['galaxy'] = make_search_votable(1000, 2), 10
+
+    cancellation = Cancellation()
+
+    start = time.time()
+    with pytest.raises(FetchCancelled):
+        for catalog_set in iter_query_vizier('galaxy', cancellation=cancellation):
+            cancellation.cancel()
+    assert time.time() - start < 5
+
+
+def test_fetch_catalog(vizier_server):
+
+    vizier_server['J/test/1'] = make_votable(100), 0
+
+    received = []
+    data = fetch_vizier_catalog('J/test/1', progress=lambda n, total: received.append((n, total)))
+
+    assert data.label == 'J/test/1'
+    np.testing.assert_allclose(data['ra'], np.linspace(0, 10, 100))
+
+    total = len(vizier_server['J/test/1'][0])
+    assert received[-1] == (total, total)
+
+
+def test_fetch_catalog_spooled(vizier_server, monkeypatch):
+
+    # Large catalogs are written to disk while downloading
+    monkeypatch.setattr(vizier_helpers, 'SPOOL_SIZE', 1024)
+
+    vizier_server['J/test/1'] = make_votable(1000), 0
+
+    data = fetch_vizier_catalog('J/test/1')
+
+    np.testing.assert_allclose(data['dec'], np.linspace(-5, 5, 1000))
+
+
+def test_fetch_catalog_binary2(vizier_server):
+
+    vizier_server['J/test/1'] = make_votable(100, tabledata_format='binary2'), 0
+
+    data = fetch_vizier_catalog('J/test/1', binary2=True)
+
+    assert VizierHandler.paths == ['/viz-bin/votable' + vizier_helpers.BINARY2_PATH]
+    np.testing.assert_allclose(data['ra'], np.linspace(0, 10, 100))
+
+
+def test_fetch_catalog_cache(vizier_server, vizier_cache):
+
+    vizier_server['J/test/1'] = make_votable(100), 0
+
+    fetch_vizier_catalog('J/test/1')
+    assert len(VizierHandler.paths) == 1
+
+    # Fresh catalogs are loaded from the cache
+    received = []
+    data = fetch_vizier_catalog('J/test/1', progress=lambda n, total: received.append((n, total)))
+    assert len(VizierHandler.paths) == 1
+    assert received == [(0, 0)]
+    assert data.label == 'J/test/1'
+    np.testing.assert_allclose(data['ra'], np.linspace(0, 10, 100))
+
+    # Stale catalogs are revalidated, and not downloaded again if unchanged
+    vizier_cache.ttl = 0
+    data = fetch_vizier_catalog('J/test/1')
+    assert len(VizierHandler.paths) == 2
+    np.testing.assert_allclose(data['ra'], np.linspace(0, 10, 100))
+
+    # Changed catalogs are downloaded again
+    vizier_server['J/test/1'] = make_votable(10), 0
+    data = fetch_vizier_catalog('J/test/1')
+    assert data.size == 10
+
+    # Caching can be disabled
+    data = fetch_vizier_catalog('J/test/1', use_cache=False)
+    assert len(VizierHandler.paths) == 4
+
+
+def test_fetch_catalog_offline(vizier_server, vizier_cache, monkeypatch):
+
+    vizier_server['J/test/1'] = make_votable(100), 0
+
+    fetch_vizier_catalog('J/test/1')
+
+    def post(*args, **kwargs):
+        raise requests.ConnectionError()
+
+    monkeypatch.setattr(vizier_helpers.get_session(), 'post', post)
+
+    # Stale catalogs are used if VizieR cannot be reached
+    vizier_cache.ttl = 0
+    data = fetch_vizier_catalog('J/test/1')
+    np.testing.assert_allclose(data['ra'], np.linspace(0, 10, 100))
+
+    with pytest.raises(requests.ConnectionError):
+        fetch_vizier_catalog('J/test/2')
+
+
+def test_catalog_options():
+
+    assert CatalogOptions().params() == {}
+
+    options = CatalogOptions(columns=['ra', 'dec'], max_rows='unlimited', center='M31',
+                             radius=5, constraints={'Vmag': '<10'})
+    assert options.params() == {'-out': 'ra,dec', '-out.max': 'unlimited', '-c': 'M31',
+                                '-c.rm': 5, 'Vmag': '<10'}
+
+
+def test_parse_constraints():
+
+    assert parse_constraints('') == {}
+    assert parse_constraints('Vmag=<10; B-V = >0.5;') == {'Vmag': '<10', 'B-V': '>0.5'}
+
+    with pytest.raises(ValueError, match='Invalid constraint: Vmag'):
+        parse_constraints('Vmag')
+
+
+def test_fetch_catalog_options(vizier_server):
+
+    table = Table()
+    table['x'] = np.arange(100.)
+    table['y'] = np.arange(100.) * 2
+    vizier_server['J/test/1'] = table, 0
+
+    options = CatalogOptions(columns=['y'], max_rows=10)
+    data = fetch_vizier_catalog('J/test/1', options=options)
+
+    assert [cid.label for cid in data.main_components] == ['y']
+    np.testing.assert_allclose(data['y'], np.arange(10.) * 2)
+
+
+@pytest.mark.parametrize('n_rows', [None, 100])
+def test_fetch_catalog_batches(vizier_server, n_rows):
+
+    table = Table()
+    table['x'] = np.arange(100.)
+    vizier_server['J/test/1'] = table, 0
+
+    received = []
+    options = CatalogOptions(batch_size=30)
+    data = fetch_vizier_catalog('J/test/1', options=options, n_rows=n_rows,
+                                progress=lambda n, total: received.append((n, total)))
+
+    assert data.label == 'J/test/1'
+    np.testing.assert_allclose(data['x'], np.arange(100.))
+    assert [params['recno'][0] for params in VizierHandler.params] == ['1..30', '31..60',
+                                                                       '61..90', '91..120']
+
+    # The progress is the total received for all batches
+    assert [n for n, total in received] == sorted(n for n, total in received)
+    assert all(total is None for n, total in received)
+
+    # Batches are limited by the maximum number of rows
+    options = CatalogOptions(batch_size=30, max_rows=45)
+    data = fetch_vizier_catalog('J/test/1', options=options, n_rows=n_rows)
+    np.testing.assert_allclose(data['x'], np.arange(45.))
+
+
+def test_fetch_catalog_batches_constraints(vizier_server):
+
+    # With constraints, batches can have fewer rows even if they are not the
+    # last, so the number of rows should be given.
+    table = Table()
+    table['x'] = np.arange(100.)
+    vizier_server['J/test/1'] = table, 0
+
+    options = CatalogOptions(batch_size=30, constraints={'x': '<20'})
+    data = fetch_vizier_catalog('J/test/1', options=options, n_rows=100)
+
+    np.testing.assert_allclose(data['x'], np.arange(20.))
+
+
+def test_fetch_catalogs_parallel(vizier_server):
+
+    names = ['J/test/{0}'.format(i) for i in range(4)]
+    for i, name in enumerate(names):
+        vizier_server[name] = make_votable(10 + i), 0.5
+
+    received = []
+
+    start = time.time()
+    datasets = fetch_vizier_catalogs(names, progress=lambda n, total: received.append((n, total)))
+    elapsed = time.time() - start
+
+    # The catalogs should be downloaded at the same time
+    assert elapsed < 1.5
+
+    assert [data.label for data in datasets] == names
+    assert [data.size for data in datasets] == [10, 11, 12, 13]
+
+    total = sum(len(content) for content, delay in vizier_server.values())
+    assert received[-1] == (total, total)
+
+
+def test_fetch_catalogs_cancel(vizier_server):
+
+    vizier_server['J/test/slow'] = make_votable(1000), 10
+    vizier_server['J/test/fast'] = make_votable(10), 0
+
+    cancellation = Cancellation()
+
+    def progress(n_bytes, total):
+        # Cancel once the fast catalog has been received, while the slow
+        # catalog is still being downloaded
+        if n_bytes >= len(vizier_server['J/test/fast'][0]):
+            cancellation.cancel()
+
+    start = time.time()
+    with pytest.raises(FetchCancelled):
+        fetch_vizier_catalogs(['J/test/slow', 'J/test/fast'], progress=progress,
+                              cancellation=cancellation)
+    assert time.time() - start < 5
@@ -0,0 +1,241 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+from glue.config import CFG_DIR
+from glue.core.data import Component, Data
+
+__all__ = ['CacheEntry', 'VizierCache', 'get_cache', 'set_cache']
+
+CACHE_DIR = os.path.join(CFG_DIR, 'vizier_cache')  # default location of the cache
+CACHE_SIZE = 2 * 1024 ** 3  # default maximum size of the cache, in bytes
+CACHE_TTL = 7 * 24 * 3600  # default time after which entries are revalidated, in seconds
+
+META_FILE = 'meta.json'
+
+# A cached value, with the time at which it was downloaded (or last
+# revalidated) and the validators returned by the server.
+CacheEntry = namedtuple('CacheEntry', ['value', 'fetched', 'etag', 'last_modified'])
+
+
+class VizierCache(object):
+    """
+    A persistent cache for the results of VizieR queries and for catalogs.
+
+    Each entry is stored in its own directory. Catalogs are stored as one
+    ``.npy`` file per column, which is much faster to load than re-parsing a
+    VOTable, and query results are stored as JSON. Entries older than
+    ``ttl`` should be revalidated with the server before being used, and the
+    least recently used entries are removed once the cache exceeds
+    ``max_size``.
+
+    Parameters
+    ----------
+    directory : str, optional
+        The directory in which to store the cache.
+    max_size : int, optional
+        The maximum size of the cache, in bytes.
+    ttl : float, optional
+        The time after which entries should be revalidated, in seconds.
+    """
+
+    def __init__(self, directory=CACHE_DIR, max_size=CACHE_SIZE, ttl=CACHE_TTL):
+        self.directory = directory
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(url, params):
+        """
+        Return the cache key for a request to ``url`` with the POST
+        parameters ``params``.
+        """
+        request = json.dumps([url, sorted(params.items())])
+        return hashlib.sha256(request.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def load(self, key):
+        """
+        Return the :class:`CacheEntry` for a key, or `None` if it is not in
+        the cache.
+        """
+
+        path = self._path(key)
+
+        try:
+            with open(os.path.join(path, META_FILE)) as f:
+                meta = json.load(f)
+            if meta['kind'] == 'data':
+                value = Data(label=meta['label'])
+                for index, (name, units) in enumerate(meta['columns']):
+                    values = np.load(os.path.join(path, '{0}.npy'.format(index)),
+                                     allow_pickle=False)
+                    value.add_component(Component.autotyped(values, units=units), name)
+            else:
+                value = meta['value']
+            # Keep track of when entries were last used for the eviction
+            os.utime(os.path.join(path, META_FILE))
+        except (OSError, ValueError, KeyError):
+            # The entry does not exist, or is being removed or is corrupt
+            return None
+
+        return CacheEntry(value, meta['fetched'], meta['etag'], meta['last_modified'])
+
+    def store(self, key, value, etag=None, last_modified=None):
+        """
+        Add a value to the cache.
+
+        Parameters
+        ----------
+        key : str
+            The key, as returned by :meth:`key`.
+        value : :class:`~glue.core.data.Data` or object
+            The value to store, which should be a glue dataset with 1D
+            components or an object that can be serialized to JSON.
+        etag, last_modified : str, optional
+            The ``ETag`` and ``Last-Modified`` headers returned by the server,
+            which are used to revalidate the entry.
+        """
+
+        meta = {'fetched': time.time(), 'etag': etag, 'last_modified': last_modified}
+
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory, exist_ok=True)
+
+        # The entry is written to a temporary directory and then renamed, so
+        # that entries being written are never loaded.
+        tmp_path = tempfile.mkdtemp(dir=self.directory, prefix='.tmp')
+
+        try:
+            if isinstance(value, Data):
+                meta['kind'] = 'data'
+                meta['label'] = value.label
+                meta['columns'] = []
+                for index, cid in enumerate(value.main_components):
+                    component = value.get_component(cid)
+                    if component.categorical:
+                        values = np.asarray(component.labels, dtype=str)
+                    else:
+                        values = np.asarray(component.data)
+                    np.save(os.path.join(tmp_path, '{0}.npy'.format(index)), values,
+                            allow_pickle=False)
+                    meta['columns'].append((cid.label, component.units))
+            else:
+                meta['kind'] = 'json'
+                meta['value'] = value
+            with open(os.path.join(tmp_path, META_FILE), 'w') as f:
+                json.dump(meta, f)
+            with self._lock:
+                shutil.rmtree(self._path(key), ignore_errors=True)
+                os.replace(tmp_path, self._path(key))
+        except BaseException:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+
+        self._evict()
+
+    def refresh(self, key):
+        """
+        Mark an entry as fresh, after the server has confirmed that it has
+        not changed.
+        """
+        filename = os.path.join(self._path(key), META_FILE)
+        try:
+            with open(filename) as f:
+                meta = json.load(f)
+            meta['fetched'] = time.time()
+            with open(filename, 'w') as f:
+                json.dump(meta, f)
+        except (OSError, ValueError):
+            pass
+
+    def is_fresh(self, entry):
+        """
+        Whether an entry can be used without revalidating it.
+        """
+        return self.ttl is None or time.time() - entry.fetched < self.ttl
+
+    def size(self):
+        """
+        The total size of the cache, in bytes.
+        """
+        return sum(size for key, used, size in self._entries())
+
+    def clear(self):
+        """
+        Remove all entries from the cache.
+        """
+        with self._lock:
+            for key, used, size in self._entries():
+                shutil.rmtree(self._path(key), ignore_errors=True)
+
+    def _entries(self):
+        # Return (key, last used, size) for all the entries in the cache
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for key in os.listdir(self.directory):
+            path = self._path(key)
+            if key.startswith('.') or not os.path.isdir(path):
+                continue
+            try:
+                used = os.path.getmtime(os.path.join(path, META_FILE))
+                size = sum(os.path.getsize(os.path.join(path, filename))
+                           for filename in os.listdir(path))
+            except OSError:
+                continue
+            entries.append((key, used, size))
+        return entries
+
+    def _evict(self):
+        # Remove the least recently used entries until the cache fits
+        with self._lock:
+            entries = sorted(self._entries(), key=lambda entry: entry[1])
+            total = sum(size for key, used, size in entries)
+            for key, used, size in entries:
+                if total <= self.max_size:
+                    break
+                shutil.rmtree(self._path(key), ignore_errors=True)
+                total -= size
+
+
+# The shared cache, which is created when first needed, or False if caching
+# has been disabled
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """
+    Return the cache used for VizieR requests, or `None` if caching is
+    disabled.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = VizierCache()
+        return None if _cache is False else _cache
+
+
+def set_cache(cache):
+    """
+    Set the cache used for VizieR requests.
+
+    Parameters
+    ----------
+    cache : :class:`VizierCache` or `None`
+        The cache, or `None` to disable caching.
+    """
+    global _cache
+    with _cache_lock:
+        _cache = False if cache is None else cache
@@ -1,38 +1,591 @@
-from io import BytesIO
+import itertools
+import threading
+from tempfile import SpooledTemporaryFile
+from concurrent.futures import ThreadPoolExecutor
+from xml.etree import ElementTree
 
+import numpy as np
 import requests
-from astropy.io.votable import parse
+from glue.core.data import Component, Data
 from glue.core.data_factories import astropy_tabular_data
+from glue.logger import logger
 
+from .vizier_cache import get_cache
 
-def query_vizier(query_text):
+VIZIER_URL = "http://vizier.u-strasbg.fr/viz-bin/votable"  # VizieR VOTable service
+MAX_WORKERS = 4  # maximum number of catalogs downloaded at the same time
+CHUNK_SIZE = 65536  # size of the chunks in which catalogs are downloaded, in bytes
+TIMEOUT = (10, 60)  # connect and read timeouts for requests, in seconds
+SPOOL_SIZE = 16 * 1024 ** 2  # downloads larger than this are written to disk, in bytes
+BINARY2_PATH = '/-b2'  # path appended to VIZIER_URL to request BINARY2 VOTables
+DEFAULT_RADIUS = 10.  # default radius of cone searches, in arcminutes
 
-    # Do the search using VizieR
-    r = requests.post("http://vizier.u-strasbg.fr/viz-bin/votable",
-                      {'-words': query_text.split(), '-meta.all': 1})
-
-    # We now loop over the results and construct a list of dictionaries, where
-    # each dictionary contains information about one set of tables.
-    votablefile = parse(BytesIO(r.content))
-    result = []
-    for resource in votablefile.resources:
-        catalog_set = {}
-        catalog_set['description'] = resource.description
-        catalog_set['tables'] = []
-        for table in resource.tables:
+_session = None
+_session_lock = threading.Lock()
+
+
+class FetchCancelled(Exception):
+    """
+    Raised when downloading a catalog is cancelled.
+    """
+
+
+def _abort(response):
+    # Closing a response does not interrupt reads blocked in other threads,
+    # but shutting down the socket does (this requires urllib3 2.3 or later).
+    shutdown = getattr(response.raw, 'shutdown', None)
+    if shutdown is not None:
+        try:
+            shutdown()
+        except (ValueError, RuntimeError):
+            pass
+    response.close()
+
+
+class Cancellation(object):
+    """
+    Flag used to cancel catalog downloads from another thread.
+
+    Cancelling also closes the connections for any downloads still in
+    progress, so that they stop without waiting for more data to arrive.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._responses = set()
+
+    @property
+    def cancelled(self):
+        """
+        Whether the downloads have been cancelled.
+        """
+        return self._event.is_set()
+
+    def cancel(self):
+        """
+        Cancel the downloads.
+        """
+        with self._lock:
+            self._event.set()
+            responses = list(self._responses)
+        for response in responses:
+            _abort(response)
+
+    def _register(self, response):
+        with self._lock:
+            if self._event.is_set():
+                _abort(response)
+                raise FetchCancelled()
+            self._responses.add(response)
+
+    def _unregister(self, response):
+        with self._lock:
+            self._responses.discard(response)
+
+
+def get_session():
+    """
+    Return the HTTP session shared by all requests to VizieR, so that
+    connections can be re-used.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1,
+                                                    pool_maxsize=MAX_WORKERS)
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+        return _session
+
+
+def _cache_lookup(url, params, use_cache):
+    # Return the cache, the key for the request, and the cached entry (if any)
+    cache = get_cache() if use_cache else None
+    if cache is None:
+        return None, None, None
+    key = cache.key(url, params)
+    return cache, key, cache.load(key)
+
+
+def _conditional_headers(entry):
+    # Headers used to check whether a cached entry is still up to date
+    headers = {}
+    if entry is not None:
+        if entry.etag is not None:
+            headers['If-None-Match'] = entry.etag
+        if entry.last_modified is not None:
+            headers['If-Modified-Since'] = entry.last_modified
+    return headers
+
+
+def _cache_store(cache, key, value, response):
+    # Failing to write to the cache should not prevent the import
+    if cache is None:
+        return
+    try:
+        cache.store(key, value, etag=response.headers.get('ETag'),
+                    last_modified=response.headers.get('Last-Modified'))
+    except OSError as exc:
+        logger.warning("Could not write to the VizieR cache: {0}".format(exc))
+
+
+def _tag(element):
+    # Return the tag of an element without the namespace
+    return element.tag.rpartition('}')[2]
+
+
+def _description(element):
+    # Return the text of the DESCRIPTION child of a VOTable element
+    for child in element:
+        if _tag(child) == 'DESCRIPTION':
+            return (child.text or '').strip()
+    return ''
+
+
+def _parse_resource(element):
+    # Construct a dictionary with information about the set of tables in a
+    # RESOURCE element of the search results.
+    catalog_set = {}
+    catalog_set['description'] = _description(element)
+    catalog_set['tables'] = []
+    for child in element:
+        if _tag(child) == 'TABLE':
             catalog = {}
-            catalog['description'] = table.description
-            catalog['nrows'] = str(table.nrows)
-            catalog['name'] = str(table.name)
+            catalog['description'] = _description(child)
+            catalog['nrows'] = child.get('nrows', '')
+            catalog['name'] = child.get('name', '')
             catalog_set['tables'].append(catalog)
-        result.append(catalog_set)
+    return catalog_set
+
+
+def iter_query_vizier(query_text, use_cache=True, cancellation=None):
+    """
+    Search VizieR for catalogs, yielding the results as they are received.
+
+    Parameters
+    ----------
+    query_text : str
+        The words to search for.
+    use_cache : bool, optional
+        Whether to use the cache.
+    cancellation : :class:`Cancellation`, optional
+        If specified, this can be used to cancel the search from another
+        thread, in which case :class:`FetchCancelled` is raised.
+
+    Yields
+    ------
+    catalog_set : dict
+        Information about one set of tables, with a ``description`` and a
+        list of ``tables``, each of which is a dictionary with a
+        ``description``, a ``name``, and a number of rows ``nrows``.
+    """
+
+    params = {'-words': query_text.split(), '-meta.all': 1}
+
+    cache, key, entry = _cache_lookup(VIZIER_URL, params, use_cache)
+    if entry is not None and cache.is_fresh(entry):
+        yield from entry.value
+        return
+
+    # Do the search using VizieR
+    try:
+        r = get_session().post(VIZIER_URL, params, headers=_conditional_headers(entry),
+                               stream=True, timeout=TIMEOUT)
+    except (requests.ConnectionError, requests.Timeout):
+        # Use the cached results if VizieR cannot be reached
+        if entry is None:
+            raise
+        yield from entry.value
+        return
+
+    if cancellation is not None:
+        cancellation._register(r)
+
+    try:
+
+        if entry is not None and r.status_code == 304:
+            cache.refresh(key)
+            yield from entry.value
+            return
+
+        r.raise_for_status()
+        r.raw.decode_content = True
+
+        # The results are parsed as they are received, and each top-level
+        # RESOURCE element is discarded once it has been parsed.
+        result = []
+        depth = 0
+        for event, element in ElementTree.iterparse(r.raw, events=('start', 'end')):
+            if cancellation is not None and cancellation.cancelled:
+                raise FetchCancelled()
+            if _tag(element) != 'RESOURCE':
+                continue
+            if event == 'start':
+                depth += 1
+                continue
+            depth -= 1
+            if depth == 0:
+                catalog_set = _parse_resource(element)
+                element.clear()
+                result.append(catalog_set)
+                yield catalog_set
+
+    except Exception:
+        # Closing the connection from another thread can cause various errors
+        if cancellation is not None and cancellation.cancelled:
+            raise FetchCancelled()
+        raise
+    finally:
+        if cancellation is not None:
+            cancellation._unregister(r)
+        r.close()
+
+    _cache_store(cache, key, result, r)
+
+
+def query_vizier(query_text, use_cache=True):
+    """
+    Search VizieR for catalogs.
+
+    This returns the results of :func:`iter_query_vizier` as a list.
+    """
+    return list(iter_query_vizier(query_text, use_cache=use_cache))
+
+
+class CatalogOptions(object):
+    """
+    Options to restrict the columns and rows fetched from VizieR catalogs.
+
+    Parameters
+    ----------
+    columns : list of str, optional
+        The names of the columns to fetch. By default, the default columns
+        of the catalog are fetched.
+    max_rows : int or str, optional
+        The maximum number of rows to fetch, or ``'unlimited'``. By default,
+        the VizieR default limit applies.
+    center : str, optional
+        The position (e.g. ``'10.68 +41.27'``) or name of an object (e.g.
+        ``'M31'``) around which to carry out a cone search.
+    radius : float, optional
+        The radius of the cone search, in arcminutes.
+    constraints : dict, optional
+        Constraints on the rows to fetch, as a mapping from column names to
+        VizieR constraints, for example ``{'Vmag': '<10'}``.
+    batch_size : int, optional
+        If specified, the catalogs are fetched in batches of rows with
+        consecutive record numbers, which are then combined into one
+        dataset.
+    """
+
+    def __init__(self, columns=None, max_rows=None, center=None, radius=DEFAULT_RADIUS,
+                 constraints=None, batch_size=None):
+        self.columns = columns
+        self.max_rows = max_rows
+        self.center = center
+        self.radius = radius
+        self.constraints = constraints
+        self.batch_size = batch_size
+
+    def params(self):
+        """
+        Return the VizieR parameters for these options, excluding the
+        batches.
+        """
+        params = {}
+        if self.columns:
+            params['-out'] = ','.join(self.columns)
+        if self.max_rows is not None:
+            params['-out.max'] = self.max_rows
+        if self.center:
+            params['-c'] = self.center
+            params['-c.rm'] = self.radius
+        if self.constraints:
+            params.update(self.constraints)
+        return params
 
+
+def parse_constraints(text):
+    """
+    Parse constraints given as text, for example ``'Vmag=<10; B-V=>0.5'``.
+
+    Parameters
+    ----------
+    text : str
+        Semicolon-separated constraints, each of which is a column name, an
+        equal sign, and a VizieR constraint.
+
+    Returns
+    -------
+    constraints : dict
+        The constraints, as a mapping from column name to constraint.
+    """
+    constraints = {}
+    for item in text.split(';'):
+        if not item.strip():
+            continue
+        name, sep, constraint = item.partition('=')
+        if not sep or not name.strip() or not constraint.strip():
+            raise ValueError("Invalid constraint: {0}".format(item.strip()))
+        constraints[name.strip()] = constraint.strip()
+    return constraints
+
+
+def _concatenate(datasets, label, max_rows=None):
+    # Combine datasets with the same components along their only dimension
+    result = Data(label=label)
+    for cid in datasets[0].main_components:
+        component = datasets[0].get_component(cid)
+        values = np.concatenate([data[cid.label] for data in datasets])[:max_rows]
+        result.add_component(Component.autotyped(values, units=component.units), cid.label)
     return result
 
 
-def fetch_vizier_catalog(catalog_name):
-    r = requests.post("http://vizier.u-strasbg.fr/viz-bin/votable",
-                      {'-source': catalog_name})
-    table = astropy_tabular_data(BytesIO(r.content), format='votable')
-    table.label = catalog_name
+def fetch_vizier_catalog(catalog_name, progress=None, cancellation=None, binary2=False,
+                         use_cache=True, options=None, n_rows=None):
+    """
+    Download a catalog from VizieR.
+
+    The catalog is downloaded in chunks to a temporary file (which is only
+    kept in memory for small catalogs) and then parsed from that file, so
+    that the raw VOTable is never held in memory in full.
+
+    Catalogs are stored in the cache returned by
+    :func:`~glue_exp.importers.vizier.vizier_cache.get_cache`, and cached
+    catalogs are used instead of downloading them again as long as they are
+    up to date, or if VizieR cannot be reached.
+
+    Parameters
+    ----------
+    catalog_name : str
+        The name of the catalog.
+    progress : callable, optional
+        A function called as data is received, with the number of bytes
+        received so far and the total number of bytes expected (or `None` if
+        this is not known).
+    cancellation : :class:`Cancellation`, optional
+        If specified, this can be used to cancel the download from another
+        thread, in which case :class:`FetchCancelled` is raised.
+    binary2 : bool, optional
+        Whether to request the BINARY2 VOTable serialization, which is more
+        compact and much faster to parse than the default XML serialization.
+    use_cache : bool, optional
+        Whether to use the cache.
+    options : :class:`CatalogOptions`, optional
+        Options to restrict the columns and rows fetched.
+    n_rows : int, optional
+        The number of rows in the catalog, used to know when to stop fetching
+        batches of rows. If not specified, fetching stops at the first batch
+        with fewer rows than requested, so this should be specified if
+        constraints are used to select rows.
+
+    Returns
+    -------
+    data : :class:`~glue.core.data.Data`
+        The catalog.
+    """
+
+    url = VIZIER_URL + BINARY2_PATH if binary2 else VIZIER_URL
+    params = {'-source': catalog_name}
+
+    if options is not None:
+        params.update(options.params())
+
+    if options is None or not options.batch_size:
+        return _fetch_table(url, params, catalog_name, progress=progress,
+                            cancellation=cancellation, use_cache=use_cache)
+
+    batch_size = options.batch_size
+    max_rows = options.max_rows if isinstance(options.max_rows, int) else None
+    params['-out.max'] = batch_size
+
+    batches = []
+    n_fetched = 0
+    received = [0, 0]
+
+    def batch_progress(n_bytes, total):
+        received[1] = n_bytes
+        progress(received[0] + n_bytes, None)
+
+    # Batches are selected using ranges of record numbers, which VizieR
+    # assigns to the rows of each catalog.
+    for start in itertools.count(1, batch_size):
+
+        if n_rows is not None and start > n_rows:
+            break
+
+        params['recno'] = '{0}..{1}'.format(start, start + batch_size - 1)
+
+        data = _fetch_table(url, params, catalog_name, cancellation=cancellation,
+                            progress=None if progress is None else batch_progress,
+                            use_cache=use_cache)
+        received[0] += received[1]
+
+        if data.size > 0:
+            batches.append(data)
+            n_fetched += data.size
+
+        if max_rows is not None and n_fetched >= max_rows:
+            break
+
+        if n_rows is None and data.size < batch_size:
+            break
+
+    if not batches:
+        return data
+
+    return _concatenate(batches, catalog_name, max_rows=max_rows)
+
+
+def _fetch_table(url, params, label, progress=None, cancellation=None, use_cache=True):
+
+    cache, key, entry = _cache_lookup(url, params, use_cache)
+
+    def cached():
+        entry.value.label = label
+        if progress is not None:
+            progress(0, 0)
+        return entry.value
+
+    if entry is not None and cache.is_fresh(entry):
+        return cached()
+
+    try:
+        r = get_session().post(url, params, headers=_conditional_headers(entry),
+                               stream=True, timeout=TIMEOUT)
+    except (requests.ConnectionError, requests.Timeout):
+        # Use the cached catalog if VizieR cannot be reached
+        if entry is None:
+            raise
+        return cached()
+
+    if cancellation is not None:
+        cancellation._register(r)
+
+    if entry is not None and r.status_code == 304:
+        if cancellation is not None:
+            cancellation._unregister(r)
+        r.close()
+        cache.refresh(key)
+        return cached()
+
+    try:
+        r.raise_for_status()
+        total = r.headers.get('Content-Length')
+        total = None if total is None else int(total)
+        content = SpooledTemporaryFile(max_size=SPOOL_SIZE)
+        try:
+            for chunk in r.iter_content(CHUNK_SIZE):
+                if cancellation is not None and cancellation.cancelled:
+                    raise FetchCancelled()
+                content.write(chunk)
+                if progress is not None:
+                    progress(content.tell(), total)
+            # Closing the connection can also cause the download to end early
+            # without an error
+            if cancellation is not None and cancellation.cancelled:
+                raise FetchCancelled()
+        except BaseException:
+            content.close()
+            raise
+    except Exception:
+        # Closing the connection from another thread can cause various errors
+        if cancellation is not None and cancellation.cancelled:
+            raise FetchCancelled()
+        raise
+    finally:
+        if cancellation is not None:
+            cancellation._unregister(r)
+        r.close()
+
+    # The VOTable parser reads the file incrementally, so only the parsed
+    # table and the resulting components are held in memory.
+    with content:
+        content.seek(0)
+        table = astropy_tabular_data(content, format='votable')
+
+    table.label = label
+
+    _cache_store(cache, key, table, r)
+
     return table
+
+
+def fetch_vizier_catalogs(catalog_names, progress=None, cancellation=None,
+                          max_workers=MAX_WORKERS, binary2=False, use_cache=True,
+                          options=None, n_rows=None):
+    """
+    Download several catalogs from VizieR at the same time.
+
+    Parameters
+    ----------
+    catalog_names : list of str
+        The names of the catalogs.
+    progress : callable, optional
+        A function called as data is received, with the total number of bytes
+        received so far for all catalogs and the total number of bytes
+        expected (or `None` if this is not known for all catalogs). This may
+        be called from several threads.
+    cancellation : :class:`Cancellation`, optional
+        If specified, this can be used to cancel the downloads from another
+        thread, in which case :class:`FetchCancelled` is raised.
+    max_workers : int, optional
+        The maximum number of catalogs to download at the same time.
+    binary2 : bool, optional
+        Whether to request the BINARY2 VOTable serialization.
+    use_cache : bool, optional
+        Whether to use the cache.
+    options : :class:`CatalogOptions`, optional
+        Options to restrict the columns and rows fetched, for all catalogs.
+    n_rows : dict, optional
+        The number of rows in each catalog, as a mapping from name to number
+        of rows, used when fetching catalogs in batches.
+
+    Returns
+    -------
+    datasets : list of :class:`~glue.core.data.Data`
+        The catalogs, in the same order as ``catalog_names``.
+    """
+
+    if cancellation is None:
+        cancellation = Cancellation()
+
+    lock = threading.Lock()
+    received = {}
+    totals = {}
+
+    if n_rows is None:
+        n_rows = {}
+
+    def fetch(index, name):
+
+        kwargs = dict(cancellation=cancellation, binary2=binary2, use_cache=use_cache,
+                      options=options, n_rows=n_rows.get(name))
+
+        if progress is None:
+            return fetch_vizier_catalog(name, **kwargs)
+
+        def catalog_progress(n_bytes, total):
+            with lock:
+                received[index] = n_bytes
+                totals[index] = total
+                if len(totals) == len(catalog_names) and None not in totals.values():
+                    total = sum(totals.values())
+                else:
+                    total = None
+                n_bytes = sum(received.values())
+            progress(n_bytes, total)
+
+        return fetch_vizier_catalog(name, progress=catalog_progress, **kwargs)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(fetch, index, name)
+                   for index, name in enumerate(catalog_names)]
+        try:
+            return [future.result() for future in futures]
+        except BaseException:
+            # Stop any other downloads if one fails
+            cancellation.cancel()
+            raise
@@ -3,18 +3,19 @@
 
 def setup():
 
+    from importlib.util import find_spec
     from glue.logger import logger
-    try:
-        import cv2  # noqa
-    except ImportError:
+
+    # OpenCV is slow to import, so we only check that it is installed here
+    if find_spec('cv2') is None:
         logger.info("Could not load webcam importer plugin, since OpenCV is required")
         return
 
     from glue.config import importer
-    from .qt_widget import QtWebcamImporter
 
     @importer("Import from webcam")
     def webcam_importer():
+        from .qt_widget import QtWebcamImporter
         wi = QtWebcamImporter()
         wi.exec_()
         return wi.data
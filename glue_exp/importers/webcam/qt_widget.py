@@ -1,46 +1,116 @@
 import os
+import tempfile
 
-try:
-    from glue.external.qt import QtGui, QtCore
-except ImportError:
-    from qtpy import QtGui, QtCore
+import numpy as np
+from qtpy import QtGui, QtCore, QtWidgets
 
 from glue.utils.qt.helpers import load_ui
 
-from .webcam_helpers import Webcam, frame_to_data
+from .webcam_helpers import Webcam, FrameGrabber, Recorder, CHANNELS, frame_to_data
 
 UI_FILE = os.path.join(os.path.dirname(__file__), 'webcam.ui')
+RECORDING_UPDATE_INTERVAL = 100  # interval between updates of the recording progress, in ms
 
 
-class WebcamView(QtGui.QWidget):
+def frame_to_image(frame):
+    """
+    Return a :class:`~qtpy.QtGui.QImage` for a ``(y, x, 3)`` BGR frame.
 
-    def __init__(self, parent=None):
+    The image shares memory with the frame if possible, so should not be used
+    after the frame is modified.
+    """
+    if hasattr(QtGui.QImage, 'Format_BGR888'):
+        return QtGui.QImage(frame.data, frame.shape[1], frame.shape[0], frame.strides[0],
+                            QtGui.QImage.Format_BGR888)
+    # Qt versions before 5.14 do not support BGR images
+    return QtGui.QImage(frame.data, frame.shape[1], frame.shape[0], frame.strides[0],
+                        QtGui.QImage.Format_RGB888).rgbSwapped()
 
-        super(WebcamView, self).__init__()
+
+class WebcamView(QtWidgets.QWidget):
+    """
+    A live preview of a camera.
+
+    Frames are read on a background thread by a
+    :class:`~glue_exp.importers.webcam.webcam_helpers.FrameGrabber`, and the
+    widget is repainted directly from the most recent frame in its buffer.
+
+    Parameters
+    ----------
+    source : object, optional
+        The camera to show. By default, the first camera found by OpenCV is
+        used.
+    """
+
+    # Emitted from the background thread when a new frame is available
+    _frame_ready = QtCore.Signal()
+
+    def __init__(self, parent=None, source=None):
+
+        super(WebcamView, self).__init__(parent)
 
         self._frozen = False
+        self._snapshot = None
 
-        self._webcam = Webcam()
+        self._webcam = Webcam() if source is None else source
 
-        self._update_image()
+        self._frame_ready.connect(self._on_frame_ready)
 
-        self._timer = QtCore.QTimer(self)
-        self._timer.timeout.connect(self._update_image)
-        self._timer.start(100)
+        self._grabber = FrameGrabber(self._webcam, callback=self._frame_ready.emit)
+        self._grabber.start()
+
+    @property
+    def snapshot(self):
+        """
+        A copy of the frame shown when the preview was frozen, or `None`.
+        """
+        return self._snapshot
 
     def freeze(self):
+        if self._grabber.buffer is None:
+            return
+        with self._grabber.buffer.latest() as frame:
+            if frame is None:
+                return
+            self._snapshot = frame.copy()
         self._frozen = True
+        self.update()
 
     def resume(self):
         self._frozen = False
+        self._snapshot = None
+        self.update()
+
+    def _on_frame_ready(self):
+        if not self._frozen:
+            self.update()
+
+    def stop(self):
+        """
+        Stop reading frames and release the camera.
+        """
+        self._grabber.stop()
+        release = getattr(self._webcam, 'release', None)
+        if release is not None:
+            release()
 
     def paintEvent(self, event):
+        if self._frozen:
+            self._draw_frame(self._snapshot)
+        elif self._grabber.buffer is not None:
+            with self._grabber.buffer.latest() as frame:
+                self._draw_frame(frame)
+
+    def _draw_frame(self, frame):
+
+        if frame is None:
+            return
 
         # We need to preserve aspect ratio. Figure out bounding box for
         # webcam image.
 
-        im_dx = self._image.width()
-        im_dy = self._image.height()
+        im_dx = frame.shape[1]
+        im_dy = frame.shape[0]
         im_ratio = im_dx / float(im_dy)
 
         wi_dx = self.width()
@@ -62,33 +132,43 @@ class WebcamView(QtGui.QWidget):
             height = wi_dx / float(im_ratio)
 
         painter = QtGui.QPainter(self)
-        painter.drawImage(QtCore.QRect(xmin, ymin, width, height), self._image)
+        painter.drawImage(QtCore.QRectF(xmin, ymin, width, height), frame_to_image(frame))
+        painter.end()
 
-    def _update_image(self):
-        if not self._frozen:
-            frame = self._webcam.capture_frame()
-            self._image = QtGui.QImage(frame.tostring(), frame.shape[1],
-                                       frame.shape[0], QtGui.QImage.Format_RGB888).rgbSwapped()
-            self._data = frame_to_data(frame)
-            self.update()
 
+class QtWebcamImporter(QtWidgets.QDialog):
 
-class QtWebcamImporter(QtGui.QDialog):
+    # Recordings larger than this (in bytes) are written to a memory-mapped
+    # temporary file rather than kept in memory. The file is deleted when the
+    # dialog is closed, or when the recording is discarded.
+    memmap_threshold = 512 * 1024 ** 2
 
-    def __init__(self):
+    def __init__(self, source=None):
         super(QtWebcamImporter, self).__init__()
         self.pil_image = None
         self.ui = load_ui(UI_FILE, self)
-        self._webcam_preview = WebcamView()
+        self._webcam_preview = WebcamView(source=source)
         self.image.addWidget(self._webcam_preview)
         self.capture.clicked.connect(self.flip_capture_button)
+        self.record.clicked.connect(self.start_recording)
         self.cancel.clicked.connect(self.reject)
         self.ok.clicked.connect(self.finalize)
         self.ok.setEnabled(False)
         self.capture.setDefault(True)
         self.data = []
+        self._recorder = None
+        self._recording_timer = QtCore.QTimer(self)
+        self._recording_timer.setInterval(RECORDING_UPDATE_INTERVAL)
+        self._recording_timer.timeout.connect(self._update_recording)
+
+    def _close_recording(self):
+        # Any temporary file used by the recording is deleted
+        if self._recorder is not None:
+            self._recorder.close()
+            self._recorder = None
 
     def flip_capture_button(self):
+        self._close_recording()
         if self._webcam_preview._frozen:
             self._webcam_preview.resume()
             self.capture.setText("Capture")
@@ -96,11 +176,73 @@ class QtWebcamImporter(QtGui.QDialog):
             self.ok.setEnabled(False)
         else:
             self._webcam_preview.freeze()
+            if not self._webcam_preview._frozen:
+                # No frame has been received from the camera yet
+                return
             self.capture.setText("Try again")
             self.capture.setDefault(False)
             self.ok.setEnabled(True)
             self.ok.setDefault(True)
 
+    def start_recording(self):
+        """
+        Record the number of frames set in the dialog.
+        """
+
+        grabber = self._webcam_preview._grabber
+        if grabber.buffer is None:
+            # No frame has been received from the camera yet
+            return
+
+        if self._webcam_preview._frozen:
+            self.flip_capture_button()
+
+        n_frames = self.record_frames.value()
+        nbytes = (len(CHANNELS) * n_frames * int(np.prod(grabber.buffer.shape[:2])) *
+                  grabber.buffer.dtype.itemsize)
+        if nbytes > self.memmap_threshold:
+            handle, filename = tempfile.mkstemp(suffix='.npy', prefix='webcam')
+            os.close(handle)
+        else:
+            filename = None
+
+        self._close_recording()
+        self._recorder = Recorder(grabber, n_frames=n_frames, filename=filename, delete=True)
+        self._recorder.start()
+
+        self.capture.setEnabled(False)
+        self.record.setEnabled(False)
+        self.ok.setEnabled(False)
+        self._recording_timer.start()
+        self._update_recording()
+
+    def _update_recording(self):
+
+        recorder = self._recorder
+
+        if recorder.running:
+            self.record.setText("Recording ({0}/{1})"
+                                .format(recorder.recorded, recorder.n_frames))
+            return
+
+        self._recording_timer.stop()
+        self.record.setText("Record again")
+        self.capture.setEnabled(True)
+        self.record.setEnabled(True)
+        self.ok.setEnabled(recorder.recorded > 0)
+        self.ok.setDefault(True)
+
     def finalize(self):
-        self.data = [self._webcam_preview._data]
+        # The dataset is only built from the frames that were captured
+        if self._recorder is not None:
+            self._recorder.stop()
+            self.data = [self._recorder.to_data()]
+        else:
+            self.data = [frame_to_data(self._webcam_preview.snapshot)]
         self.accept()
+
+    def done(self, result):
+        self._close_recording()
+        self._recording_timer.stop()
+        self._webcam_preview.stop()
+        super(QtWebcamImporter, self).done(result)
@@ -0,0 +1,299 @@
+import gc
+import os
+import sys
+import time
+import threading
+
+import numpy as np
+import pytest
+
+from glue.utils.qt import get_qapp
+
+from ..webcam_helpers import FrameBuffer, FrameGrabber, Recorder
+from ..qt_widget import QtWebcamImporter, frame_to_image
+
+
+class FakeWebcam(object):
+    """
+    A camera returning frames filled with the frame number, at a fixed rate.
+    """
+
+    def __init__(self, shape=(12, 16, 3), fps=100.):
+        self.shape = shape
+        self.interval = 1. / fps
+        self.n_frames = 0
+        self.released = False
+        self.outputs = []
+
+    def capture_frame(self, out=None):
+        time.sleep(self.interval)
+        self.outputs.append(out)
+        if out is None or out.shape != self.shape:
+            out = np.zeros(self.shape, dtype=np.uint8)
+        self.n_frames += 1
+        out[...] = self.n_frames % 256
+        return out
+
+    def release(self):
+        self.released = True
+
+
+def wait_for(condition, timeout=10):
+    app = get_qapp()
+    start = time.time()
+    while not condition():
+        assert time.time() - start < timeout
+        app.processEvents()
+        time.sleep(0.01)
+
+
+def test_frame_buffer():
+
+    buffer = FrameBuffer((2, 3), size=3)
+
+    with buffer.latest() as frame:
+        assert frame is None
+
+    buffer.writable()[...] = 1
+    buffer.commit()
+
+    with buffer.latest() as frame:
+
+        np.testing.assert_equal(frame, 1)
+
+        # Frames being read or the latest frame are never written to
+        for value in range(2, 6):
+            buffer.writable()[...] = value
+            buffer.commit()
+        np.testing.assert_equal(frame, 1)
+
+        with buffer.latest() as frame2:
+            np.testing.assert_equal(frame2, 5)
+            buffer.writable()[...] = 6
+            buffer.commit()
+            # All frames are being read or are the latest frame
+            assert buffer.writable() is None
+
+    assert buffer.count == 6
+
+
+def test_grabber():
+
+    source = FakeWebcam()
+    event = threading.Event()
+
+    grabber = FrameGrabber(source, callback=event.set)
+    grabber.start()
+    assert event.wait(5)
+    wait_for(lambda: grabber.buffer.count > 10)
+    grabber.stop()
+    assert not grabber.running
+
+    # Frames are read into the preallocated buffer
+    frames = grabber.buffer._frames
+    assert all(any(out is not None and np.shares_memory(out, frame) for frame in frames)
+               for out in source.outputs[1:])
+
+    with grabber.buffer.latest() as frame:
+        np.testing.assert_equal(frame, source.n_frames % 256)
+
+
+def test_frame_to_image():
+    frame = np.zeros((4, 5, 3), dtype=np.uint8)
+    frame[..., 0] = 255
+    image = frame_to_image(frame)
+    assert image.width() == 5 and image.height() == 4
+    assert image.pixel(0, 0) == 0xff0000ff
+
+
+def test_importer():
+
+    source = FakeWebcam()
+
+    importer = QtWebcamImporter(source=source)
+    preview = importer._webcam_preview
+    importer.show()
+
+    wait_for(lambda: preview._grabber.buffer is not None)
+    importer.grab()
+
+    importer.flip_capture_button()
+    assert preview._frozen
+    snapshot = preview.snapshot.copy()
+
+    # The snapshot does not change while frames are still being read
+    n_frames = source.n_frames
+    wait_for(lambda: source.n_frames > n_frames + 2)
+    np.testing.assert_equal(preview.snapshot, snapshot)
+    importer.grab()
+
+    importer.finalize()
+    assert source.released
+
+    data, = importer.data
+    assert data.shape == (12, 16)
+    np.testing.assert_equal(data['blue'], snapshot[::-1, ::-1, 0])
+
+
+@pytest.mark.parametrize('memmap', [False, True])
+def test_recorder(tmpdir, memmap):
+
+    source = FakeWebcam(fps=200)
+    grabber = FrameGrabber(source)
+    grabber.start()
+
+    filename = tmpdir.join('recording.npy').strpath if memmap else None
+
+    recorder = Recorder(grabber, n_frames=20, filename=filename)
+    recorder.start()
+    assert recorder.wait(10)
+    grabber.stop()
+
+    assert recorder.recorded == 20
+    assert recorder.frames.shape == (3, 20, 12, 16)
+    assert np.all(np.diff(recorder.times) > 0)
+
+    # Frames are recorded in order, and any frames missed are counted
+    values = recorder.frames[0, :, 0, 0].astype(int)
+    assert np.all(np.diff(values) > 0)
+    assert recorder.dropped >= np.sum(np.diff(values) - 1)
+
+    data = recorder.to_data()
+    assert data.shape == (20, 12, 16)
+    assert [cid.label for cid in data.main_components] == ['red', 'green', 'blue']
+
+    if memmap:
+        np.testing.assert_equal(np.load(filename)[2], data['blue'])
+
+
+class SlowArray(np.ndarray):
+    # An array which is slow to write to, as can happen when writing to disk
+
+    def __setitem__(self, item, value):
+        time.sleep(0.01)
+        super(SlowArray, self).__setitem__(item, value)
+
+
+class SlowRecorder(Recorder):
+
+    def _allocate(self, frame):
+        super(SlowRecorder, self)._allocate(frame)
+        self.frames = self.frames.view(SlowArray)
+
+
+def test_recorder_dropped():
+
+    source = FakeWebcam(fps=1000)
+    grabber = FrameGrabber(source)
+    grabber.start()
+
+    # Frames are dropped rather than queued when the recorder falls behind
+    recorder = SlowRecorder(grabber, n_frames=5)
+    recorder.start()
+    assert recorder.wait(10)
+    grabber.stop()
+
+    assert recorder.recorded == 5
+    assert recorder.dropped > 5
+
+    values = np.asarray(recorder.frames[0, :, 0, 0]).astype(int)
+    assert recorder.dropped >= np.sum(np.diff(values) - 1)
+
+
+def test_recorder_duration():
+
+    source = FakeWebcam(fps=20)
+    grabber = FrameGrabber(source)
+    grabber.start()
+
+    recorder = Recorder(grabber, duration=0.3, frame_rate=50)
+    assert recorder.n_frames == 15
+    recorder.start()
+    assert recorder.wait(10)
+    grabber.stop()
+
+    assert 0 < recorder.recorded < 15
+    assert recorder.to_data().shape[0] == recorder.recorded
+
+    # Only the frames that were recorded are kept
+    assert recorder.frames.shape[1] == recorder.recorded
+
+    with pytest.raises(ValueError, match='Either n_frames or duration'):
+        Recorder(grabber)
+
+
+def test_importer_recording():
+
+    source = FakeWebcam(fps=200)
+
+    importer = QtWebcamImporter(source=source)
+    importer.memmap_threshold = 0
+    importer.record_frames.setValue(10)
+
+    wait_for(lambda: importer._webcam_preview._grabber.buffer is not None)
+    importer.start_recording()
+    assert not importer.ok.isEnabled()
+    assert importer._recorder.filename is not None
+
+    wait_for(lambda: importer.ok.isEnabled())
+    assert importer.record.text() == "Record again"
+
+    filename = importer._recorder.filename
+    importer.finalize()
+
+    data, = importer.data
+    assert data.shape == (10, 12, 16)
+    assert data.label == "Webcam Recording"
+
+    # Closing the dialog deletes the temporary file, but the dataset remains
+    # usable since the file stays mapped (on Windows, a file which is still
+    # mapped cannot be deleted)
+    assert importer._recorder is None
+    assert np.all(np.diff(data['red'][:, 0, 0].astype(int)) > 0)
+    if sys.platform != 'win32':
+        assert not os.path.exists(filename)
+
+
+@pytest.mark.parametrize('close', [False, True])
+def test_recorder_close(tmpdir, close):
+
+    source = FakeWebcam(fps=200)
+    grabber = FrameGrabber(source)
+    grabber.start()
+
+    filename = tmpdir.join('recording.npy').strpath
+
+    recorder = Recorder(grabber, n_frames=5, filename=filename, delete=True)
+    recorder.start()
+    assert recorder.wait(10)
+    grabber.stop()
+
+    data = recorder.to_data()
+    assert os.path.exists(filename)
+
+    # The file is deleted when the recorder is closed, or otherwise once it
+    # is garbage collected
+    if close:
+        recorder.close()
+    else:
+        del recorder
+        gc.collect()
+
+    assert np.all(np.diff(data['red'][:, 0, 0].astype(int)) > 0)
+    if sys.platform != 'win32':
+        assert not os.path.exists(filename)
+
+
+def test_recorder_delete_unused(tmpdir):
+
+    # The file is deleted if the recording ends before any frame is recorded
+    filename = tmpdir.join('recording.npy').strpath
+    open(filename, 'wb').close()
+
+    grabber = FrameGrabber(FakeWebcam())
+    recorder = Recorder(grabber, n_frames=5, filename=filename, delete=True)
+    recorder.start()
+    recorder.stop()
+
+    assert recorder.frames is None
+    assert not os.path.exists(filename)
@@ -1,16 +1,418 @@
-import cv2
+import os
+import time
+import weakref
+import threading
+from contextlib import contextmanager
+
+import numpy as np
 
 from glue.core import Data
 
+FRAME_BUFFER_SIZE = 3  # number of frames in the ring buffer used for the preview
+RETRY_INTERVAL = 0.1  # time to wait after the camera fails to return a frame, in seconds
+FRAME_RATE = 30.  # frame rate assumed when preallocating recordings of a given duration
+CHANNELS = ['red', 'green', 'blue']  # names of the channels, in the order recorded
+
 
 class Webcam(object):
 
-    def __init__(self):
-        self._capture = cv2.VideoCapture(0)
+    def __init__(self, device=0):
+        # OpenCV is only imported once a camera is actually used
+        import cv2
+        self._capture = cv2.VideoCapture(device)
+
+    def capture_frame(self, out=None):
+        """
+        Read the next frame from the camera, as a ``(y, x, 3)`` BGR array.
+
+        Parameters
+        ----------
+        out : `~numpy.ndarray`, optional
+            An array in which to read the frame, if it has the right shape.
+
+        Returns
+        -------
+        frame : `~numpy.ndarray` or `None`
+            The frame, or `None` if no frame could be read.
+        """
+        ret, frame = self._capture.read(out)
+        return frame if ret else None
+
+    def release(self):
+        self._capture.release()
+
+
+class FrameBuffer(object):
+    """
+    A ring buffer of preallocated frames, written by one thread and read by
+    others.
+
+    The writer fills the array returned by :meth:`writable` and then calls
+    :meth:`commit`. Readers access the most recent complete frame with
+    :meth:`latest`, which is never overwritten while it is being read.
+
+    Parameters
+    ----------
+    shape : tuple
+        The shape of the frames.
+    dtype : `~numpy.dtype`, optional
+        The type of the frames.
+    size : int, optional
+        The number of frames in the buffer.
+    """
+
+    def __init__(self, shape, dtype=np.uint8, size=FRAME_BUFFER_SIZE):
+        self._frames = np.zeros((size,) + tuple(shape), dtype=dtype)
+        self._lock = threading.Condition()
+        self._latest = None
+        self._writing = None
+        self._reading = {}
+        self._next = 0
+        self.count = 0
+
+    @property
+    def shape(self):
+        """
+        The shape of the frames.
+        """
+        return self._frames.shape[1:]
+
+    @property
+    def dtype(self):
+        """
+        The type of the frames.
+        """
+        return self._frames.dtype
+
+    def writable(self):
+        """
+        Return the next frame to write, or `None` if all frames are in use.
+        """
+        with self._lock:
+            size = len(self._frames)
+            for offset in range(size):
+                index = (self._next + offset) % size
+                if index != self._latest and index not in self._reading:
+                    self._writing = index
+                    self._next = (index + 1) % size
+                    return self._frames[index]
+            self._writing = None
+            return None
+
+    def commit(self):
+        """
+        Mark the frame returned by :meth:`writable` as the most recent frame.
+        """
+        with self._lock:
+            if self._writing is not None:
+                self._latest, self._writing = self._writing, None
+                self.count += 1
+                self._lock.notify_all()
+
+    @contextmanager
+    def latest(self):
+        """
+        Context manager giving the most recent frame (or `None` if no frame
+        has been written yet), which should not be used outside the context.
+        """
+        with self.newer(-1, timeout=0) as (frame, count):
+            yield frame
+
+    @contextmanager
+    def newer(self, count, timeout=None):
+        """
+        Context manager which waits for a frame more recent than a given
+        frame, and gives the most recent frame and its number.
+
+        Parameters
+        ----------
+        count : int
+            The number of the last frame seen, where frames are numbered
+            from 1 in the order they are written.
+        timeout : float, optional
+            The maximum time to wait, in seconds.
+
+        Returns
+        -------
+        frame : `~numpy.ndarray` or `None`
+            The most recent frame, which should not be used outside the
+            context, or `None` if no new frame arrived before the timeout.
+        count : int
+            The number of the frame.
+        """
+        with self._lock:
+            self._lock.wait_for(lambda: self.count > count and self._latest is not None,
+                                timeout)
+            if self.count > count and self._latest is not None:
+                index, count = self._latest, self.count
+                self._reading[index] = self._reading.get(index, 0) + 1
+            else:
+                index = None
+        try:
+            yield (None if index is None else self._frames[index]), count
+        finally:
+            if index is not None:
+                with self._lock:
+                    self._reading[index] -= 1
+                    if self._reading[index] == 0:
+                        del self._reading[index]
+
+
+class FrameGrabber(object):
+    """
+    Read frames from a camera on a background thread into a
+    :class:`FrameBuffer`.
+
+    Reading frames blocks until the camera has a new frame, so frames are read
+    at the frame rate of the camera. Frames arriving while all the frames in
+    the buffer are being read are dropped.
+
+    Parameters
+    ----------
+    source : object
+        The camera, which should have a ``capture_frame`` method with the same
+        signature as :meth:`Webcam.capture_frame`.
+    callback : callable, optional
+        A function called from the background thread after each new frame.
+    size : int, optional
+        The number of frames in the buffer.
+    """
+
+    def __init__(self, source, callback=None, size=FRAME_BUFFER_SIZE):
+        self.source = source
+        self.callback = callback
+        self.buffer = None
+        self._size = size
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Start reading frames.
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=1.):
+        """
+        Stop reading frames, waiting for at most ``timeout`` seconds for the
+        current frame to be read.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+
+        scratch = None
+
+        while not self._stop.is_set():
+
+            out = None if self.buffer is None else self.buffer.writable()
+            if out is None:
+                out = scratch
+
+            frame = self.source.capture_frame(out)
+
+            if frame is None:
+                self._stop.wait(RETRY_INTERVAL)
+                continue
+
+            if self.buffer is None or frame.shape != self.buffer.shape:
+                self.buffer = FrameBuffer(frame.shape, dtype=frame.dtype, size=self._size)
+                out = self.buffer.writable()
+                out[...] = frame
+            elif out is scratch or out is None:
+                # All frames are being read, so this frame is dropped
+                scratch = frame
+                continue
+            elif frame is not out:
+                out[...] = frame
+
+            self.buffer.commit()
+
+            if self.callback is not None:
+                self.callback()
+
+
+class Recorder(object):
+    """
+    Record frames from a :class:`FrameGrabber` into preallocated ``(t, y, x)``
+    arrays, one for each channel.
+
+    Frames are copied from the buffer of the grabber on a background thread.
+    If copying falls behind the camera (for example when writing to disk),
+    the frames that were missed are dropped rather than queued, and counted
+    in :attr:`dropped`.
+
+    Parameters
+    ----------
+    grabber : :class:`FrameGrabber`
+        The grabber from which to record frames, which should be running.
+    n_frames : int, optional
+        The number of frames to record.
+    duration : float, optional
+        The maximum duration of the recording, in seconds. If ``n_frames`` is
+        not specified, space is allocated for ``duration * frame_rate``
+        frames.
+    frame_rate : float, optional
+        The maximum frame rate expected from the camera, used if only
+        ``duration`` is specified.
+    filename : str, optional
+        If specified, the frames are recorded into a memory-mapped ``.npy``
+        file with shape ``(channel, t, y, x)`` rather than in memory, which
+        is useful for long recordings.
+    delete : bool, optional
+        If `True`, the file given by ``filename`` is treated as temporary, and
+        is deleted by :meth:`close`, when the recorder is garbage collected or
+        when the recording ends without any frames. Datasets returned by
+        :meth:`to_data` remain usable after this, since the file stays mapped
+        in memory, except on Windows, where a file which is still mapped
+        cannot be deleted.
+    """
+
+    def __init__(self, grabber, n_frames=None, duration=None, frame_rate=FRAME_RATE,
+                 filename=None, delete=False):
+        if n_frames is None:
+            if duration is None:
+                raise ValueError("Either n_frames or duration should be specified")
+            n_frames = int(np.ceil(duration * frame_rate))
+        self.grabber = grabber
+        self.n_frames = n_frames
+        self.duration = duration
+        self.filename = filename
+        self.delete = delete
+        if filename is not None and delete:
+            self._remove_file = weakref.finalize(self, _remove_file, filename)
+        else:
+            self._remove_file = None
+        self.frames = None
+        self.times = np.zeros(n_frames)
+        self.recorded = 0
+        self.dropped = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Start recording.
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop recording before the end.
+        """
+        self._stop.set()
+        self.wait()
+
+    def close(self):
+        """
+        Stop recording and delete the file if it is temporary.
+        """
+        self.stop()
+        if self._remove_file is not None:
+            self._remove_file()
+
+    def wait(self, timeout=None):
+        """
+        Wait for the recording to finish, and return whether it has.
+        """
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return not self.running
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _allocate(self, frame):
+        shape = (len(CHANNELS), self.n_frames) + frame.shape[:2]
+        if self.filename is None:
+            self.frames = np.zeros(shape, dtype=frame.dtype)
+        else:
+            self.frames = np.lib.format.open_memmap(self.filename, mode='w+',
+                                                    dtype=frame.dtype, shape=shape)
+
+    def _run(self):
+
+        last = None
+        start = time.perf_counter()
+
+        while self.recorded < self.n_frames and not self._stop.is_set():
+
+            if self.duration is not None and time.perf_counter() - start > self.duration:
+                break
+
+            buffer = self.grabber.buffer
+
+            if buffer is None:
+                self._stop.wait(RETRY_INTERVAL)
+                continue
+
+            if last is None:
+                last = buffer.count
+
+            with buffer.newer(last, timeout=RETRY_INTERVAL) as (frame, count):
+
+                if frame is None:
+                    continue
+
+                if self.frames is None:
+                    self._allocate(frame)
+                elif frame.shape[:2] != self.frames.shape[2:]:
+                    # The camera resolution changed, which ends the recording
+                    break
+
+                self.dropped += count - last - 1
+                last = count
+
+                # Frames are stored in the same orientation as snapshots
+                for index in range(len(CHANNELS)):
+                    self.frames[index, self.recorded] = frame[::-1, ::-1, 2 - index]
+
+            self.times[self.recorded] = time.perf_counter() - start
+            self.recorded += 1
+
+        if self.filename is not None:
+            if self.frames is not None:
+                self.frames.flush()
+            elif self._remove_file is not None:
+                self._remove_file()
+
+    def to_data(self):
+        """
+        Return the recorded frames as a dataset with one ``(t, y, x)``
+        component for each channel.
+
+        If the recording stopped early, frames recorded in memory are first
+        copied so that the rest of the preallocated array can be released.
+        """
+        if self.frames is None:
+            raise ValueError("No frames have been recorded")
+        if self.filename is None and self.recorded < self.frames.shape[1]:
+            self.frames = self.frames[:, :self.recorded].copy()
+        data = Data(label="Webcam Recording")
+        for index, name in enumerate(CHANNELS):
+            data.add_component(self.frames[index, :self.recorded], name)
+        return data
+
 
-    def capture_frame(self):
-        ret, frame = self._capture.read()
-        return frame
+def _remove_file(filename):
+    try:
+        os.remove(filename)
+    except OSError:  # already removed, or still open on Windows
+        pass
 
 
 def frame_to_data(frame):
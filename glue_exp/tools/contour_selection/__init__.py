@@ -1,4 +1,7 @@
 def setup():
+    # The image viewer is already loaded by glue at startup, but the tool
+    # itself is only imported once it is first added to a viewer.
     from glue.viewers.image.qt import ImageViewer
-    from .contour_selection import ContourSelectionTool  # noqa
+    from glue_exp.utils.plugins import lazy_viewer_tool
+    lazy_viewer_tool('contour_selection', __name__ + '.contour_selection')
     ImageViewer.tools.append('contour_selection')
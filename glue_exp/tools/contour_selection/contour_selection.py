@@ -1,18 +1,31 @@
 import os
+import warnings
 
+import numpy as np
 from qtpy.QtWidgets import QMessageBox
 
 from glue.viewers.matplotlib.qt.toolbar_mode import ToolbarModeBase
 
 from glue.core import roi, Data
+from glue.logger import logger
+from glue.core.edit_subset_mode import EditSubsetMode
 from glue.utils.matplotlib import point_contour
-from glue.config import viewer_tool
+
+from glue_exp.utils.cache import LAYER_CACHE
+from glue_exp.utils.cost import (Cost, TIME_BUDGET, calibration, choose_strategy, time_call,
+                                 visible_slices)
+from glue_exp.utils.plugins import viewer_tool
+from glue_exp.utils.profiling import INSTRUMENTATION
+from glue_exp.utils.pyramid import ImagePyramid, upsample_cropped_mask
+from glue_exp.utils.qt import CoalescingWorker
+from glue_exp.utils.subset import CroppedMaskSubsetState
 
 __all__ = ['ContourSelectionTool']
 
 ROOT = os.path.dirname(__file__)
 
-WARN_THRESH = 10000000  # warn when contouring large images
+PREVIEW_PIXELS = 1000000  # maximum number of pixels used for downsampled contours
+CONTOUR_BYTES = 8  # approximate memory used per pixel when finding a contour
 
 
 @viewer_tool
@@ -28,12 +41,34 @@ class ContourSelectionTool(ToolbarModeBase):
     status_tip = ('Click on any pixel to select all pixels inside the '
                   'contour passing through that pixel')
 
+    # Whether to compute the contour on a background thread, keeping the
+    # user interface responsive for large datasets
+    background = True
+
+    # Contours are simplified so that no vertex moves by more than
+    # simplify_tolerance pixels. If the simplified contour still has more than
+    # max_vertices vertices, the selection is defined by a mask instead of a
+    # polygon, since this is then cheaper to evaluate.
+    simplify_tolerance = 0.5
+    max_vertices = 1000
+
+    # The cost of finding the contour depends on the size of the region it
+    # encloses, which is not known in advance. The contour is first looked
+    # for at full resolution, but if the region being grown would take more
+    # than time_budget seconds or memory_budget bytes, the contour is instead
+    # only found in the part of the image visible in the viewer, or if that
+    # is still too expensive, in a downsampled version of the image with at
+    # most PREVIEW_PIXELS pixels. Either budget can be set to None to disable
+    # it.
+    time_budget = TIME_BUDGET
+    memory_budget = None
+
     def __init__(self, *args, **kwargs):
         super(ContourSelectionTool, self).__init__(*args, **kwargs)
         self._release_callback = self._contour_roi
         self.viewer.state.add_callback('reference_data', self._on_reference_data_change)
         self._active_layer = None
-        self._large_ok = None
+        self._worker = CoalescingWorker()
 
     def _on_reference_data_change(self, reference_data):
         if reference_data is not None:
@@ -66,25 +101,6 @@ class ContourSelectionTool(ToolbarModeBase):
             qmb.exec_()
             return
 
-        if not self._large_ok and visible_data_layers[0].layer.size > WARN_THRESH:
-
-            message = ('The dataset you want to apply this tool to is large '
-                       'and you may run in to performance issues. Are you '
-                       'sure you want to continue? Note that if you press OK '
-                       'this warning will no longer be shown for this viewer. '
-                       'You will need to start the selection again once this '
-                       'dialog is closed.')
-
-            buttons = QMessageBox.Ok | QMessageBox.Cancel
-            result = QMessageBox.warning(self.viewer, 'Large data warning',
-                                         message, buttons=buttons,
-                                         defaultButton=QMessageBox.Cancel)
-
-            if result == QMessageBox.Ok:
-                self._large_ok = True
-
-            return
-
         self._active_layer = visible_data_layers[0]
         super(ContourSelectionTool, self).press(event)
 
@@ -117,18 +133,399 @@ class ContourSelectionTool(ToolbarModeBase):
         if data is None or att is None:
             return
 
-        if data.size > WARN_THRESH and not self.viewer._confirm_large_image(data):
-            return
+        x, y = mode._event_xdata, mode._event_ydata
+        with INSTRUMENTATION.stage('contour', 'values'):
+            values = LAYER_CACHE.get(data, att)
+        window = visible_slices(self.viewer.axes, values.shape)
+
+        def compute():
+            with INSTRUMENTATION.stage('contour', 'contour', size=values.size):
+                return self._compute_selection(data, att, values, x, y, window)
+
+        def apply(result):
+            if isinstance(result, tuple):
+                slices, mask = result
+                with INSTRUMENTATION.stage('contour', 'subset_state'):
+                    subset_state = CroppedMaskSubsetState(slices, mask,
+                                                          data.pixel_component_ids)
+                try:
+                    mode = self.viewer.session.edit_subset_mode
+                except AttributeError:
+                    mode = EditSubsetMode()
+                with INSTRUMENTATION.stage('contour', 'update'):
+                    mode.update(data, subset_state, focus_data=data)
+            elif result:
+                with INSTRUMENTATION.stage('contour', 'apply_roi', vertices=len(result.vx)):
+                    self.viewer.apply_roi(result)
+
+        if self.background:
+            self._worker.submit(compute, apply)
+        else:
+            apply(compute())
 
-        roi = mode.roi(data[att])
+        self._active_layer = None
 
-        if roi:
-            self.viewer.apply_roi(roi)
+    def _pixel_budget(self, dtype):
+        """
+        Return the number of pixels which can be searched for a contour
+        within the time and memory budget, or `None` if there is no limit.
+        """
 
-        self._active_layer = None
+        budgets = []
+
+        if self.time_budget is not None:
+            budgets.append(int(self.time_budget / calibrate_contour(dtype)))
+
+        if self.memory_budget is not None:
+            budgets.append(int(self.memory_budget / CONTOUR_BYTES))
+
+        return min(budgets) if budgets else None
+
+    def _choose_strategy(self, values, x, y, window):
+        """
+        Choose whether to find the contour only in the part of the image
+        visible in the viewer (``'window'``), or in a downsampled version of
+        the image (``'preview'``), when it is too expensive to find it in the
+        whole image.
+        """
+
+        seconds_per_pixel = calibrate_contour(values.dtype)
+
+        def cost(n_pixels):
+            return Cost(seconds_per_pixel * n_pixels, CONTOUR_BYTES * n_pixels)
+
+        costs = []
+
+        ywindow, xwindow = window
+        if ywindow.start <= y < ywindow.stop and xwindow.start <= x < xwindow.stop:
+            costs.append(('window', cost((ywindow.stop - ywindow.start) *
+                                         (xwindow.stop - xwindow.start))))
+
+        # Downsampling needs to read the whole image once, and the pyramid is
+        # then kept in the cache.
+        costs.append(('preview', cost(min(values.size, PREVIEW_PIXELS)) +
+                      Cost(0., values.size)))
+
+        return choose_strategy(costs, time_budget=self.time_budget,
+                               memory_budget=self.memory_budget)
+
+    def _compute_selection(self, data, att, values, x, y, window):
+        """
+        Find the ROI or mask for the contour passing through (x, y) - this may
+        be called from a background thread, so should not interact with the
+        user interface.
+        """
+
+        if x is None or y is None:
+            return None
+
+        x = int(round(x))
+        y = int(round(y))
+
+        # The region is grown from a small window around the pixel, so this
+        # gives up as soon as the window exceeds the budget, having spent at
+        # most about the budget on the attempt.
+        slices, island = contour_island(x, y, values,
+                                        max_pixels=self._pixel_budget(values.dtype))
+
+        if slices is not None:
+            return self._island_selection(slices, island)
+
+        strategy = self._choose_strategy(values, x, y, window)
+
+        logger.info("Contour selection was computed using the {0} strategy "
+                    "to stay within the time and memory budget".format(strategy))
+
+        if strategy == 'window':
 
+            ywindow, xwindow = window
+            result = self._contour_selection(x - xwindow.start, y - ywindow.start,
+                                             values[window])
 
-def contour_to_roi(x, y, data):
+            if isinstance(result, tuple):
+                slices, mask = result
+                return ((slice(slices[0].start + ywindow.start, slices[0].stop + ywindow.start),
+                         slice(slices[1].start + xwindow.start, slices[1].stop + xwindow.start)),
+                        mask)
+            elif result is not None:
+                return roi.PolygonalROI(vx=np.asarray(result.vx) + xwindow.start,
+                                        vy=np.asarray(result.vy) + ywindow.start)
+
+        else:
+
+            pyramid = LAYER_CACHE.get(data, att, name='pyramid',
+                                      factory=lambda: ImagePyramid(values))
+            factor, image = pyramid.level(PREVIEW_PIXELS)
+
+            result = self._contour_selection(min(x // factor, image.shape[1] - 1),
+                                             min(y // factor, image.shape[0] - 1), image)
+
+            if isinstance(result, tuple):
+                slices, mask = result
+                return upsample_cropped_mask(slices, mask, factor, image.shape, values.shape)
+            elif result is not None:
+                # Pixel centers of the downsampled image are offset by half a
+                # block compared to the full resolution image.
+                offset = (factor - 1) / 2
+                return roi.PolygonalROI(vx=np.asarray(result.vx) * factor + offset,
+                                        vy=np.asarray(result.vy) * factor + offset)
+
+    def _contour_selection(self, x, y, values):
+        """
+        Find the ROI for the contour passing through (x, y), or if the contour
+        is too complex, the mask of the pixels it encloses, cropped to its
+        bounding box, as a ``(slices, mask)`` tuple.
+        """
+
+        return self._island_selection(*contour_island(x, y, values))
+
+    def _island_selection(self, slices, island):
+        """
+        Find the ROI or cropped mask for a region found by
+        :func:`contour_island`.
+        """
+
+        xy = island_contour(slices, island)
+
+        if xy is None:
+            return None
+
+        vx, vy = xy[:, 0], xy[:, 1]
+
+        if self.simplify_tolerance:
+            vx, vy = simplify_polygon(vx, vy, self.simplify_tolerance)
+
+        if len(vx) > self.max_vertices:
+            return slices, island
+
+        return roi.PolygonalROI(vx=vx, vy=vy)
+
+
+@calibration
+def calibrate_contour(dtype):
+    """
+    Measure the time taken to find a contour, per pixel enclosed by the
+    contour, for a given dtype.
+
+    This is measured once per session for each dtype, by finding the contour
+    around a synthetic image with a uniform value.
+    """
+    data = np.ones((256, 256), dtype=dtype)
+    return time_call(local_point_contour, 128, 128, data) / data.size
+
+
+def contour_island(x, y, data, window=64, max_pixels=None):
+    """
+    Find the region enclosed by the contour that passes through (x,y) in data
+
+    This is the connected region of pixels at or above the level of the
+    selected pixel which contains that pixel, with any holes filled in. Rather
+    than labelling the whole image, the region is first found in a small
+    window around the pixel, and the window is doubled in size until it
+    contains the whole region, so that the cost depends on the size of the
+    region rather than that of the image.
+
+    Parameters
+    ----------
+    x, y : int
+        Index of the `x` and `y` location.
+    data : `~numpy.ndarray`
+        A 2D image.
+    window : int, optional
+        The initial size of the window, in pixels.
+    max_pixels : int, optional
+        If specified, give up once the window would contain more than this
+        many pixels.
+
+    Returns
+    -------
+    slices : tuple of slice
+        The slices which give the bounding box of the region in the image
+        (`None` if ``max_pixels`` was exceeded).
+    island : `~numpy.ndarray`
+        A boolean mask with the shape of the bounding box (`None` if
+        ``max_pixels`` was exceeded).
+    """
+
+    from scipy.ndimage import label, binary_fill_holes
+
+    # Find the intensity of the selected pixel
+    inten = data[y, x]
+
+    ny, nx = data.shape
+    half = max(window // 2, 1)
+
+    while True:
+
+        ymin, ymax = max(y - half, 0), min(y + half + 1, ny)
+        xmin, xmax = max(x - half, 0), min(x + half + 1, nx)
+
+        if max_pixels is not None and (ymax - ymin) * (xmax - xmin) > max_pixels:
+            return None, None
+
+        # Find all 'islands' above this intensity in the window, and pick the
+        # one we clicked on
+        labeled, nr_objects = label(np.asarray(data[ymin:ymax, xmin:xmax]) >= inten)
+        z = labeled == labeled[y - ymin, x - xmin]
+
+        # If the island touches the edge of the window, it may extend beyond
+        # it, so we need to try again with a larger window
+        if ((ymin > 0 and z[0].any()) or (ymax < ny and z[-1].any()) or
+                (xmin > 0 and z[:, 0].any()) or (xmax < nx and z[:, -1].any())):
+            half *= 2
+        else:
+            break
+
+    # Crop to the bounding box of the island
+    rows = np.nonzero(z.any(axis=1))[0]
+    cols = np.nonzero(z.any(axis=0))[0]
+    z = z[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+
+    # Fill holes inside it so we don't get 'inner' contours
+    z = binary_fill_holes(z)
+
+    slices = (slice(ymin + rows[0], ymin + rows[-1] + 1),
+              slice(xmin + cols[0], xmin + cols[-1] + 1))
+
+    return slices, z
+
+
+def local_point_contour(x, y, data, window=64):
+    """
+    Calculate the contour that passes through (x,y) in data
+
+    This gives the same result as :func:`glue.utils.matplotlib.point_contour`
+    but only looks at the part of the image enclosed by the contour (see
+    :func:`contour_island`), so that the cost depends on the size of the
+    region rather than that of the image.
+
+    Parameters
+    ----------
+    x, y : int
+        Index of the `x` and `y` location.
+    data : `~numpy.ndarray`
+        A 2D image.
+    window : int, optional
+        The initial size of the window, in pixels.
+
+    Returns
+    -------
+    contour : `~numpy.ndarray`
+        A shape ``(N, 2)`` numpy array giving the `x` and `y` locations
+        of the `N` contour vertices.
+    """
+
+    slices, island = contour_island(x, y, data, window=window)
+
+    return island_contour(slices, island)
+
+
+def island_contour(slices, island):
+    """
+    Calculate the contour around a region found by :func:`contour_island`
+
+    Parameters
+    ----------
+    slices : tuple of slice
+        The slices which give the bounding box of the region in the image.
+    island : `~numpy.ndarray`
+        A boolean mask with the shape of the bounding box.
+
+    Returns
+    -------
+    contour : `~numpy.ndarray`
+        A shape ``(N, 2)`` numpy array giving the `x` and `y` locations
+        of the `N` contour vertices in the image.
+    """
+
+    from skimage.measure import find_contours
+
+    # Pad the resulting array so that for contours that go to the edge we get
+    # one continuous contour
+    z = np.pad(island.astype(float), 1, mode='constant')
+
+    # Finally find the contours around the island
+    xy = find_contours(z, 0.5, fully_connected='high')
+
+    if not xy:
+        return None
+
+    if len(xy) > 1:
+        warnings.warn("Too many contours found, picking the first one")
+
+    # We need to flip the array to get (x, y), and account for the padding
+    # and the position of the bounding box in the image
+    return xy[0][:, ::-1] - 1 + [slices[1].start, slices[0].start]
+
+
+def simplify_polygon(vx, vy, tolerance):
+    """
+    Simplify a polygon using the Douglas-Peucker algorithm
+
+    Parameters
+    ----------
+    vx, vy : `~numpy.ndarray`
+        The x and y coordinates of the vertices. If the first and last
+        vertices are the same, the polygon is treated as closed.
+    tolerance : float
+        The maximum distance between the original and simplified polygon.
+
+    Returns
+    -------
+    vx, vy : `~numpy.ndarray`
+        The x and y coordinates of the vertices of the simplified polygon.
+    """
+
+    vx = np.asarray(vx)
+    vy = np.asarray(vy)
+
+    n = len(vx)
+
+    if n < 4:
+        return vx, vy
+
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+
+    if vx[0] == vx[-1] and vy[0] == vy[-1]:
+        # For closed polygons, the first and last vertices are the same, so we
+        # split the polygon at the vertex furthest from the first one and
+        # simplify each half separately.
+        far = np.argmax(np.hypot(vx - vx[0], vy - vy[0]))
+        keep[far] = True
+        stack = [(0, far), (far, n - 1)]
+    else:
+        stack = [(0, n - 1)]
+
+    while stack:
+
+        start, end = stack.pop()
+
+        if end - start < 2:
+            continue
+
+        # Find the distance of the intermediate vertices to the segment
+        # joining the start and end vertices
+        sx, sy = vx[end] - vx[start], vy[end] - vy[start]
+        rx, ry = vx[start + 1:end] - vx[start], vy[start + 1:end] - vy[start]
+        length = np.hypot(sx, sy)
+        if length == 0:
+            distance = np.hypot(rx, ry)
+        else:
+            distance = np.abs(sx * ry - sy * rx) / length
+
+        imax = np.argmax(distance)
+
+        if distance[imax] > tolerance:
+            imax += start + 1
+            keep[imax] = True
+            stack.append((start, imax))
+            stack.append((imax, end))
+
+    return vx[keep], vy[keep]
+
+
+def contour_to_roi(x, y, data, local=True, tolerance=None):
     """
     Return a PolygonalROI for the contour that passes through (x,y) in data
 
@@ -138,6 +535,13 @@ def contour_to_roi(x, y, data):
         x and y coordinate of the point
     data : `numpy.ndarray`
         The data
+    local : bool, optional
+        If `True`, the contour is found using :func:`local_point_contour`,
+        which only looks at the region of the image around the contour.
+        Otherwise, :func:`~glue.utils.matplotlib.point_contour` is used.
+    tolerance : float, optional
+        If specified, the contour is simplified using :func:`simplify_polygon`
+        with this tolerance (in pixels).
 
     Returns
     -------
@@ -152,9 +556,18 @@ def contour_to_roi(x, y, data):
     x = int(round(x))
     y = int(round(y))
 
-    xy = point_contour(x, y, data)
+    if local:
+        xy = local_point_contour(x, y, data)
+    else:
+        xy = point_contour(x, y, data)
+
     if xy is None:
         return None
 
-    p = roi.PolygonalROI(vx=xy[:, 0], vy=xy[:, 1])
+    vx, vy = xy[:, 0], xy[:, 1]
+
+    if tolerance:
+        vx, vy = simplify_polygon(vx, vy, tolerance)
+
+    p = roi.PolygonalROI(vx=vx, vy=vy)
     return p
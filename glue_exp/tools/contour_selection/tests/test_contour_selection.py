@@ -1,4 +1,5 @@
 import numpy as np
+import pytest
 from mock import MagicMock, patch
 
 from glue.core import Data
@@ -7,13 +8,15 @@ from glue.app.qt import GlueApplication
 
 from glue.viewers.matplotlib.tests.test_mouse_mode import TestMouseMode, Event
 
-from ..contour_selection import ContourSelectionTool, contour_to_roi
+from ..contour_selection import (ContourSelectionTool, contour_island, contour_to_roi,
+                                 local_point_contour, simplify_polygon)
 
 from .. import contour_selection
 
 try:
     from glue.utils.matplotlib import point_contour  # noqa
 except ImportError:  # glue < 0.5
+    from glue.core.util import point_contour  # noqa
     point_contour_path = 'glue.core.util.point_contour'
 else:
     point_contour_path = 'glue.utils.matplotlib.point_contour'
@@ -71,3 +74,125 @@ def test_activate_tool():
     viewer = None
     application.close()
     application = None
+
+
+@pytest.mark.parametrize('window', [2, 5, 64])
+def test_local_point_contour(window):
+
+    # Make a smooth image with several peaks so that there are islands of
+    # different sizes, some of which touch the edges or have holes.
+    yy, xx = np.indices((60, 80))
+    data = np.sin(xx / 7.) * np.cos(yy / 5.) + 0.2 * np.sin((xx + yy) / 3.)
+
+    np.random.seed(12345)
+
+    for x, y in zip(np.random.randint(0, 80, 20), np.random.randint(0, 60, 20)):
+        expected = point_contour(x, y, data)
+        result = local_point_contour(x, y, data, window=window)
+        np.testing.assert_allclose(result, expected)
+
+
+def test_simplify_polygon():
+
+    # Square with many vertices along each edge, and a small amount of noise
+    # in x (which only moves vertices off the vertical edges)
+    np.random.seed(12345)
+    t = np.linspace(0, 1, 101)[:-1]
+    vx = np.hstack([t, np.ones(100), 1 - t, np.zeros(100), 0])
+    vy = np.hstack([np.zeros(100), t, np.ones(100), 1 - t, 0])
+    vx[1:-1] += np.random.uniform(-0.01, 0.01, 399)
+
+    sx, sy = simplify_polygon(vx, vy, 0.05)
+    np.testing.assert_allclose(sx, [0, 1, 1, 0, 0], atol=0.02)
+    np.testing.assert_allclose(sy, [0, 0, 1, 1, 0])
+
+    # With a tolerance of zero, only exactly collinear vertices are removed
+    sx, sy = simplify_polygon(vx, vy, 0)
+    assert 200 < len(sx) < 210
+
+
+def test_contour_to_roi_tolerance():
+    data = np.zeros((50, 50))
+    data[10:40, 5:45] = 1.
+    p = contour_to_roi(20, 20, data, tolerance=0.5)
+    assert len(p.vx) < 10
+    assert p.contains(25, 25)
+    assert not p.contains(2, 25)
+
+
+class TestContourStrategies(object):
+
+    def setup_method(self, method):
+        self.values = np.zeros((50, 60))
+        self.values[10:40, 5:45] = 1.
+        self.image = Data(label='image', x=self.values)
+        self.application = GlueApplication()
+        self.application.data_collection.append(self.image)
+        self.viewer = self.application.new_data_viewer(ImageViewer)
+        self.viewer.add_data(self.image)
+        self.tool = self.viewer.toolbar.tools['contour_selection']
+        self.tool.time_budget = None
+
+    def teardown_method(self, method):
+        self.viewer.close(warn=False)
+        self.viewer = None
+        self.application.close()
+        self.application = None
+
+    def compute(self, window):
+        return self.tool._compute_selection(self.image, self.image.id['x'],
+                                            self.values, 20, 15, window)
+
+    def test_full(self):
+        p = self.compute((slice(0, 50), slice(0, 30)))
+        assert p.contains(25, 25) and p.contains(40, 25)
+        assert not p.contains(2, 25)
+
+    def test_window(self, monkeypatch):
+        monkeypatch.setattr(contour_selection, 'PREVIEW_PIXELS', 300)
+        self.tool.memory_budget = 15000
+        p = self.compute((slice(0, 50), slice(0, 30)))
+        assert p.contains(25, 25)
+        assert not p.contains(40, 25)
+
+    def test_preview(self, monkeypatch):
+        monkeypatch.setattr(contour_selection, 'PREVIEW_PIXELS', 300)
+        self.tool.memory_budget = 6000
+        p = self.compute((slice(0, 50), slice(0, 30)))
+        assert p.contains(25, 25) and p.contains(40, 25)
+        assert not p.contains(2, 25)
+
+    def test_mask(self):
+        # Contours with too many vertices give a mask cropped to the bounding
+        # box of the region rather than one covering the whole image
+        self.tool.max_vertices = 3
+        slices, mask = self.compute((slice(0, 50), slice(0, 30)))
+        assert slices == (slice(10, 40), slice(5, 45))
+        assert mask.all()
+
+    def test_window_mask(self, monkeypatch):
+        monkeypatch.setattr(contour_selection, 'PREVIEW_PIXELS', 300)
+        self.tool.memory_budget = 15000
+        self.tool.max_vertices = 3
+        slices, mask = self.compute((slice(5, 50), slice(3, 30)))
+        assert slices == (slice(10, 40), slice(5, 30))
+        assert mask.all()
+
+    def test_small_region_in_large_image(self):
+        # A small region is found exactly even if the image is too large to
+        # search within the budget
+        values = np.zeros((2000, 2000))
+        values[1001:1004, 1001:1004] = 1.
+        self.tool.memory_budget = 100 * 100 * contour_selection.CONTOUR_BYTES
+        p = self.tool._compute_selection(self.image, self.image.id['x'], values,
+                                         1002, 1002, (slice(0, 2000), slice(0, 2000)))
+        np.testing.assert_allclose([min(p.vx), max(p.vx)], [1000.5, 1003.5])
+        np.testing.assert_allclose([min(p.vy), max(p.vy)], [1000.5, 1003.5])
+
+
+def test_contour_island_max_pixels():
+    data = np.zeros((200, 200))
+    data[50:150, 50:150] = 1.
+    slices, island = contour_island(100, 100, data, max_pixels=200 * 200)
+    assert slices == (slice(50, 150), slice(50, 150))
+    assert contour_island(100, 100, data, max_pixels=100 * 100) == (None, None)
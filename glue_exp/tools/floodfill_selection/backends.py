@@ -0,0 +1,272 @@
+from collections import OrderedDict, namedtuple
+from importlib.util import find_spec
+
+import numpy as np
+
+from glue_exp.utils.cost import Cost, calibration, time_call
+
+from .floodfill_scipy import floodfill_scipy
+from .floodfill_queue import floodfill_queue
+
+__all__ = ['FLOODFILL_BACKENDS', 'register_backend', 'floodfill', 'calibrate',
+           'estimate_cost', 'select_backend']
+
+CALIBRATION_SHAPE = (256, 256)  # size of the synthetic images used for calibration
+DEFAULT_REGION_FRACTION = 0.1  # region fraction assumed when it is not known
+
+Backend = namedtuple('Backend', ['function', 'truncates', 'memory'])
+
+# Registered backends, as a mapping from name to Backend
+FLOODFILL_BACKENDS = OrderedDict()
+
+
+def register_backend(name, function, truncates=False, memory=(1, 0)):
+    """
+    Register a flood fill backend.
+
+    Parameters
+    ----------
+    name : str
+        The name of the backend.
+    function : callable
+        A function which takes the same arguments as
+        :func:`~glue_exp.tools.floodfill_selection.floodfill_queue.floodfill_queue`
+        and returns a boolean mask, or `None` if the starting pixel does not
+        satisfy the selection criterion.
+    truncates : bool, optional
+        Whether the function stops once ``max_pixels`` pixels have been
+        selected. Other backends ignore ``max_pixels``.
+    memory : tuple, optional
+        The approximate memory used by the function, as a number of bytes per
+        pixel in the data and a number of bytes per selected pixel.
+    """
+    FLOODFILL_BACKENDS[name] = Backend(function, truncates, memory)
+    _calibrate.clear()
+
+
+def _valid_seed(data, start_coords, threshold):
+    value = data[tuple(start_coords)]
+    return value / threshold < value < value * threshold
+
+
+def _floodfill_scipy(data, start_coords, threshold, max_pixels=None):
+    # floodfill_scipy returns all non-selected pixels for an invalid seed
+    if not _valid_seed(data, start_coords, threshold):
+        return None
+    return floodfill_scipy(data, tuple(start_coords), threshold)
+
+
+def _floodfill_skimage(data, start_coords, threshold, max_pixels=None):
+    from skimage.segmentation import flood
+    if not _valid_seed(data, start_coords, threshold):
+        return None
+    # The pixels which satisfy the selection criterion are found with the
+    # same comparisons as for the scipy backend, rather than with a tolerance
+    # on the logarithm of the data, which rounding makes inexact at the
+    # boundaries (notably for integer data).
+    value = data[tuple(start_coords)]
+    inside = np.greater(data, value / threshold)
+    inside &= np.less(data, value * threshold)
+    return flood(inside, tuple(start_coords), connectivity=1)
+
+
+def _floodfill_numba(data, start_coords, threshold, max_pixels=None):
+    # Only compile the kernel once the backend is actually used
+    from .floodfill_numba import floodfill_numba
+    return floodfill_numba(data, start_coords, threshold, max_pixels=max_pixels)
+
+
+def calibrate(dtype=np.float64):
+    """
+    Measure the performance of the registered backends for a given dtype.
+
+    The time taken by each backend is modelled as ``a * n_pixels + b *
+    n_selected``, where ``n_pixels`` is the size of the data and
+    ``n_selected`` the number of pixels selected, and the coefficients are
+    found by flood filling a small and a large region in a synthetic image.
+    The results are cached, so this is only done once per dtype.
+
+    Parameters
+    ----------
+    dtype : `~numpy.dtype`, optional
+        The type of the data.
+
+    Returns
+    -------
+    coefficients : dict
+        A dictionary giving ``(a, b)`` in seconds for each backend.
+    """
+
+    return _calibrate(np.dtype(dtype))
+
+
+@calibration
+def _calibrate(dtype):
+
+    # The image has a value of 2 except for a small square with a value
+    # of 1, so that starting inside the square selects a small region and
+    # starting outside selects almost all the image.
+    data = np.full(CALIBRATION_SHAPE, 2, dtype=dtype)
+    ny, nx = CALIBRATION_SHAPE
+    data[ny // 2 - 8:ny // 2 + 8, nx // 2 - 8:nx // 2 + 8] = 1
+    small_start, large_start = (ny // 2, nx // 2), (0, 0)
+    n_pixels = data.size
+    n_small = 256
+    n_large = n_pixels - n_small
+
+    coefficients = {}
+
+    for name, backend in FLOODFILL_BACKENDS.items():
+
+        # Run once beforehand so that any compilation is not timed
+        backend.function(data[:4, :4], (0, 0), 1.5)
+
+        t_small = time_call(backend.function, data, small_start, 1.5)
+        t_large = time_call(backend.function, data, large_start, 1.5)
+
+        b = max((t_large - t_small) / (n_large - n_small), 0.)
+        a = max((t_small - b * n_small) / n_pixels, 0.)
+
+        coefficients[name] = a, b
+
+    return coefficients
+
+
+def estimate_cost(shape, dtype, backend, region_fraction=None, max_pixels=None):
+    """
+    Predict the cost of a flood fill with a given backend.
+
+    Parameters
+    ----------
+    shape : tuple
+        The shape of the data.
+    dtype : `~numpy.dtype`
+        The type of the data.
+    backend : str
+        The name of the backend.
+    region_fraction : float, optional
+        The expected fraction of the data that will be selected, if known.
+    max_pixels : int, optional
+        The maximum number of pixels to select, for backends which support
+        this.
+
+    Returns
+    -------
+    cost : :class:`~glue_exp.utils.cost.Cost`
+        The predicted run time and memory usage.
+    """
+
+    if region_fraction is None:
+        region_fraction = DEFAULT_REGION_FRACTION
+
+    n_pixels = int(np.prod(shape))
+    n_selected = region_fraction * n_pixels
+
+    if max_pixels is not None and FLOODFILL_BACKENDS[backend].truncates:
+        n_selected = min(n_selected, max_pixels)
+
+    a, b = calibrate(dtype)[backend]
+    per_pixel, per_selected = FLOODFILL_BACKENDS[backend].memory
+
+    return Cost(a * n_pixels + b * n_selected,
+                int(per_pixel * n_pixels + per_selected * n_selected))
+
+
+def select_backend(shape, dtype, region_fraction=None, max_pixels=None):
+    """
+    Select the backend expected to be the fastest for a given flood fill.
+
+    Parameters
+    ----------
+    shape : tuple
+        The shape of the data.
+    dtype : `~numpy.dtype`
+        The type of the data.
+    region_fraction : float, optional
+        The expected fraction of the data that will be selected, if known.
+    max_pixels : int, optional
+        If specified, the fill should stop once this many pixels have been
+        selected. Backends which do not support this are only considered if
+        the expected region is smaller than this.
+
+    Returns
+    -------
+    name : str
+        The name of the backend.
+    """
+
+    if region_fraction is None:
+        region_fraction = DEFAULT_REGION_FRACTION
+
+    n_pixels = int(np.prod(shape))
+
+    best_name, best_time = None, np.inf
+
+    for name, backend in FLOODFILL_BACKENDS.items():
+        if (max_pixels is not None and region_fraction * n_pixels > max_pixels and
+                not backend.truncates):
+            continue
+        cost = estimate_cost(shape, dtype, name, region_fraction=region_fraction,
+                             max_pixels=max_pixels)
+        if cost.seconds < best_time:
+            best_name, best_time = name, cost.seconds
+
+    return best_name
+
+
+def floodfill(data, start_coords, threshold, backend='auto', max_pixels=None,
+              region_fraction=None):
+    """
+    Flood fill using one of the registered backends.
+
+    All backends use the same selection criterion as
+    :func:`~glue_exp.tools.floodfill_selection.floodfill_scipy.floodfill_scipy`.
+
+    Parameters
+    ----------
+    data : `~numpy.ndarray`
+        The data to flood fill.
+    start_coords : tuple
+        The coordinates of the starting pixel, in Numpy order.
+    threshold : float
+        Pixels are selected if their value lies strictly between
+        ``value / threshold`` and ``value * threshold``, where ``value`` is
+        the value at the starting pixel.
+    backend : str, optional
+        The name of the backend to use, or ``'auto'`` to select the backend
+        with :func:`select_backend`.
+    max_pixels : int, optional
+        If specified, the fill stops once this many pixels have been
+        selected (for backends which support this).
+    region_fraction : float, optional
+        The expected fraction of the data that will be selected, which is
+        used to select the backend if ``backend`` is ``'auto'``.
+
+    Returns
+    -------
+    mask : `~numpy.ndarray` or `None`
+        A boolean mask with the same shape as the data, or `None` if the
+        starting pixel does not itself satisfy the selection criterion.
+    """
+
+    if backend == 'auto':
+        backend = select_backend(data.shape, data.dtype, region_fraction=region_fraction,
+                                 max_pixels=max_pixels)
+
+    if backend not in FLOODFILL_BACKENDS:
+        raise ValueError("Unknown flood fill backend: {0} (should be one of {1})"
+                         .format(backend, ', '.join(FLOODFILL_BACKENDS)))
+
+    return FLOODFILL_BACKENDS[backend].function(data, tuple(start_coords), threshold,
+                                                max_pixels=max_pixels)
+
+
+# The scipy backend uses a boolean mask and 32-bit labels, and the skimage
+# backend uses boolean masks together with the padded copies and work arrays
+# allocated by flood. The queue-based backends use a boolean mask and 8 bytes
+# for each pixel in the queue or front.
+register_backend('scipy', _floodfill_scipy, memory=(5, 0))
+register_backend('queue', floodfill_queue, truncates=True, memory=(1, 16))
+register_backend('skimage', _floodfill_skimage, memory=(12, 0))
+if find_spec('numba') is not None:
+    register_backend('numba', _floodfill_numba, truncates=True, memory=(1, 16))
@@ -0,0 +1,432 @@
+from importlib.util import find_spec
+
+import numpy as np
+
+__all__ = ['IncrementalFloodfill']
+
+INITIAL_CAPACITY = 1024  # initial number of pixels in the buffers, which grow as needed
+CHUNK_SIZE = 65536  # number of pixels processed at a time when cropping the mask
+
+# Types of data for which memoryviews support indexing and which the
+# compiled code supports
+ELEMENT_TYPES = 'bBhHiIlLqQfd'
+
+# Values returned by _grow_kernel, indicating whether the region was grown up
+# to the threshold, whether a buffer needs to be enlarged, or whether the
+# maximum number of pixels was reached.
+DONE, FULL, LIMIT = 0, 1, 2
+
+
+def _grow_kernel(flat, shape, steps, start_value, threshold, max_count, queued,
+                 heap_levels, heap_indices, heap_size, order, order_values, count):
+    """
+    Add pixels with a level below ``threshold`` to the region, in order of
+    increasing level, and return ``(status, heap_size, count)``.
+
+    The frontier is a binary heap stored in ``heap_levels`` and
+    ``heap_indices``, ordered by level and then by index, and the pixels in
+    the region are stored in ``order``. Since the level of the region after
+    each pixel is added is the level of the pixel furthest from the starting
+    value so far, this is recorded by storing the value of that pixel in
+    ``order_values``, which has the same type as the data.
+
+    The arrays can be numpy arrays or memoryviews, and are only indexed one
+    element at a time, so that this can also be compiled with numba.
+    """
+
+    ndim = len(shape)
+
+    while heap_size > 0 and heap_levels[0] < threshold:
+
+        if count >= max_count:
+            return LIMIT, heap_size, count
+
+        if count == len(order) or heap_size + 2 * ndim > len(heap_levels):
+            return FULL, heap_size, count
+
+        # Pop the pixel with the lowest level from the heap
+        level = heap_levels[0]
+        index = heap_indices[0]
+        heap_size -= 1
+        last_level = heap_levels[heap_size]
+        last_index = heap_indices[heap_size]
+        position = 0
+        while True:
+            child = 2 * position + 1
+            if child >= heap_size:
+                break
+            if child + 1 < heap_size and (
+                    heap_levels[child + 1] < heap_levels[child] or
+                    (heap_levels[child + 1] == heap_levels[child] and
+                     heap_indices[child + 1] < heap_indices[child])):
+                child += 1
+            if heap_levels[child] > last_level or (heap_levels[child] == last_level and
+                                                   heap_indices[child] > last_index):
+                break
+            heap_levels[position] = heap_levels[child]
+            heap_indices[position] = heap_indices[child]
+            position = child
+        heap_levels[position] = last_level
+        heap_indices[position] = last_index
+
+        value = flat[index]
+        order[count] = index
+        if count == 0 or max(value / start_value, start_value / value) >= level:
+            order_values[count] = value
+        else:
+            order_values[count] = order_values[count - 1]
+        count += 1
+
+        for idim in range(ndim):
+
+            step = steps[idim]
+            size = shape[idim]
+            coord = index // step % size
+
+            for offset in (-1, 1):
+
+                if (offset < 0 and coord == 0) or (offset > 0 and coord == size - 1):
+                    continue
+
+                neighbour = index + offset * step
+
+                if queued[neighbour]:
+                    continue
+                queued[neighbour] = 1
+
+                neighbour_value = flat[neighbour]
+                if not neighbour_value > 0:
+                    continue
+                neighbour_level = max(neighbour_value / start_value,
+                                      start_value / neighbour_value)
+                if not neighbour_level < np.inf:
+                    continue
+                neighbour_level = max(level, neighbour_level)
+
+                # Push the neighbour onto the heap
+                position = heap_size
+                heap_size += 1
+                while position > 0:
+                    parent = (position - 1) // 2
+                    if heap_levels[parent] < neighbour_level or (
+                            heap_levels[parent] == neighbour_level and
+                            heap_indices[parent] < neighbour):
+                        break
+                    heap_levels[position] = heap_levels[parent]
+                    heap_indices[position] = heap_indices[parent]
+                    position = parent
+                heap_levels[position] = neighbour_level
+                heap_indices[position] = neighbour
+
+    return DONE, heap_size, count
+
+
+# The version of _grow_kernel compiled with numba, once it has been needed
+_compiled_grow_kernel = None
+
+
+def _get_compiled_kernel():
+    global _compiled_grow_kernel
+    if _compiled_grow_kernel is None:
+        from numba import njit
+        _compiled_grow_kernel = njit(cache=True)(_grow_kernel)
+    return _compiled_grow_kernel
+
+
+class IncrementalFloodfill(object):
+    """
+    Flood fill engine that reuses work across calls with different thresholds.
+
+    The selection criterion is the same as for
+    :func:`~glue_exp.tools.floodfill_selection.floodfill_scipy.floodfill_scipy`:
+    a pixel is selected if its value lies strictly between ``value / threshold``
+    and ``value * threshold`` (where ``value`` is the value at the starting
+    pixel) and if it is connected to the starting pixel by other selected
+    pixels.
+
+    Rather than labelling the whole array for each threshold, pixels are added
+    to the region in order of the lowest threshold at which they become
+    connected to the starting pixel (a priority flood). Widening the threshold
+    resumes the flood from the current frontier, and narrowing it only
+    requires truncating the list of pixels already found, so the cost of each
+    call scales with the change in region size rather than with the size of
+    the data.
+
+    The data is never converted to a different type. The region and frontier
+    are kept in numpy arrays which grow with the region, using the index of
+    each pixel and a value with the same type as the data, and one byte per
+    pixel is needed to keep track of which pixels have been visited.
+
+    If `numba <https://numba.pydata.org>`_ is installed, the flood is run by
+    compiled code. Otherwise it runs in Python, which is roughly a hundred
+    times slower, so :meth:`grow` can be used to limit the work done for
+    each threshold.
+
+    Parameters
+    ----------
+    data : `~numpy.ndarray`
+        The data to flood fill. This can be of any numerical type and does not
+        need to be contiguous in memory.
+    start_coords : tuple
+        The coordinates of the starting pixel, in Numpy order.
+    max_pixels : int, optional
+        If specified, the region stops growing once this many pixels have been
+        selected. :attr:`truncated` then indicates whether the region for the
+        last threshold requested was limited by this.
+    compiled : bool, optional
+        Whether to use compiled code, which requires numba. By default, this
+        is used if numba is installed. Data which is not contiguous or not
+        in native byte order is then copied. Compiled code is not used for
+        16-bit floating-point data.
+    """
+
+    def __init__(self, data, start_coords, max_pixels=None, compiled=None):
+
+        if compiled is None:
+            compiled = find_spec('numba') is not None
+
+        native_dtype = data.dtype.newbyteorder('=')
+
+        self.data = data
+        self.start_coords = tuple(start_coords)
+        self.max_pixels = max_pixels
+        self.compiled = compiled and native_dtype.char in ELEMENT_TYPES
+        self.truncated = False
+
+        # Avoid ravel() for non-contiguous arrays since it would make a copy,
+        # unless the compiled code is used, which needs a native array
+        if self.compiled:
+            self._flat = np.ascontiguousarray(data, dtype=native_dtype).ravel()
+        elif data.flags.c_contiguous:
+            self._flat = data.ravel()
+        else:
+            self._flat = data.flat
+        self._shape = np.array(data.shape, dtype=np.intp)
+
+        # Number of elements to skip in the flattened array to move by one
+        # pixel along each dimension
+        self._steps = np.array([np.prod(data.shape[idim + 1:], dtype=np.intp)
+                                for idim in range(data.ndim)], dtype=np.intp)
+
+        self._value = float(data[self.start_coords])
+
+        # Pixels added to the region so far (as indices in the flattened
+        # array), and the values which give the level of the region after
+        # each of them was added (see _grow_kernel)
+        index_dtype = np.int32 if data.size < 2 ** 31 else np.int64
+        capacity = min(INITIAL_CAPACITY, data.size)
+        self._order = np.zeros(capacity, dtype=index_dtype)
+        self._order_values = np.zeros(capacity, dtype=native_dtype)
+        self._count = 0
+
+        # Pixels that have been reached by the flood, whether they are part of
+        # the region or are still waiting in the frontier.
+        self._queued = np.zeros(data.size, dtype=np.uint8)
+
+        # Binary heap of the levels and indices of pixels bordering the region
+        self._heap_levels = np.zeros(INITIAL_CAPACITY, dtype=float)
+        self._heap_indices = np.zeros(INITIAL_CAPACITY, dtype=index_dtype)
+        self._heap_size = 0
+
+        start = int(np.ravel_multi_index(self.start_coords, data.shape))
+        self._valid = self._level(self._flat[start]) < np.inf
+        if self._valid:
+            self._queued[start] = 1
+            self._heap_levels[0] = 1.
+            self._heap_indices[0] = start
+            self._heap_size = 1
+
+    @property
+    def nbytes(self):
+        """
+        The memory used by the engine, in bytes.
+        """
+        return (self._order.nbytes + self._order_values.nbytes + self._queued.nbytes +
+                self._heap_levels.nbytes + self._heap_indices.nbytes)
+
+    def _level(self, value):
+        """
+        The threshold above which a pixel with the given value is selected.
+        """
+        value = float(value)
+        if value > 0 and self._value > 0:
+            return max(value / self._value, self._value / value)
+        else:
+            return np.inf
+
+    def _enlarge(self):
+        """
+        Double the size of the buffers which are full.
+        """
+        if self._count == len(self._order):
+            capacity = min(2 * len(self._order), self.data.size)
+            self._order = _resize(self._order, capacity)
+            self._order_values = _resize(self._order_values, capacity)
+        if self._heap_size + 2 * self.data.ndim > len(self._heap_levels):
+            capacity = 2 * len(self._heap_levels)
+            self._heap_levels = _resize(self._heap_levels, capacity)
+            self._heap_indices = _resize(self._heap_indices, capacity)
+
+    def grow(self, threshold, max_growth=None):
+        """
+        Add all pixels with a level below ``threshold`` to the region.
+
+        This is called by :meth:`mask` and :meth:`cropped_mask`, but can be
+        called first to limit the number of pixels added.
+
+        Parameters
+        ----------
+        threshold : float
+            The threshold, which should be larger than one.
+        max_growth : int, optional
+            If specified, stop once this many pixels have been added.
+
+        Returns
+        -------
+        complete : bool
+            Whether the region is complete for this threshold (or has reached
+            ``max_pixels``).
+        """
+
+        max_count = self.data.size if self.max_pixels is None else self.max_pixels
+        limit = max_count if max_growth is None else min(max_count, self._count + max_growth)
+
+        while True:
+            if self.compiled:
+                status, heap_size, count = _get_compiled_kernel()(
+                    self._flat, self._shape, self._steps, self._value, threshold, limit,
+                    self._queued, self._heap_levels, self._heap_indices, self._heap_size,
+                    self._order, self._order_values, self._count)
+            else:
+                # Memoryviews and tuples give much faster access to single
+                # elements from Python than numpy arrays
+                status, heap_size, count = _grow_kernel(
+                    _view(self._flat), tuple(self._shape.tolist()),
+                    tuple(self._steps.tolist()), self._value, threshold, limit,
+                    _view(self._queued), _view(self._heap_levels), _view(self._heap_indices),
+                    self._heap_size, _view(self._order), _view(self._order_values),
+                    self._count)
+            self._heap_size, self._count = int(heap_size), int(count)
+            if status != FULL:
+                return status == DONE or self._count == max_count
+            self._enlarge()
+
+    def _region(self, threshold):
+        """
+        Return the indices of the pixels in the region for a given threshold.
+        """
+
+        self.grow(threshold)
+
+        # The level of the region increases as pixels are added, so the
+        # number of pixels below the threshold is found by bisection
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._level(self._order_values[middle]) < threshold:
+                low = middle + 1
+            else:
+                high = middle
+        count = low
+
+        # The region is only truncated if pixels below the threshold remain
+        # in the frontier, so narrowing the threshold clears this.
+        self.truncated = (count == self.max_pixels and
+                          self._heap_size > 0 and self._heap_levels[0] < threshold)
+
+        return self._order[:count]
+
+    def mask(self, threshold):
+        """
+        Compute the flood fill mask for a given threshold.
+
+        Parameters
+        ----------
+        threshold : float
+            The threshold, which should be larger than one.
+
+        Returns
+        -------
+        mask : `~numpy.ndarray` or `None`
+            A boolean mask with the same shape as the data, or `None` if the
+            starting pixel cannot be selected (for example because it is zero,
+            negative, or NaN).
+        """
+
+        if not self._valid:
+            return None
+
+        mask = np.zeros(self.data.size, dtype=bool)
+        mask[self._region(threshold)] = True
+
+        return mask.reshape(self.data.shape)
+
+    def cropped_mask(self, threshold):
+        """
+        Compute the flood fill mask for a given threshold, cropped to the
+        bounding box of the selected region.
+
+        This avoids allocating an array the size of the data when the region
+        is small.
+
+        Parameters
+        ----------
+        threshold : float
+            The threshold, which should be larger than one.
+
+        Returns
+        -------
+        slices : tuple of slice or `None`
+            The slices which give the bounding box of the region in the data,
+            or `None` if the starting pixel cannot be selected.
+        mask : `~numpy.ndarray` or `None`
+            A boolean mask with the shape of the bounding box, or `None` if
+            the starting pixel cannot be selected.
+        """
+
+        if not self._valid:
+            return None, None
+
+        region = self._region(threshold)
+
+        if len(region) == 0:
+            slices = (slice(0, 0),) * self.data.ndim
+            return slices, np.zeros((0,) * self.data.ndim, dtype=bool)
+
+        # The region is processed in chunks to limit the size of temporary
+        # arrays, first to find the bounding box and then to fill the mask
+        lower = np.array(self._shape)
+        upper = np.zeros_like(lower)
+        for start in range(0, len(region), CHUNK_SIZE):
+            chunk = region[start:start + CHUNK_SIZE]
+            for idim, (step, size) in enumerate(zip(self._steps, self._shape)):
+                coords = chunk // step % size
+                lower[idim] = min(lower[idim], coords.min())
+                upper[idim] = max(upper[idim], coords.max() + 1)
+
+        mask = np.zeros(upper - lower, dtype=bool)
+        flat_mask = mask.ravel()
+        for start in range(0, len(region), CHUNK_SIZE):
+            chunk = region[start:start + CHUNK_SIZE]
+            box_index = np.zeros(len(chunk), dtype=np.intp)
+            for step, size, lo, hi in zip(self._steps, self._shape, lower, upper):
+                box_index *= hi - lo
+                box_index += chunk // step % size - lo
+            flat_mask[box_index] = True
+
+        return tuple(slice(lo, hi) for lo, hi in zip(lower.tolist(), upper.tolist())), mask
+
+
+def _view(array):
+    # Return a memoryview of a numpy array if possible
+    if (isinstance(array, np.ndarray) and array.dtype.isnative and
+            array.dtype.char in ELEMENT_TYPES and array.flags.c_contiguous):
+        return memoryview(array)
+    return array
+
+
+def _resize(array, size):
+    # Return a copy of the array with the given size, keeping the values
+    new = np.zeros(size, dtype=array.dtype)
+    new[:len(array)] = array
+    return new
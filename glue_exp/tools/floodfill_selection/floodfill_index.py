@@ -0,0 +1,102 @@
+import numpy as np
+
+__all__ = ['log_values', 'FloodfillIndex']
+
+
+def log_values(data):
+    """
+    Compute the natural logarithm of the data as 32-bit floating-point values,
+    with NaN values for pixels that are zero or negative.
+    """
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.log(np.asarray(data, dtype=np.float32))
+
+
+class FloodfillIndex(object):
+    """
+    Index which gives the flood fill region around a starting pixel for any
+    threshold.
+
+    The selection criterion is the same as for
+    :func:`~glue_exp.tools.floodfill_selection.floodfill_scipy.floodfill_scipy`.
+    Since the regions for increasing thresholds are nested, they form a single
+    branch of a component tree, which can be represented by the lowest
+    threshold at which each pixel joins the region. This is computed once
+    using a morphological reconstruction by erosion, which propagates the
+    minimum over all paths from the starting pixel of the largest distance
+    (in log space) to the starting value along the path. The mask for any
+    threshold is then found with a single comparison, without labelling.
+
+    A single image-wide max-tree cannot be used here, since the selection
+    criterion is a band of values around the starting value rather than a
+    one-sided threshold, so the index is specific to the starting pixel. The
+    part that only depends on the image (the logarithm of the values) can be
+    computed in advance with :func:`log_values` and shared between indices.
+
+    Parameters
+    ----------
+    data : `~numpy.ndarray`
+        The data to flood fill.
+    start_coords : tuple
+        The coordinates of the starting pixel, in Numpy order.
+    log_data : `~numpy.ndarray`, optional
+        The result of :func:`log_values` for the data, if already available.
+    """
+
+    def __init__(self, data, start_coords, log_data=None):
+
+        from scipy.ndimage import generate_binary_structure
+        from skimage.morphology import reconstruction
+
+        self.data = data
+        self.start_coords = tuple(start_coords)
+
+        if log_data is None:
+            log_data = log_values(data)
+
+        start_value = log_data[self.start_coords]
+
+        if not np.isfinite(start_value):
+            self._levels = None
+            return
+
+        # Compute the distance of each pixel to the starting value
+        with np.errstate(invalid='ignore'):
+            distance = np.abs(log_data - start_value)
+        distance[np.isnan(distance)] = np.inf
+
+        marker = np.full(data.shape, np.inf, dtype=np.float32)
+        marker[self.start_coords] = 0
+
+        # Use the same connectivity as scipy.ndimage.label
+        footprint = generate_binary_structure(data.ndim, 1)
+
+        self._levels = reconstruction(marker, distance, method='erosion',
+                                      footprint=footprint).astype(np.float32)
+
+    @property
+    def nbytes(self):
+        """
+        The memory used by the index, in bytes.
+        """
+        return 0 if self._levels is None else self._levels.nbytes
+
+    def mask(self, threshold):
+        """
+        Compute the flood fill mask for a given threshold.
+
+        Parameters
+        ----------
+        threshold : float
+            The threshold, which should be larger than one.
+
+        Returns
+        -------
+        mask : `~numpy.ndarray` or `None`
+            A boolean mask with the same shape as the data, or `None` if the
+            starting pixel cannot be selected (for example because it is zero,
+            negative, or NaN).
+        """
+        if self._levels is None:
+            return None
+        return self._levels < np.float32(np.log(threshold))
@@ -0,0 +1,115 @@
+import numpy as np
+from numba import njit
+
+from .floodfill_incremental import ELEMENT_TYPES
+
+__all__ = ['floodfill_numba']
+
+
+@njit(cache=True)
+def _floodfill_kernel(flat, shape, steps, start, lower, upper, max_pixels, mask):
+
+    # The queue holds all the selected pixels in the order in which they were
+    # found, and is grown as needed.
+    queue = np.empty(1024, dtype=np.intp)
+    queue[0] = start
+    mask[start] = True
+    count = 1
+    position = 0
+
+    while position < count:
+
+        index = queue[position]
+        position += 1
+
+        for idim in range(len(shape)):
+
+            coord = (index // steps[idim]) % shape[idim]
+
+            for offset in (-1, 1):
+
+                if (offset < 0 and coord == 0) or (offset > 0 and coord == shape[idim] - 1):
+                    continue
+
+                neighbour = index + offset * steps[idim]
+
+                if mask[neighbour]:
+                    continue
+
+                value = flat[neighbour]
+
+                if value > lower and value < upper:
+
+                    if count == max_pixels:
+                        return
+
+                    mask[neighbour] = True
+
+                    if count == len(queue):
+                        new_queue = np.empty(2 * len(queue), dtype=np.intp)
+                        new_queue[:count] = queue
+                        queue = new_queue
+
+                    queue[count] = neighbour
+                    count += 1
+
+
+def floodfill_numba(data, start_coords, threshold, max_pixels=None):
+    """
+    Flood fill using a compiled queue-based algorithm.
+
+    This gives the same result as
+    :func:`~glue_exp.tools.floodfill_selection.floodfill_queue.floodfill_queue`
+    but requires `numba <https://numba.pydata.org>`_. Non-contiguous arrays,
+    arrays which are not in native byte order, and arrays of types not
+    supported by the compiled code (such as float16, which is converted to
+    float32) are copied before the flood fill.
+
+    Parameters
+    ----------
+    data : `~numpy.ndarray`
+        The data to flood fill.
+    start_coords : tuple
+        The coordinates of the starting pixel, in Numpy order.
+    threshold : float
+        Pixels are selected if their value lies strictly between
+        ``value / threshold`` and ``value * threshold``, where ``value`` is
+        the value at the starting pixel.
+    max_pixels : int, optional
+        If specified, the fill stops once this many pixels have been
+        selected.
+
+    Returns
+    -------
+    mask : `~numpy.ndarray` or `None`
+        A boolean mask with the same shape as the data, or `None` if the
+        starting pixel does not itself satisfy the selection criterion.
+    """
+
+    start_coords = tuple(start_coords)
+
+    value = data[start_coords]
+    lower = value / threshold
+    upper = value * threshold
+
+    if not lower < value < upper:
+        return None
+
+    shape = np.array(data.shape, dtype=np.intp)
+    steps = np.array([np.prod(data.shape[idim + 1:], dtype=np.intp)
+                      for idim in range(data.ndim)], dtype=np.intp)
+
+    # The compiled code needs data in native byte order, and float16 values
+    # can be represented exactly as float32
+    dtype = data.dtype.newbyteorder('=')
+    if dtype.char not in ELEMENT_TYPES:
+        dtype = np.float32 if dtype.char == 'e' else np.float64
+
+    mask = np.zeros(data.size, dtype=bool)
+
+    _floodfill_kernel(np.ascontiguousarray(data, dtype=dtype).ravel(), shape, steps,
+                      np.ravel_multi_index(start_coords, data.shape),
+                      float(lower), float(upper),
+                      data.size if max_pixels is None else max_pixels, mask)
+
+    return mask.reshape(data.shape)
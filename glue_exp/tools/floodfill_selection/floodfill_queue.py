@@ -0,0 +1,81 @@
+import numpy as np
+
+__all__ = ['floodfill_queue']
+
+
+def floodfill_queue(data, start_coords, threshold, max_pixels=None):
+    """
+    Flood fill which only visits pixels reachable from the starting pixel.
+
+    This uses the same selection criterion as
+    :func:`~glue_exp.tools.floodfill_selection.floodfill_scipy.floodfill_scipy`,
+    but rather than thresholding and labelling the whole array, the region is
+    grown outwards from the starting pixel one layer of neighbours at a time,
+    so that the cost scales with the size of the selected region.
+
+    Parameters
+    ----------
+    data : `~numpy.ndarray`
+        The data to flood fill.
+    start_coords : tuple
+        The coordinates of the starting pixel, in Numpy order.
+    threshold : float
+        Pixels are selected if their value lies strictly between
+        ``value / threshold`` and ``value * threshold``, where ``value`` is
+        the value at the starting pixel.
+    max_pixels : int, optional
+        If specified, the fill stops once this many pixels have been
+        selected. The pixels closest to the starting pixel (in number of steps)
+        are selected first.
+
+    Returns
+    -------
+    mask : `~numpy.ndarray` or `None`
+        A boolean mask with the same shape as the data, or `None` if the
+        starting pixel does not itself satisfy the selection criterion.
+    """
+
+    start_coords = tuple(start_coords)
+
+    value = data[start_coords]
+    lower = value / threshold
+    upper = value * threshold
+
+    if not lower < value < upper:
+        return None
+
+    mask = np.zeros(data.shape, dtype=bool)
+    mask[start_coords] = True
+    count = 1
+
+    # Coordinates of the pixels added in the last step, with shape (ndim, n)
+    front = np.array(start_coords, dtype=np.intp).reshape((-1, 1))
+
+    while front.shape[1] > 0 and (max_pixels is None or count < max_pixels):
+
+        # Find all neighbours of the current front that are inside the array
+        neighbours = []
+        for idim, size in enumerate(data.shape):
+            for offset in (-1, 1):
+                shifted = front.copy()
+                shifted[idim] += offset
+                inside = (shifted[idim] >= 0) & (shifted[idim] < size)
+                neighbours.append(shifted[:, inside])
+        neighbours = np.hstack(neighbours)
+
+        # Drop pixels that are already selected and remove duplicates
+        neighbours = neighbours[:, ~mask[tuple(neighbours)]]
+        index = np.ravel_multi_index(neighbours, data.shape)
+        neighbours = neighbours[:, np.unique(index, return_index=True)[1]]
+
+        # Keep the pixels that satisfy the selection criterion
+        values = data[tuple(neighbours)]
+        front = neighbours[:, (values > lower) & (values < upper)]
+
+        if max_pixels is not None:
+            front = front[:, :max_pixels - count]
+
+        mask[tuple(front)] = True
+        count += front.shape[1]
+
+    return mask
@@ -1,17 +1,52 @@
-from scipy.ndimage.measurements import label
+import numpy as np
+from scipy.ndimage import label
 
 
-def floodfill_scipy(data, start_coords, threshold):
+def floodfill_scipy(data, start_coords, threshold, out=None, labels=None):
+    """
+    Flood fill by thresholding and labelling the whole array.
+
+    Parameters
+    ----------
+    data : `~numpy.ndarray`
+        The data to flood fill. This is used as-is, without converting it to
+        floating-point values.
+    start_coords : tuple
+        The coordinates of the starting pixel, in Numpy order.
+    threshold : float
+        Pixels are selected if their value lies strictly between
+        ``value / threshold`` and ``value * threshold``, where ``value`` is
+        the value at the starting pixel.
+    out : `~numpy.ndarray`, optional
+        A boolean array with the same shape as ``data`` in which to store the
+        result. If this is given, no new boolean array is allocated, so the
+        same array can be re-used across calls.
+    labels : `~numpy.ndarray`, optional
+        An `~numpy.int32` array with the same shape as ``data`` to use as
+        scratch space for the labels, which can also be re-used across calls.
+
+    Returns
+    -------
+    mask : `~numpy.ndarray`
+        A boolean mask with the same shape as the data.
+    """
+
+    if out is None:
+        out = np.empty(data.shape, dtype=bool)
+
+    if labels is None:
+        labels = np.empty(data.shape, dtype=np.int32)
 
     # Determine value at the starting coordinates
     value = data[start_coords]
 
-    # Determine all pixels that match
-    mask = (data > value / threshold) & (data < value * threshold)
+    # Determine all pixels that match, using the label array as temporary
+    # storage for the second comparison to avoid allocating a new array
+    np.greater(data, value / threshold, out=out)
+    np.less(data, value * threshold, out=labels)
+    np.logical_and(out, labels, out=out)
 
     # Determine all individual chunks
-    labels, num_features = label(mask)
-
-    mask = labels == labels[start_coords]
+    label(out, output=labels)
 
-    return mask
+    return np.equal(labels, labels[start_coords], out=out)
@@ -4,21 +4,55 @@ import numpy as np
 from qtpy.QtWidgets import QMessageBox
 
 from glue.core import Data
+from glue.logger import logger
 
 from glue.viewers.matplotlib.qt.toolbar_mode import ToolbarModeBase
 
 from glue.core.edit_subset_mode import EditSubsetMode
-from glue.core.subset import MaskSubsetState
 
-from .floodfill_scipy import floodfill_scipy
+from glue_exp.utils.cache import LAYER_CACHE
+from glue_exp.utils.cost import Cost, TIME_BUDGET, choose_strategy, visible_slices
+from glue_exp.utils.plugins import viewer_tool
+from glue_exp.utils.profiling import INSTRUMENTATION
+from glue_exp.utils.pyramid import ImagePyramid, upsample_cropped_mask
+from glue_exp.utils.qt import CoalescingWorker
+from glue_exp.utils.subset import CroppedMaskSubsetState, crop_mask
 
-from glue.config import viewer_tool
+from .backends import floodfill, estimate_cost, select_backend
+from .floodfill_incremental import IncrementalFloodfill
+from .floodfill_index import FloodfillIndex, log_values
+from .floodfill_slabs import floodfill_slabs
 
 __all__ = ['FloodfillSelectionTool']
 
 ROOT = os.path.dirname(__file__)
 
-WARN_THRESH = 4000000  # warn when floodfilling large images
+MAX_PIXELS = 4000000  # maximum number of pixels selected by a single flood fill
+PREVIEW_PIXELS = 1000000  # maximum number of pixels used for previews while dragging
+
+# Maximum number of pixels added to the region by the incremental flood fill
+# for a single event, as a fraction of the slice, for the compiled and Python
+# versions. Beyond this, the whole slice is flood filled with a backend,
+# which is then faster.
+MAX_GROWTH_COMPILED = 0.02
+MAX_GROWTH_PYTHON = 0.002
+
+
+class _DragState(object):
+    """
+    State shared by the flood fill jobs for a single drag of the mouse.
+
+    A new instance is created each time the mouse is pressed and handed to
+    each job, so that jobs left over from a previous drag never affect the
+    current one. The jobs for a drag run one at a time.
+    """
+
+    def __init__(self):
+        # The incremental flood fill engine, re-used between move events
+        self.floodfill = None
+        # The fraction of the image selected in the latest preview, used to
+        # predict the cost of the full resolution selection
+        self.region_fraction = None
 
 
 @viewer_tool
@@ -35,6 +69,46 @@ class FloodfillSelectionTool(ToolbarModeBase):
     status_tip = ('Click to define a starting pixel and drag (keeping the '
                   'mouse clicked) to grow the selection.')
 
+    # By default, only the slice currently shown in the viewer is flood
+    # filled. If volumetric is True, the flood fill is instead carried out
+    # in all dimensions of the data when the mouse is released, in slabs of
+    # slab_size elements along the first dimension which are labelled using
+    # n_workers threads. While dragging, only the slice shown is flood filled.
+    volumetric = False
+    slab_size = 64
+    n_workers = 1
+
+    # Whether to compute the selection on a background thread, keeping the
+    # user interface responsive for large datasets
+    background = True
+
+    # Whether to show a selection computed on a downsampled version of the
+    # image while dragging, for images with more than PREVIEW_PIXELS pixels.
+    # The full resolution selection is then computed when the mouse is
+    # released.
+    preview = True
+
+    # Whether to build a FloodfillIndex in the background when the mouse is
+    # pressed, after which the selection for any threshold can be found
+    # without flood filling. This uses 8 bytes per pixel of the slice.
+    use_index = False
+
+    # The flood fill backend to use for full resolution selections on images
+    # with more than PREVIEW_PIXELS pixels, and for large changes in the
+    # selection on smaller images (see FLOODFILL_BACKENDS). By default, the
+    # backend expected to be fastest is selected based on the size of the
+    # region found in the preview.
+    backend = 'auto'
+
+    # When the mouse is released on an image with more than PREVIEW_PIXELS
+    # pixels, the cost of the full resolution selection is predicted and, if
+    # it exceeds time_budget seconds or memory_budget bytes, the selection is
+    # instead only computed in the part of the image visible in the viewer,
+    # or if that is still too expensive, the preview selection is kept. Either
+    # budget can be set to None to disable it.
+    time_budget = TIME_BUDGET
+    memory_budget = None
+
     def __init__(self, *args, **kwargs):
 
         super(FloodfillSelectionTool, self).__init__(*args, **kwargs)
@@ -42,9 +116,12 @@ class FloodfillSelectionTool(ToolbarModeBase):
         self._start_event = None
         self._end_event = None
         self._active_layer = None
-        self._large_ok = None
+        self._drag = _DragState()
+        self._index = None
+        self._worker = CoalescingWorker()
+        self._index_worker = CoalescingWorker()
 
-        self._move_callback = self._floodfill_roi
+        self._move_callback = self._floodfill_preview
         self._release_callback = self._floodfill_roi
 
     @property
@@ -74,28 +151,61 @@ class FloodfillSelectionTool(ToolbarModeBase):
             qmb.exec_()
             return
 
-        if not self._large_ok and visible_data_layers[0].layer.size > WARN_THRESH:
+        self._start_event = event
+        self._active_layer = visible_data_layers[0]
+        self._index = None
+
+        # Results of jobs for a previous drag are discarded, and any such job
+        # still running keeps using its own state
+        self._worker.cancel()
+        self._drag = _DragState()
 
-            message = ('The dataset you want to apply this tool to is large '
-                       'and you may run in to performance issues. Are you '
-                       'sure you want to continue? Note that if you press OK '
-                       'this warning will no longer be shown for this viewer. '
-                       'You will need to start the selection again once this '
-                       'dialog is closed.')
+        if self.use_index and event.xdata is not None and event.ydata is not None:
+            self._build_index(self._active_layer.layer, self._active_layer.attribute,
+                              (int(round(event.xdata)), int(round(event.ydata))))
 
-            buttons = QMessageBox.Ok | QMessageBox.Cancel
-            result = QMessageBox.warning(self.viewer, 'Large data warning',
-                                         message, buttons=buttons,
-                                         defaultButton=QMessageBox.Cancel)
+        super(FloodfillSelectionTool, self).press(event)
 
-            if result == QMessageBox.Ok:
-                self._large_ok = True
+    def activate(self):
+        super(FloodfillSelectionTool, self).activate()
+        # Start computing the part of the index which only depends on the
+        # data, so that it is ready by the time the mouse is pressed.
+        if self.use_index:
+            visible_data_layers = self.visible_data_layers
+            if len(visible_data_layers) == 1:
+                self._build_index(visible_data_layers[0].layer,
+                                  visible_data_layers[0].attribute)
+
+    def _build_index(self, data, att, xy=None):
+        """
+        Build a flood fill index in the background for the slice shown in the
+        viewer, starting from pixel ``xy`` (if specified).
+        """
 
+        if data is None or att is None or self.volumetric:
             return
 
-        self._start_event = event
-        self._active_layer = visible_data_layers[0]
-        super(FloodfillSelectionTool, self).press(event)
+        slices = self.viewer.state.wcsaxes_slice[::-1]
+        view = tuple(slice(None) if s in ('x', 'y') else s for s in slices)
+        values = LAYER_CACHE.get(data, att, view)
+
+        def compute():
+            log_data = LAYER_CACHE.get(data, att, view, name='log',
+                                       factory=lambda: log_values(values))
+            if xy is None:
+                return None
+            start_coord = tuple(xy[0] if s == 'x' else xy[1] for s in slices if s in ('x', 'y'))
+            return FloodfillIndex(values, start_coord, log_data=log_data)
+
+        def apply(index):
+            if index is not None:
+                logger.info("Built flood fill index using {0:.1f} MB "
+                            "(and {1:.1f} MB for the cached logarithm of the "
+                            "data)".format(index.nbytes / 1024 ** 2,
+                                           values.size * 4 / 1024 ** 2))
+                self._index = index
+
+        self._index_worker.submit(compute, apply)
 
     def move(self, event):
         if self._start_event is None:
@@ -111,7 +221,13 @@ class FloodfillSelectionTool(ToolbarModeBase):
         self._start_event = None
         self._end_event = None
 
-    def _floodfill_roi(self, mode):
+    def _floodfill_preview(self, mode):
+        """
+        Callback for FloodfillSelectionTool while dragging.
+        """
+        self._floodfill_roi(mode, preview=True)
+
+    def _floodfill_roi(self, mode, preview=False):
         """
         Callback for FloodfillSelectionTool.
         """
@@ -135,25 +251,253 @@ class FloodfillSelectionTool(ToolbarModeBase):
         x = int(round(mode._start_event.xdata))
         y = int(round(mode._start_event.ydata))
 
-        start_coord = self.viewer.state.wcsaxes_slice[::-1]
-        start_coord[start_coord.index('x')] = x
-        start_coord[start_coord.index('y')] = y
-        start_coord = tuple(start_coord)
-
         # We convert the length in relative figure units to a threshold - we make
-        # it so that moving by 0.1 produces a threshold of 1.1, 0.2 -> 2, 0.3 -> 11
+        # it so that not moving produces a threshold of 1.1, 0.1 -> 2, 0.2 -> 11
         # etc
         threshold = 1 + 10 ** (length / 0.1 - 1)
 
-        # coordinate should be integers as index for array
-        values = np.asarray(data[att], dtype=float)
-        mask = floodfill_scipy(values, start_coord, threshold)
+        slices = self.viewer.state.wcsaxes_slice[::-1]
+
+        # Flood filling the whole data on every move would be too slow, so
+        # the slice shown is used as a preview
+        volumetric = self.volumetric and not preview
+
+        if volumetric:
+            view = None
+            start_coord = tuple(x if s == 'x' else y if s == 'y' else s for s in slices)
+        else:
+            # Only the slice shown in the viewer is flood filled
+            view = tuple(slice(None) if s in ('x', 'y') else s for s in slices)
+            start_coord = tuple(x if s == 'x' else y for s in slices if s in ('x', 'y'))
+
+        # We get the values here rather than in the background thread since
+        # the cache may need to subscribe to the hub for the data.
+        with INSTRUMENTATION.stage('floodfill', 'values'):
+            values = LAYER_CACHE.get(data, att, view)
+
+        # Find the part of the slice visible in the viewer, in the same order
+        # as the dimensions of the slice
+        if volumetric:
+            window = None
+        else:
+            displayed = [s for s in slices if s in ('x', 'y')]
+            sizes = dict(zip(displayed, values.shape))
+            ywindow, xwindow = visible_slices(self.viewer.axes, (sizes['y'], sizes['x']))
+            window = tuple(xwindow if s == 'x' else ywindow for s in displayed)
+
+        # The state is passed to the job rather than read from the tool in
+        # the background thread, since it is replaced when the mouse is pressed
+        drag, index = self._drag, self._index
+
+        def compute():
+            with INSTRUMENTATION.stage('floodfill', 'mask', size=values.size, preview=preview):
+                return self._compute_mask(data, att, view, values, start_coord, threshold,
+                                          preview, drag, index=index, window=window,
+                                          volumetric=volumetric)
+
+        def apply(cropped):
+            self._apply_mask(data, cropped)
+
+        if self.background:
+            self._worker.submit(compute, apply)
+        else:
+            apply(compute())
+
+    def _compute_mask(self, data, att, view, values, start_coord, threshold, preview, drag,
+                      index=None, window=None, volumetric=False):
+        """
+        Compute the flood fill mask - this may be called from a background
+        thread, so should not interact with the user interface, and only
+        updates the state of the drag given by ``drag``.
+
+        The mask is returned cropped to the bounding box of the selection, as
+        a tuple of ``(slices, mask)``, or `None` if the starting pixel could
+        not be selected. If ``volumetric`` is `True`, the whole data is flood
+        filled rather than a slice.
+        """
+
+        if volumetric:
+            mask = floodfill_slabs(values, start_coord, threshold,
+                                   slab_size=self.slab_size, n_workers=self.n_workers)
+            return None if mask is None else crop_mask(mask)
+
+        shape = values.shape
+        cropped = None
+
+        if index is not None and index.data is values and index.start_coords == start_coord:
+
+            slice_mask = index.mask(threshold)
+
+        elif self.preview and values.size > PREVIEW_PIXELS:
+
+            if preview:
+                strategy = 'preview'
+            else:
+                strategy = self._choose_strategy(values, start_coord, window,
+                                                 drag.region_fraction)
+
+            if strategy == 'preview':
 
-        if mask is not None:
-            cids = data.pixel_component_ids
-            subset_state = MaskSubsetState(mask, cids)
+                # Flood fill a downsampled version of the image, which is
+                # computed once and then kept for subsequent selections
+                pyramid = LAYER_CACHE.get(data, att, view, name='pyramid',
+                                          factory=lambda: ImagePyramid(values))
+                factor, values = pyramid.level(PREVIEW_PIXELS)
+
+                preview_coord = tuple(min(c // factor, n - 1)
+                                      for c, n in zip(start_coord, values.shape))
+                preview_cropped = self._incremental_mask(values, preview_coord, threshold,
+                                                         drag, cropped=True)
+
+                # Only the bounding box of the selection is upsampled, so
+                # that nothing the size of the full image is computed
+                slice_mask = None
+
+                if preview_cropped is not None:
+                    slices, preview_mask = preview_cropped
+                    drag.region_fraction = np.count_nonzero(preview_mask) / values.size
+                    cropped = upsample_cropped_mask(slices, preview_mask, factor,
+                                                    values.shape, shape)
+
+            elif strategy == 'window':
+
+                window_coord = tuple(c - s.start for c, s in zip(start_coord, window))
+                window_mask = floodfill(values[window], window_coord, threshold,
+                                        backend=self.backend, max_pixels=MAX_PIXELS,
+                                        region_fraction=self._window_fraction(
+                                            values, window, drag.region_fraction))
+
+                slice_mask = None
+
+                if window_mask is not None:
+                    slices, window_mask = crop_mask(window_mask)
+                    cropped = (tuple(slice(s.start + w.start, s.stop + w.start)
+                                     for s, w in zip(slices, window)), window_mask)
+
+            else:
+
+                slice_mask = floodfill(values, start_coord, threshold, backend=self.backend,
+                                       max_pixels=MAX_PIXELS,
+                                       region_fraction=drag.region_fraction)
+
+            if strategy != 'full' and not preview:
+                logger.info("Flood fill selection was computed using the {0} strategy "
+                            "to stay within the time and memory budget".format(strategy))
+
+        else:
+
+            # The incremental engine can directly give the cropped mask
+            # without computing the mask for the whole slice
+            cropped = self._incremental_mask(values, start_coord, threshold, drag,
+                                             cropped=True)
+            slice_mask = None
+
+        if slice_mask is not None:
+            cropped = crop_mask(slice_mask)
+
+        if cropped is None:
+            return None
+
+        # Add back the dimensions of the data that are not shown
+        slices, mask = cropped
+        slices = iter(slices)
+        slices = tuple(next(slices) if isinstance(s, slice) else slice(s, s + 1) for s in view)
+        mask = mask.reshape(tuple(s.stop - s.start for s in slices))
+
+        return slices, mask
+
+    def _window_fraction(self, values, window, region_fraction):
+        """
+        The expected fraction of the window selected, assuming that the region
+        found in the preview is inside the window.
+        """
+        if region_fraction is None:
+            return None
+        window_size = np.prod([s.stop - s.start for s in window])
+        return min(1., region_fraction * values.size / max(window_size, 1))
+
+    def _choose_strategy(self, values, start_coord, window, region_fraction):
+        """
+        Choose whether to compute the selection for the whole image
+        (``'full'``), only for the part visible in the viewer (``'window'``),
+        or to keep the preview selection (``'preview'``).
+        """
+
+        def cost(shape, region_fraction):
+            backend = self.backend
+            if backend == 'auto':
+                backend = select_backend(shape, values.dtype, region_fraction=region_fraction,
+                                         max_pixels=MAX_PIXELS)
+            return estimate_cost(shape, values.dtype, backend,
+                                 region_fraction=region_fraction, max_pixels=MAX_PIXELS)
+
+        costs = [('full', cost(values.shape, region_fraction))]
+
+        if window is not None and all(s.start <= c < s.stop for c, s in zip(start_coord, window)):
+            window_shape = tuple(s.stop - s.start for s in window)
+            costs.append(('window', cost(window_shape,
+                                         self._window_fraction(values, window, region_fraction))))
+
+        # The preview is already available, and only needs to be upsampled
+        costs.append(('preview', Cost(0., values.size)))
+
+        return choose_strategy(costs, time_budget=self.time_budget,
+                               memory_budget=self.memory_budget)
+
+    def _incremental_mask(self, values, start_coord, threshold, drag, cropped=False):
+        """
+        Compute the flood fill mask for a 2D image, re-using the flood fill
+        engine from the previous call for the same drag if possible. If
+        ``cropped`` is `True`, the mask is returned cropped to the bounding
+        box of the selection, as a tuple of ``(slices, mask)``.
+        """
+
+        # The flood fill engine is kept for the duration of the drag so that
+        # each move event only needs to grow or shrink the previous region.
+        # Since the values are cached, they are the same object for as long as
+        # the data does not change.
+        engine = drag.floodfill
+        if engine is None or engine.data is not values or engine.start_coords != start_coord:
+            engine = drag.floodfill = IncrementalFloodfill(values, start_coord,
+                                                           max_pixels=MAX_PIXELS)
+
+        # The incremental flood fill is slower per pixel than labelling the
+        # whole slice, so large changes are done with a backend instead.
+        if engine.compiled:
+            max_growth = int(MAX_GROWTH_COMPILED * values.size)
+        else:
+            max_growth = int(MAX_GROWTH_PYTHON * values.size)
+
+        if not engine.grow(threshold, max_growth=max_growth):
+            mask = floodfill(values, start_coord, threshold, backend=self.backend,
+                             max_pixels=MAX_PIXELS)
+            if cropped:
+                return None if mask is None else crop_mask(mask)
+            return mask
+
+        if cropped:
+            slices, mask = engine.cropped_mask(threshold)
+            result = None if slices is None else (slices, mask)
+        else:
+            result = engine.mask(threshold)
+
+        if engine.truncated:
+            logger.info("Flood fill selection was limited to {0} pixels".format(MAX_PIXELS))
+
+        return result
+
+    def _apply_mask(self, data, cropped):
+        """
+        Update the edit subset using the flood fill mask, cropped to the
+        bounding box of the selection.
+        """
+        if cropped is not None:
+            with INSTRUMENTATION.stage('floodfill', 'subset_state'):
+                slices, mask = cropped
+                subset_state = CroppedMaskSubsetState(slices, mask, data.pixel_component_ids)
             try:
                 mode = self.viewer.session.edit_subset_mode
             except AttributeError:
                 mode = EditSubsetMode()
-            mode.update(data, subset_state, focus_data=data)
+            with INSTRUMENTATION.stage('floodfill', 'update'):
+                mode.update(data, subset_state, focus_data=data)
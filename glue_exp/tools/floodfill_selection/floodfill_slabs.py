@@ -0,0 +1,111 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy.ndimage import label
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+__all__ = ['floodfill_slabs']
+
+
+def _label_slab(data, lower, upper):
+    mask = data > lower
+    mask &= data < upper
+    labels, num_features = label(mask, output=np.int32)
+    # The labels are kept until all slabs have been labelled, so they are
+    # stored with the smallest type that can hold them
+    return labels.astype(np.min_scalar_type(num_features)), num_features
+
+
+def floodfill_slabs(data, start_coords, threshold, slab_size=64, n_workers=1):
+    """
+    Flood fill in all dimensions by labelling the data in slabs.
+
+    The data is split into slabs along the first dimension, each slab is
+    thresholded and labelled independently (optionally in parallel), and the
+    labels are then stitched together across the slab boundaries. This makes
+    it possible to use several cores for large cubes. The thresholded data
+    and the 32-bit labels are only ever allocated for one slab at a time (per
+    worker), but the labels of all the slabs are kept until they have been
+    stitched together, stored with the smallest integer type that can hold the
+    number of regions in each slab (usually one or two bytes per element).
+
+    Parameters
+    ----------
+    data : `~numpy.ndarray`
+        The data to flood fill.
+    start_coords : tuple
+        The coordinates of the starting pixel, in Numpy order.
+    threshold : float
+        Pixels are selected if their value lies strictly between
+        ``value / threshold`` and ``value * threshold``, where ``value`` is
+        the value at the starting pixel.
+    slab_size : int, optional
+        The number of elements along the first dimension in each slab.
+    n_workers : int, optional
+        The number of threads to use to label the slabs.
+
+    Returns
+    -------
+    mask : `~numpy.ndarray` or `None`
+        A boolean mask with the same shape as the data, or `None` if the
+        starting pixel does not itself satisfy the selection criterion.
+    """
+
+    start_coords = tuple(start_coords)
+
+    value = data[start_coords]
+    lower = value / threshold
+    upper = value * threshold
+
+    if not lower < value < upper:
+        return None
+
+    starts = list(range(0, data.shape[0], slab_size))
+    slabs = [data[start:start + slab_size] for start in starts]
+
+    if n_workers > 1:
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            results = list(executor.map(_label_slab, slabs,
+                                        [lower] * len(slabs), [upper] * len(slabs)))
+    else:
+        results = [_label_slab(slab, lower, upper) for slab in slabs]
+
+    # The labels are only unique within each slab, so they are offset when
+    # they are compared across slabs. We keep 0 to mean 'not selected'.
+    offsets = np.cumsum([0] + [num_features for labels, num_features in results])
+
+    def global_labels(labels, offset):
+        labels = labels.astype(np.int64)
+        labels[labels > 0] += offset
+        return labels
+
+    # Find which labels touch across each slab boundary, and merge them into
+    # connected components. Each pair of labels is only kept once, since most
+    # pixels along a boundary usually belong to the same few regions.
+    pairs = []
+    for (labels1, _), (labels2, _), offset1, offset2 in zip(results[:-1], results[1:],
+                                                            offsets[:-2], offsets[1:-1]):
+        last, first = global_labels(labels1[-1], offset1), global_labels(labels2[0], offset2)
+        touching = (last > 0) & (first > 0)
+        pairs.append(np.unique(np.vstack([last[touching], first[touching]]), axis=1))
+    pairs = np.hstack(pairs) if pairs else np.zeros((2, 0), dtype=np.int64)
+
+    n_labels = offsets[-1] + 1
+    graph = coo_matrix((np.ones(pairs.shape[1]), (pairs[0], pairs[1])),
+                       shape=(n_labels, n_labels))
+    n_components, components = connected_components(graph, directed=False)
+
+    # Find all the labels that are in the same component as the starting pixel
+    islab = start_coords[0] // slab_size
+    start_label = results[islab][0][(start_coords[0] - starts[islab],) + start_coords[1:]]
+    selected = components == components[start_label + offsets[islab]]
+
+    mask = np.empty(data.shape, dtype=bool)
+    for start, (labels, num_features), offset in zip(starts, results, offsets):
+        # Look up the labels of the slab, with 0 still meaning 'not selected'
+        slab_selected = selected[offset:offset + num_features + 1].copy()
+        slab_selected[0] = False
+        mask[start:start + slab_size] = slab_selected[labels]
+
+    return mask
@@ -0,0 +1,524 @@
+import threading
+import tracemalloc
+from importlib.util import find_spec
+
+import numpy as np
+import pytest
+
+from glue.core import Data
+from glue.viewers.image.qt import ImageViewer
+from glue.app.qt import GlueApplication
+from glue.utils.qt import get_qapp
+
+from glue_exp.utils.profiling import INSTRUMENTATION
+
+from ..floodfill_scipy import floodfill_scipy
+from ..floodfill_slabs import floodfill_slabs
+from ..floodfill_queue import floodfill_queue
+from ..floodfill_incremental import IncrementalFloodfill
+from ..floodfill_index import FloodfillIndex, log_values
+from ..backends import FLOODFILL_BACKENDS, floodfill, calibrate, select_backend
+from .. import floodfill_selection
+
+THRESHOLDS = [1.05, 1.2, 1.5, 1.1, 3., 1.01, 11., 2.]
+
+# Whether to test the incremental flood fill with and without compiled code
+COMPILED = [False, True] if find_spec('numba') is not None else [False]
+
+
+@pytest.mark.parametrize('compiled', COMPILED)
+@pytest.mark.parametrize('shape', [(30, 40), (8, 9, 10)])
+def test_incremental_matches_scipy(shape, compiled):
+
+    np.random.seed(12345)
+    data = np.random.uniform(0.5, 2., shape)
+    start_coords = tuple(n // 2 for n in shape)
+
+    floodfill = IncrementalFloodfill(data, start_coords, compiled=compiled)
+    assert floodfill.compiled is compiled
+
+    # Thresholds go both up and down to exercise growing and shrinking
+    for threshold in THRESHOLDS:
+        expected = floodfill_scipy(data, start_coords, threshold)
+        np.testing.assert_equal(floodfill.mask(threshold), expected)
+
+
+def test_incremental_invalid_start():
+    data = np.array([[1., 0.], [np.nan, -1.]])
+    for start_coords in [(0, 1), (1, 0), (1, 1)]:
+        assert IncrementalFloodfill(data, start_coords).mask(2.) is None
+
+
+@pytest.mark.parametrize('compiled', COMPILED)
+def test_incremental_max_pixels(compiled):
+    data = np.ones((20, 20))
+    floodfill = IncrementalFloodfill(data, (10, 10), max_pixels=50, compiled=compiled)
+    assert floodfill.mask(2.).sum() == 50
+    assert floodfill.truncated
+    # Narrowing the threshold so that fewer pixels are selected clears this
+    data[:, 11] = 10.
+    floodfill = IncrementalFloodfill(data, (10, 11), max_pixels=50, compiled=compiled)
+    assert floodfill.mask(20.).sum() == 50
+    assert floodfill.truncated
+    assert floodfill.mask(2.).sum() == 20
+    assert not floodfill.truncated
+
+
+@pytest.mark.parametrize('shape', [(30, 40), (8, 9, 10)])
+def test_queue_matches_scipy(shape):
+
+    np.random.seed(12345)
+    data = np.random.uniform(0.5, 2., shape)
+    start_coords = tuple(n // 2 for n in shape)
+
+    for threshold in THRESHOLDS:
+        expected = floodfill_scipy(data, start_coords, threshold)
+        np.testing.assert_equal(floodfill_queue(data, start_coords, threshold), expected)
+
+
+def test_queue_max_pixels():
+
+    data = np.ones((20, 20))
+
+    mask = floodfill_queue(data, (10, 10), 2., max_pixels=50)
+    assert mask.sum() == 50
+
+    # The pixels closest to the starting pixel are selected first
+    assert mask[10, 8:13].all()
+    assert not mask[0].any()
+
+
+def test_queue_invalid_start():
+    data = np.array([[1., 0.], [np.nan, -1.]])
+    for start_coords in [(0, 1), (1, 0), (1, 1)]:
+        assert floodfill_queue(data, start_coords, 2.) is None
+
+
+def test_scipy_reuse_buffers():
+
+    np.random.seed(12345)
+    data = np.random.uniform(0.5, 2., (30, 40))
+
+    out = np.zeros(data.shape, dtype=bool)
+    labels = np.zeros(data.shape, dtype=np.int32)
+
+    for threshold in THRESHOLDS:
+        expected = floodfill_scipy(data, (15, 20), threshold)
+        result = floodfill_scipy(data, (15, 20), threshold, out=out, labels=labels)
+        assert result is out
+        np.testing.assert_equal(result, expected)
+
+
+@pytest.mark.parametrize('compiled', COMPILED)
+@pytest.mark.parametrize('dtype', [np.uint8, np.int32, np.float16, np.float32, '>f8'])
+def test_incremental_native_dtype(dtype, compiled):
+
+    np.random.seed(12345)
+    data = np.random.randint(1, 100, (30, 40)).astype(dtype)
+
+    # Use a non-contiguous view to make sure no copy is needed (unless
+    # compiled code is used)
+    view = data[:, ::2]
+
+    floodfill = IncrementalFloodfill(view, (15, 10), compiled=compiled)
+
+    for threshold in THRESHOLDS:
+        expected = floodfill_scipy(view.astype(float), (15, 10), threshold)
+        np.testing.assert_equal(floodfill.mask(threshold), expected)
+
+
+@pytest.mark.parametrize('compiled', COMPILED)
+def test_incremental_max_growth(compiled):
+
+    data = np.ones((20, 20))
+    floodfill = IncrementalFloodfill(data, (10, 10), compiled=compiled)
+
+    # The region is grown by at most max_growth pixels at a time
+    assert not floodfill.grow(2., max_growth=100)
+    assert not floodfill.grow(2., max_growth=250)
+    assert floodfill.grow(2., max_growth=100)
+    assert floodfill.grow(1.5, max_growth=0)
+    assert floodfill.mask(2.).all()
+
+
+def test_incremental_memory():
+
+    # The buffers used by the engine should scale with the size of the
+    # region rather than use Python objects for each pixel
+    data = np.ones((300, 300), dtype=np.float32)
+    floodfill = IncrementalFloodfill(data, (150, 150))
+    assert floodfill.nbytes < data.nbytes
+    assert floodfill.mask(2.).all()
+    assert floodfill.nbytes < 2.5 * data.nbytes
+
+
+def test_incremental_cropped_mask():
+
+    data = np.ones((20, 30))
+    data[5:8, 10:15] = 10.
+
+    floodfill = IncrementalFloodfill(data, (6, 12))
+
+    slices, mask = floodfill.cropped_mask(2.)
+    assert slices == (slice(5, 8), slice(10, 15))
+    assert mask.shape == (3, 5) and mask.all()
+
+    full = np.zeros(data.shape, dtype=bool)
+    full[slices] = mask
+    np.testing.assert_equal(full, floodfill.mask(2.))
+
+    assert IncrementalFloodfill(data * 0, (6, 12)).cropped_mask(2.) == (None, None)
+
+
+@pytest.mark.parametrize(('slab_size', 'n_workers'), [(1, 1), (3, 1), (4, 2), (100, 1)])
+def test_slabs_matches_scipy(slab_size, n_workers):
+
+    np.random.seed(12345)
+    data = np.random.uniform(0.5, 2., (10, 12, 14))
+
+    for threshold in THRESHOLDS:
+        expected = floodfill_scipy(data, (5, 6, 7), threshold)
+        result = floodfill_slabs(data, (5, 6, 7), threshold,
+                                 slab_size=slab_size, n_workers=n_workers)
+        np.testing.assert_equal(result, expected)
+
+
+def test_slabs_memory():
+
+    # The labels of each slab are kept with the smallest type that can hold
+    # them, so that only about one byte per element is used in addition to
+    # the output mask and the temporary arrays for one slab
+    data = np.ones((64, 100, 100), dtype=np.float32)
+    tracemalloc.start()
+    try:
+        mask = floodfill_slabs(data, (0, 0, 0), 2., slab_size=8)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert mask.all()
+    assert peak < 3 * data.size
+
+
+def test_slabs_invalid_start():
+    assert floodfill_slabs(np.zeros((3, 4, 5)), (1, 2, 3), 2.) is None
+
+
+class Event(object):
+
+    def __init__(self, x, y, xdata=None, ydata=None, canvas=None):
+        self.x = x
+        self.y = y
+        self.xdata = xdata
+        self.ydata = ydata
+        self.canvas = canvas
+        self.button = 1
+
+
+class TestFloodfillTool(object):
+
+    def setup_method(self, method):
+        self.cube = Data(label='cube', x=np.ones((4, 5, 6)))
+        self.application = GlueApplication()
+        self.application.data_collection.append(self.cube)
+        self.viewer = self.application.new_data_viewer(ImageViewer)
+        self.viewer.add_data(self.cube)
+        self.viewer.toolbar.active_tool = 'Flood fill'
+        self.tool = self.viewer.toolbar.tools['Flood fill']
+
+    def teardown_method(self, method):
+        self.viewer.close(warn=False)
+        self.viewer = None
+        self.application.close()
+        self.application = None
+
+    def drag(self, x, y, length):
+        canvas = self.viewer.axes.figure.canvas
+        self.tool.press(Event(0, 0, x, y, canvas))
+        self.tool.move(Event(length, 0, canvas=canvas))
+        self.tool.release(Event(length, 0, canvas=canvas))
+        self.tool._worker.wait()
+        get_qapp().processEvents()
+
+    def test_slice(self):
+        self.viewer.state.slices = (2, 0, 0)
+        self.drag(3, 2, 50)
+        mask = self.cube.subsets[0].to_mask()
+        assert mask[2].all()
+        assert mask.sum() == 30
+        # Only the bounding box of the selection is stored
+        subset_state = self.cube.subsets[0].subset_state
+        assert subset_state.slices == (slice(2, 3), slice(0, 5), slice(0, 6))
+
+    @pytest.mark.parametrize('max_growth', [0., 1.])
+    def test_max_growth(self, monkeypatch, max_growth):
+
+        # Large changes in the selection are computed with a backend rather
+        # than with the incremental flood fill
+        monkeypatch.setattr(floodfill_selection, 'MAX_GROWTH_COMPILED', max_growth)
+        monkeypatch.setattr(floodfill_selection, 'MAX_GROWTH_PYTHON', max_growth)
+
+        self.viewer.state.slices = (2, 0, 0)
+        self.drag(3, 2, 50)
+
+        mask = self.cube.subsets[0].to_mask()
+        assert mask[2].all()
+        assert mask.sum() == 30
+        assert (self.tool._drag.floodfill._count > 0) is (max_growth > 0)
+
+    def test_press_during_job(self, monkeypatch):
+
+        # A job still running when the mouse is pressed again keeps using the
+        # state of its own drag, and its result is discarded
+        self.viewer.state.slices = (2, 0, 0)
+        canvas = self.viewer.axes.figure.canvas
+
+        original = self.tool._compute_mask
+        started = threading.Event()
+        resume = threading.Event()
+        drags = []
+
+        def compute_mask(*args, **kwargs):
+            drags.append(args[7])
+            started.set()
+            resume.wait(10)
+            return original(*args, **kwargs)
+
+        monkeypatch.setattr(self.tool, '_compute_mask', compute_mask)
+
+        self.tool.press(Event(0, 0, 3, 2, canvas))
+        self.tool.move(Event(50, 0, canvas=canvas))
+        assert started.wait(10)
+
+        self.tool.press(Event(0, 0, 3, 2, canvas))
+        drag = self.tool._drag
+        resume.set()
+        self.tool._worker.wait()
+        get_qapp().processEvents()
+
+        assert drags[0] is not drag
+        assert drags[0].floodfill is not None
+        assert drag.floodfill is None
+        assert len(self.cube.subsets) == 0
+
+    def test_instrumentation(self):
+        INSTRUMENTATION.enable()
+        try:
+            self.drag(3, 2, 50)
+        finally:
+            INSTRUMENTATION.disable()
+        stages = set(record['stage'] for record in INSTRUMENTATION.records(tool='floodfill'))
+        assert stages == {'values', 'mask', 'subset_state', 'update'}
+        INSTRUMENTATION.clear()
+
+    def test_volumetric(self):
+
+        self.tool.volumetric = True
+        self.viewer.state.slices = (2, 0, 0)
+
+        # While dragging, only the slice shown is flood filled
+        canvas = self.viewer.axes.figure.canvas
+        self.tool.press(Event(0, 0, 3, 2, canvas))
+        self.tool.move(Event(50, 0, canvas=canvas))
+        self.tool._worker.wait()
+        get_qapp().processEvents()
+
+        mask = self.cube.subsets[0].to_mask()
+        assert mask[2].all()
+        assert mask.sum() == 30
+
+        self.tool.release(Event(50, 0, canvas=canvas))
+        self.tool._worker.wait()
+        get_qapp().processEvents()
+
+        assert self.cube.subsets[0].to_mask().all()
+
+    def test_index(self):
+
+        self.tool.use_index = True
+        self.viewer.state.slices = (2, 0, 0)
+
+        canvas = self.viewer.axes.figure.canvas
+        self.tool.press(Event(0, 0, 3, 2, canvas))
+        self.tool._index_worker.wait()
+        get_qapp().processEvents()
+
+        assert self.tool._index is not None
+        assert self.tool._index.start_coords == (2, 3)
+
+        self.tool.move(Event(50, 0, canvas=canvas))
+        self.tool.release(Event(50, 0, canvas=canvas))
+        self.tool._worker.wait()
+        get_qapp().processEvents()
+
+        mask = self.cube.subsets[0].to_mask()
+        assert mask[2].all()
+        assert mask.sum() == 30
+
+        # The incremental flood fill should not have been needed
+        assert self.tool._drag.floodfill is None
+
+    def test_preview(self, monkeypatch):
+
+        # Make a checkerboard so that the downsampled image is uniform, and
+        # check that the preview then selects the whole slice while the final
+        # selection only includes the starting pixel.
+
+        monkeypatch.setattr(floodfill_selection, 'PREVIEW_PIXELS', 10)
+
+        self.cube.update_components({self.cube.id['x']: 1 + np.indices((4, 5, 6)).sum(axis=0) % 2})
+        self.viewer.state.slices = (2, 0, 0)
+
+        canvas = self.viewer.axes.figure.canvas
+        self.tool.press(Event(0, 0, 2, 2, canvas))
+        self.tool.move(Event(12, 0, canvas=canvas))
+        self.tool._worker.wait()
+        get_qapp().processEvents()
+
+        mask = self.cube.subsets[0].to_mask()
+        assert mask[2].all()
+
+        self.tool.release(Event(12, 0, canvas=canvas))
+        self.tool._worker.wait()
+        get_qapp().processEvents()
+
+        mask = self.cube.subsets[0].to_mask()
+        assert mask.sum() == 1 and mask[2, 2, 2]
+
+    def test_budget_preview(self, monkeypatch):
+
+        # If the time budget is zero, the preview selection should be kept
+        # when the mouse is released
+
+        monkeypatch.setattr(floodfill_selection, 'PREVIEW_PIXELS', 10)
+
+        self.cube.update_components({self.cube.id['x']: 1 + np.indices((4, 5, 6)).sum(axis=0) % 2})
+        self.viewer.state.slices = (2, 0, 0)
+        self.tool.time_budget = 0.
+
+        self.drag(2, 2, 12)
+
+        mask = self.cube.subsets[0].to_mask()
+        assert mask[2].all()
+
+    def test_budget_window(self, monkeypatch):
+
+        # If the full selection exceeds the memory budget, the selection
+        # should only be computed in the part of the image that is visible
+
+        monkeypatch.setattr(floodfill_selection, 'PREVIEW_PIXELS', 10)
+
+        self.viewer.state.slices = (2, 0, 0)
+        self.viewer.state.aspect = 'auto'
+        self.viewer.state.x_min, self.viewer.state.x_max = 1.5, 3.5
+        self.viewer.state.y_min, self.viewer.state.y_max = 1.5, 3.5
+        self.tool.backend = 'queue'
+        self.tool.time_budget = None
+        self.tool.memory_budget = 50
+
+        # We don't move the mouse, so that the region fraction used to
+        # predict the cost is not affected by the preview
+        canvas = self.viewer.axes.figure.canvas
+        self.tool.press(Event(0, 0, 2, 2, canvas))
+        self.tool.release(Event(50, 0, canvas=canvas))
+        self.tool._worker.wait()
+        get_qapp().processEvents()
+
+        mask = self.cube.subsets[0].to_mask()
+        assert mask.sum() == 4
+        assert mask[2, 2:4, 2:4].all()
+
+
+@pytest.mark.parametrize('shape', [(30, 40), (8, 9, 10)])
+def test_index_matches_scipy(shape):
+
+    np.random.seed(12345)
+    data = np.random.uniform(0.5, 2., shape)
+    start_coords = tuple(n // 2 for n in shape)
+
+    index = FloodfillIndex(data, start_coords, log_data=log_values(data))
+    assert index.nbytes == data.size * 4
+
+    for threshold in THRESHOLDS:
+        expected = floodfill_scipy(data, start_coords, threshold)
+        np.testing.assert_equal(index.mask(threshold), expected)
+
+
+def test_index_invalid_start():
+    data = np.array([[1., 0.], [np.nan, -1.]])
+    for start_coords in [(0, 1), (1, 0), (1, 1)]:
+        index = FloodfillIndex(data, start_coords)
+        assert index.mask(2.) is None
+        assert index.nbytes == 0
+
+
+@pytest.mark.parametrize(('backend', 'shape'), [(backend, shape)
+                                                for backend in FLOODFILL_BACKENDS
+                                                for shape in [(30, 40), (8, 9, 10)]])
+def test_backends_match_scipy(backend, shape):
+
+    np.random.seed(12345)
+    data = np.random.uniform(0.5, 2., shape)
+    start_coords = tuple(n // 2 for n in shape)
+
+    for threshold in THRESHOLDS:
+        expected = floodfill_scipy(data, start_coords, threshold)
+        np.testing.assert_equal(floodfill(data, start_coords, threshold, backend=backend),
+                                expected)
+
+
+@pytest.mark.parametrize('backend', list(FLOODFILL_BACKENDS) + ['auto'])
+@pytest.mark.parametrize('dtype', ['>f4', '>f8', np.float16])
+def test_backends_dtype(backend, dtype):
+
+    # FITS files give big-endian data, which compiled code does not support
+    np.random.seed(12345)
+    data = np.random.uniform(0.5, 2., (30, 40)).astype(dtype)
+
+    for threshold in THRESHOLDS:
+        expected = floodfill_scipy(data, (15, 20), threshold)
+        np.testing.assert_equal(floodfill(data, (15, 20), threshold, backend=backend),
+                                expected)
+
+
+@pytest.mark.parametrize('backend', list(FLOODFILL_BACKENDS) + ['auto'])
+@pytest.mark.parametrize('dtype', [np.uint8, np.int16])
+def test_backends_integer_boundaries(backend, dtype):
+
+    # For integer data, many pixels lie exactly at value / threshold or
+    # value * threshold, which are excluded from the selection
+    np.random.seed(12345)
+    data = np.random.randint(1, 20, (100, 100)).astype(dtype)
+    data[50, 50] = 6
+
+    for threshold in [1.5, 2., 3., 4. / 3.]:
+        expected = floodfill_scipy(data, (50, 50), threshold)
+        np.testing.assert_equal(floodfill(data, (50, 50), threshold, backend=backend),
+                                expected)
+
+
+@pytest.mark.parametrize('backend', list(FLOODFILL_BACKENDS))
+def test_backends_invalid_start(backend):
+    data = np.array([[1., 0.], [np.nan, -1.]])
+    for start_coords in [(0, 1), (1, 0), (1, 1)]:
+        assert floodfill(data, start_coords, 2., backend=backend) is None
+
+
+def test_backends_unknown():
+    with pytest.raises(ValueError) as exc:
+        floodfill(np.ones((3, 3)), (1, 1), 2., backend='spam')
+    assert exc.value.args[0].startswith('Unknown flood fill backend: spam')
+
+
+def test_select_backend():
+
+    coefficients = calibrate(np.float32)
+    assert calibrate(np.float32) is coefficients
+    assert set(coefficients) == set(FLOODFILL_BACKENDS)
+
+    for region_fraction in [None, 1e-4, 1.]:
+        assert select_backend((1000, 1000), np.float32,
+                              region_fraction=region_fraction) in FLOODFILL_BACKENDS
+
+    # Only backends which stop at max_pixels can be used for large regions
+    name = select_backend((1000, 1000), np.float32, region_fraction=1., max_pixels=100)
+    assert FLOODFILL_BACKENDS[name].truncates
@@ -1,5 +1,11 @@
 def setup():
+    # The image viewer is already loaded by glue at startup, but the tools
+    # themselves are only imported once they are first added to a viewer.
     from glue.viewers.image.qt import ImageViewer
-    from .zoom_buttons import ZoomInTool, ZoomOutTool  # noqa
+    from glue_exp.utils.plugins import lazy_viewer_tool
+    lazy_viewer_tool('Zoom In', __name__ + '.zoom_buttons', shortcut='+')
+    lazy_viewer_tool('Zoom Out', __name__ + '.zoom_buttons', shortcut='-')
+    lazy_viewer_tool('Scroll Zoom', __name__ + '.zoom_buttons')
     ImageViewer.tools.append('Zoom In')
     ImageViewer.tools.append('Zoom Out')
+    ImageViewer.tools.append('Scroll Zoom')
@@ -0,0 +1,162 @@
+import time
+
+import numpy as np
+from numpy.testing import assert_allclose
+from matplotlib.backend_bases import MouseEvent
+
+from glue.core import Data
+from glue.viewers.image.qt import ImageViewer
+from glue.app.qt import GlueApplication
+from glue.utils.qt import get_qapp
+
+from ..zoom_buttons import PendingZoom, auto_zoom, get_pending_zoom
+
+
+def process_events(duration):
+    # Process events for a given time, so that timers can fire
+    app = get_qapp()
+    start = time.time()
+    while time.time() - start < duration:
+        app.processEvents()
+        time.sleep(0.01)
+
+
+class TestZoom(object):
+
+    def setup_method(self, method):
+        self.image = Data(label='image', x=np.arange(10000.).reshape((100, 100)))
+        self.application = GlueApplication()
+        self.application.data_collection.append(self.image)
+        self.viewer = self.application.new_data_viewer(ImageViewer)
+        self.viewer.add_data(self.image)
+        self.viewer.state.aspect = 'auto'
+        self.axes = self.viewer.axes
+        self.axes.set_xlim(0, 80)
+        self.axes.set_ylim(10, 50)
+        self.canvas = self.axes.figure.canvas
+        self.canvas.draw()
+        process_events(0.1)
+
+        # Count the full redraws
+        self.n_draws = 0
+        draw = self.canvas.draw
+
+        def counting_draw(*args, **kwargs):
+            self.n_draws += 1
+            draw(*args, **kwargs)
+
+        self.canvas.draw = counting_draw
+
+    def teardown_method(self, method):
+        self.viewer.close(warn=False)
+        self.viewer = None
+        self.application.close()
+        self.application = None
+
+    def test_auto_zoom(self):
+        auto_zoom(self.axes, zoom_type='in')
+        auto_zoom(self.axes, zoom_type='in')
+        assert_allclose(self.axes.get_xlim(), (30, 50))
+        assert_allclose(self.axes.get_ylim(), (25, 35))
+        process_events(0.1)
+        assert self.n_draws == 1
+
+    def test_pending_zoom(self):
+
+        zoom = PendingZoom(self.axes, delay=50)
+
+        zoom.zoom(0.5)
+        zoom.zoom(0.5, center=(30, 20))
+        assert zoom.pending
+
+        # The zoom is only applied once it settles
+        assert_allclose(self.axes.get_xlim(), (0, 80))
+        assert_allclose(zoom.limits(), ((25, 45), (20, 30)))
+
+        process_events(0.3)
+
+        assert not zoom.pending
+        assert_allclose(self.axes.get_xlim(), (25, 45))
+        assert_allclose(self.axes.get_ylim(), (20, 30))
+        assert self.n_draws == 1
+
+    def test_tools(self):
+
+        zoom_in = self.viewer.toolbar.tools['Zoom In']
+        zoom_out = self.viewer.toolbar.tools['Zoom Out']
+
+        for tool in (zoom_in, zoom_in, zoom_out, zoom_in, zoom_in):
+            tool.activate()
+
+        process_events(0.5)
+
+        assert_allclose(self.axes.get_xlim(), (35, 45))
+        assert_allclose(self.axes.get_ylim(), (27.5, 32.5))
+        assert self.n_draws == 1
+
+    def test_smooth(self):
+
+        zoom = get_pending_zoom(self.axes)
+        zoom.delay = 50
+        zoom.smooth = True
+
+        before = zoom._region().copy()
+        zoom.zoom(0.5)
+
+        # The preview is drawn straight away without a full redraw, and shows
+        # the central part of the previous view scaled up
+        after = zoom._region()
+        ny, nx = after.shape[:2]
+        for row, col in [(0, 0), (ny // 2, nx // 3), (ny - 1, nx - 1)]:
+            near = before[ny // 4 + row // 2 - 1:ny // 4 + row // 2 + 2,
+                          nx // 4 + col // 2 - 1:nx // 4 + col // 2 + 2]
+            assert np.any(np.all(near == after[row, col], axis=-1))
+        assert self.n_draws == 0
+        assert_allclose(self.axes.get_xlim(), (0, 80))
+
+        zoom.zoom(2)
+        np.testing.assert_equal(zoom._region(), before)
+
+        process_events(0.3)
+
+        assert self.n_draws == 1
+        assert_allclose(self.axes.get_xlim(), (0, 80))
+
+    def test_scroll(self):
+
+        # Zooming with the scroll wheel works alongside the active mode
+        toolbar = self.viewer.toolbar
+        toolbar.active_tool = 'image:point_selection'
+        tool = toolbar.tools['Scroll Zoom']
+        assert tool.connected
+        tool.base_scale = 2.
+        tool.delay = 50
+
+        # Scroll at a pixel position, which matplotlib rounds to integers
+        x, y = 200, 150
+        xc, yc = self.axes.transData.inverted().transform((x, y))
+
+        for step in (1, 1, -1, 1):
+            event = MouseEvent('scroll_event', self.canvas, x, y, step=step)
+            self.canvas.callbacks.process('scroll_event', event)
+
+        process_events(0.3)
+
+        # The point under the cursor stays fixed
+        assert_allclose(self.axes.get_xlim(), (xc - xc / 4, xc + (80 - xc) / 4))
+        assert_allclose(self.axes.get_ylim(), (yc - (yc - 10) / 4, yc + (50 - yc) / 4))
+        assert_allclose(self.axes.transData.inverted().transform((x, y)), (xc, yc))
+        assert self.n_draws == 1
+
+        # The button turns zooming with the scroll wheel off, leaving the
+        # active mode alone
+        toolbar.actions['Scroll Zoom'].trigger()
+        assert not tool.connected
+        assert toolbar.active_tool is toolbar.tools['image:point_selection']
+        event = MouseEvent('scroll_event', self.canvas, x, y, step=1)
+        self.canvas.callbacks.process('scroll_event', event)
+        assert not get_pending_zoom(self.axes).pending
+
+        toolbar.actions['Scroll Zoom'].trigger()
+        assert tool.connected
+        assert toolbar.active_tool is toolbar.tools['image:point_selection']
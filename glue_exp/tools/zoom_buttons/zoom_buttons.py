@@ -1,16 +1,50 @@
 import os
+import weakref
+
+import numpy as np
+from matplotlib.colors import to_rgba
 
-from glue.config import viewer_tool
 from glue.viewers.common.tool import Tool
 
+from glue_exp.utils.plugins import viewer_tool
+
 
-__all__ = ['ZoomInTool', 'ZoomOutTool']
+__all__ = ['ZoomInTool', 'ZoomOutTool', 'ScrollZoomTool', 'PendingZoom', 'get_pending_zoom',
+           'auto_zoom']
 
 ROOT = os.path.dirname(__file__)
+ZOOM_DELAY = 100  # default delay before zoom requests are applied, in ms
+
+
+class ZoomTool(Tool):
+    """Base class for buttons which zoom by a fixed factor."""
+
+    # The factor by which to zoom in or out each time the tool is activated
+    base_scale = 2.0
+
+    # Zoom requests in quick succession (for example when the shortcut is held
+    # down) are accumulated and applied together after this delay, in ms, so
+    # that they only cause one redraw.
+    delay = ZOOM_DELAY
+
+    # Whether to show a preview of the zoom, scaled from the current image,
+    # while zooming, and only redraw the image fully once the zoom settles.
+    smooth = False
+
+    zoom_type = None
+
+    def activate(self):
+        zoom = get_pending_zoom(self.viewer.axes)
+        zoom.delay = self.delay
+        zoom.smooth = self.smooth
+        if self.zoom_type == 'in':
+            zoom.zoom(1.0 / self.base_scale)
+        else:
+            zoom.zoom(self.base_scale)
 
 
 @viewer_tool
-class ZoomInTool(Tool):
+class ZoomInTool(ZoomTool):
     """Button to zoom in."""
 
     icon = os.path.join(ROOT, 'glue_zoomin.png')
@@ -18,16 +52,11 @@ class ZoomInTool(Tool):
     action_text = tool_id
     tool_tip = tool_id
     shortcut = '+'
-
-    def __init__(self, *args, **kwargs):
-        super(ZoomInTool, self).__init__(*args, **kwargs)
-
-    def activate(self):
-        auto_zoom(self.viewer.axes, zoom_type='in')
+    zoom_type = 'in'
 
 
 @viewer_tool
-class ZoomOutTool(Tool):
+class ZoomOutTool(ZoomTool):
     """Button to zoom out."""
 
     icon = os.path.join(ROOT, 'glue_zoomout.png')
@@ -35,18 +64,292 @@ class ZoomOutTool(Tool):
     action_text = tool_id
     tool_tip = tool_id
     shortcut = '-'
+    zoom_type = 'out'
+
+
+@viewer_tool
+class ScrollZoomTool(Tool):
+    """
+    Zoom with the scroll wheel, keeping the point under the cursor fixed.
+
+    Zooming with the scroll wheel works in any mode, such as pan/zoom or the
+    selection modes, and the button turns it on or off without changing the
+    active mode.
+    """
+
+    icon = os.path.join(ROOT, 'glue_scrollzoom.png')
+    tool_id = 'Scroll Zoom'
+    action_text = 'Zoom with the scroll wheel'
+    tool_tip = ('Turn zooming in and out with the scroll wheel, about the '
+                'position of the cursor, on or off')
+
+    # Whether zooming with the scroll wheel is on when the viewer is created
+    scroll_zoom = True
+
+    # The factor by which to zoom for each step of the scroll wheel
+    base_scale = 1.25
+
+    # Scroll steps in quick succession are accumulated and applied together
+    # after this delay, in ms.
+    delay = ZOOM_DELAY
+
+    # Whether to show a preview of the zoom, scaled from the current image,
+    # while scrolling. Otherwise the view only changes once scrolling stops.
+    smooth = True
 
     def __init__(self, *args, **kwargs):
-        super(ZoomOutTool, self).__init__(*args, **kwargs)
+        super(ScrollZoomTool, self).__init__(*args, **kwargs)
+        self._connection = None
+        self._mode = None
+        toolbar = self.viewer.toolbar
+        toolbar.tool_activated.connect(self._update_mode)
+        toolbar.tool_deactivated.connect(self._update_mode)
+        if self.scroll_zoom:
+            self._connect()
+
+    @property
+    def connected(self):
+        """
+        Whether zooming with the scroll wheel is on.
+        """
+        return self._connection is not None
+
+    def _connect(self):
+        canvas = self.viewer.axes.figure.canvas
+        self._connection = canvas.mpl_connect('scroll_event', self.scroll)
+
+    def _disconnect(self):
+        if self._connection is not None:
+            self.viewer.axes.figure.canvas.mpl_disconnect(self._connection)
+            self._connection = None
+
+    def _update_mode(self):
+        self._mode = self.viewer.toolbar.active_tool
 
     def activate(self):
-        auto_zoom(self.viewer.axes, zoom_type='out')
+        if self.connected:
+            self._disconnect()
+        else:
+            self._connect()
+        # Pressing any button in the toolbar deactivates the active mode, so
+        # it is restored
+        if self._mode is not None:
+            self.viewer.toolbar.active_tool = self._mode
+
+    def close(self):
+        self._disconnect()
+        super(ScrollZoomTool, self).close()
+
+    def scroll(self, event):
+        if event.inaxes is not self.viewer.axes:
+            return
+        zoom = get_pending_zoom(self.viewer.axes)
+        zoom.delay = self.delay
+        zoom.smooth = self.smooth
+        # The position of the cursor is found from the view shown, which
+        # includes any zoom not yet applied to the axes.
+        center = zoom.data_coordinates(event.x, event.y)
+        zoom.zoom(self.base_scale ** -event.step, center=center)
+
+
+class PendingZoom(object):
+    """
+    Accumulate zoom requests for Matplotlib axes, so that several requests in
+    quick succession cause only one full redraw.
+
+    Each request scales the view about a point, and the requests are combined
+    into a single transformation of the axis limits which is applied once no
+    request has been made for ``delay`` milliseconds.
+
+    In smooth mode, each request immediately shows a preview of the new view,
+    resampled from a snapshot of the canvas taken before the first request,
+    and the axes are only redrawn fully once the zoom settles. This requires
+    a canvas based on the Agg renderer.
+
+    Parameters
+    ----------
+    axes : `~matplotlib.axes.Axes`
+        The axes to zoom.
+    delay : int, optional
+        The delay in milliseconds after the last request before the zoom is
+        applied.
+    smooth : bool, optional
+        Whether to show previews while zooming.
+    """
+
+    def __init__(self, axes, delay=ZOOM_DELAY, smooth=False):
+        self.axes = axes
+        self.delay = delay
+        self.smooth = smooth
+        self._transform = None
+        self._snapshot = None
+        self._timer = None
+
+    @property
+    def pending(self):
+        """
+        Whether there are zoom requests which have not been applied yet.
+        """
+        return self._transform is not None
+
+    def zoom(self, scale_factor, center=None):
+        """
+        Request a zoom.
+
+        Parameters
+        ----------
+        scale_factor : float
+            The factor by which to scale the size of the view, so that values
+            smaller than one zoom in.
+        center : tuple, optional
+            The ``(x, y)`` data coordinates of the point which stays fixed. By
+            default, this is the center of the current view, including any
+            zoom requests not yet applied.
+        """
+
+        if self._transform is None:
+            self._transform = (1., 0., 1., 0.)
+            if self.smooth:
+                self._take_snapshot()
+
+        ax, bx, ay, by = self._transform
+
+        if center is None:
+            (x1, x2), (y1, y2) = self.limits()
+            center = (x1 + x2) / 2., (y1 + y2) / 2.
+
+        # Each request maps coordinates as x -> c + s * (x - c), which is
+        # combined with the earlier requests.
+        xc, yc = center
+        self._transform = (scale_factor * ax, scale_factor * bx + xc * (1 - scale_factor),
+                           scale_factor * ay, scale_factor * by + yc * (1 - scale_factor))
+
+        if self._snapshot is not None:
+            self._draw_preview()
+
+        self._schedule()
+
+    def limits(self):
+        """
+        Return the axis limits once the pending zoom requests are applied.
+        """
+        x1, x2 = self.axes.get_xlim()
+        y1, y2 = self.axes.get_ylim()
+        if self._transform is None:
+            return (x1, x2), (y1, y2)
+        ax, bx, ay, by = self._transform
+        return (ax * x1 + bx, ax * x2 + bx), (ay * y1 + by, ay * y2 + by)
+
+    def data_coordinates(self, x, y):
+        """
+        Convert display coordinates to data coordinates, in the view once the
+        pending zoom requests are applied.
+        """
+        (x1, x2), (y1, y2) = self.limits()
+        bbox = self.axes.bbox
+        return (x1 + (x - bbox.x0) / bbox.width * (x2 - x1),
+                y1 + (y - bbox.y0) / bbox.height * (y2 - y1))
+
+    def flush(self):
+        """
+        Apply any pending zoom requests and redraw the axes.
+        """
+
+        if self._timer is not None:
+            self._timer.stop()
+
+        if self._transform is None:
+            return
+
+        xlim, ylim = self.limits()
+        self._transform = None
+        self._snapshot = None
+
+        self.axes.set_xlim(xlim)
+        self.axes.set_ylim(ylim)
+        self.axes.figure.canvas.draw_idle()
+
+    def _schedule(self):
+
+        canvas = self.axes.figure.canvas
+
+        if self._timer is None:
+            self._timer = canvas.new_timer(interval=self.delay)
+            self._timer.single_shot = True
+            self._timer.add_callback(self.flush)
+
+        # The timer is restarted by each request, so that the zoom is only
+        # applied once it settles.
+        self._timer.stop()
+        self._timer.interval = self.delay
+        self._timer.start()
+
+    def _region(self):
+        # Return a view of the part of the Agg buffer showing the axes, with
+        # rows from top to bottom.
+        buffer = np.asarray(self.axes.figure.canvas.buffer_rgba())
+        x0, y0, x1, y1 = np.round(self.axes.bbox.extents).astype(int)
+        height = buffer.shape[0]
+        return buffer[max(height - y1, 0):height - y0, max(x0, 0):x1]
+
+    def _take_snapshot(self):
+        try:
+            self._snapshot = self._region().copy()
+        except (AttributeError, TypeError, ValueError):
+            # The canvas has not been drawn yet or is not based on Agg
+            self._snapshot = None
+        if self._snapshot is not None and self._snapshot.size == 0:
+            self._snapshot = None
+
+    def _draw_preview(self):
+
+        region = self._region()
+
+        if region.shape != self._snapshot.shape:
+            # The canvas was resized since the snapshot was taken
+            self._snapshot = None
+            return
+
+        ny, nx = region.shape[:2]
+        ax, bx, ay, by = self._transform
+        (x1, x2), (y1, y2) = self.axes.get_xlim(), self.axes.get_ylim()
+
+        # For each pixel in the new view, find the pixel in the snapshot which
+        # shows the same position. Pixel rows are counted from the top, so the
+        # y axis is flipped.
+        px = (np.arange(nx) + 0.5) * ax + ((ax - 1) * x1 + bx) / (x2 - x1) * nx
+        py = (np.arange(ny) + 0.5) * ay - ((ay - 1) * y2 + by) / (y2 - y1) * ny
+        ix = np.floor(px).astype(int)
+        iy = np.floor(py).astype(int)
+        valid = (iy[:, None] >= 0) & (iy[:, None] < ny) & (ix >= 0) & (ix < nx)
+
+        preview = self._snapshot[np.clip(iy, 0, ny - 1)[:, None], np.clip(ix, 0, nx - 1)]
+        preview[~valid] = np.round(np.multiply(to_rgba(self.axes.get_facecolor()), 255))
+
+        region[...] = preview
+        self.axes.figure.canvas.blit(self.axes.bbox)
+
+
+_PENDING_ZOOMS = weakref.WeakKeyDictionary()
+
+
+def get_pending_zoom(axes):
+    """
+    Return the :class:`PendingZoom` shared by all the tools zooming ``axes``.
+    """
+    if axes not in _PENDING_ZOOMS:
+        _PENDING_ZOOMS[axes] = PendingZoom(axes)
+    return _PENDING_ZOOMS[axes]
 
 
 # Adapted from https://gist.github.com/tacaswell/3144287
 def auto_zoom(ax, zoom_type='in', base_scale=2.0):
     """Automatically zoom in or out by a pre-defined scale factor.
 
+    The axes are redrawn the next time control returns to the event loop, so
+    that several zooms in a row only cause one redraw. Use
+    :class:`PendingZoom` to also combine zooms spread over time.
+
     Parameters
     ----------
     ax : obj
@@ -83,5 +386,5 @@ def auto_zoom(ax, zoom_type='in', base_scale=2.0):
     ax.set_xlim([xcen - dx, xcen + dx])
     ax.set_ylim([ycen - dy, ycen + dy])
 
-    # Force redraw.
-    ax.figure.canvas.draw()
+    # Redraw once control returns to the event loop.
+    ax.figure.canvas.draw_idle()
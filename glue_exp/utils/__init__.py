@@ -0,0 +1,6 @@
+"""
+General utilities shared by the plugins in this package.
+
+Utilities here should not import from the individual plugins, and should only
+import from glue, the standard library, or external dependencies.
+"""
@@ -0,0 +1,145 @@
+import threading
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+
+from glue.core.hub import HubListener
+from glue.core.message import (NumericalDataChangedMessage, ComponentsChangedMessage,
+                               DataRemoveComponentMessage, DataCollectionDeleteMessage)
+
+__all__ = ['LayerCache', 'LAYER_CACHE']
+
+MAX_CACHE_BYTES = 1024 ** 3  # default memory limit for the cache
+
+INVALIDATING_MESSAGES = (NumericalDataChangedMessage, ComponentsChangedMessage,
+                         DataRemoveComponentMessage, DataCollectionDeleteMessage)
+
+
+def _hashable_view(view):
+    # Slices are not hashable, so we convert them to tuples
+    if view is None:
+        return None
+    if not isinstance(view, tuple):
+        view = (view,)
+    return tuple((s.start, s.stop, s.step) if isinstance(s, slice) else s for s in view)
+
+
+def _nbytes(value):
+    # Arrays that are views onto other arrays (typically the data itself) do
+    # not use any additional memory.
+    if isinstance(value, np.ndarray):
+        return value.nbytes if value.base is None else 0
+    else:
+        return getattr(value, 'nbytes', 0)
+
+
+class LayerCache(HubListener):
+    """
+    A least-recently-used cache for arrays and derived structures computed
+    from glue datasets.
+
+    Each entry is identified by a dataset, an attribute, a view, and a name
+    which describes what is being cached (e.g. the values themselves, or a
+    pyramid of downsampled images). Entries for a dataset are removed whenever
+    a message indicating that the values of the dataset have changed is sent
+    to the hub, and the least recently used entries are removed whenever the
+    memory used by the cache exceeds ``max_bytes``.
+
+    The cache can be accessed from several threads at once.
+
+    Parameters
+    ----------
+    max_bytes : int, optional
+        The maximum memory to use for the cache, in bytes.
+    """
+
+    def __init__(self, max_bytes=MAX_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self._hubs = weakref.WeakSet()
+
+    @property
+    def nbytes(self):
+        """
+        The memory currently used by the cache, in bytes.
+        """
+        with self._lock:
+            return sum(_nbytes(value) for value in self._entries.values())
+
+    def get(self, data, attribute, view=None, name='values', factory=None):
+        """
+        Return a cached value, computing it if needed.
+
+        Parameters
+        ----------
+        data : :class:`~glue.core.data.Data`
+            The dataset.
+        attribute : :class:`~glue.core.component_id.ComponentID`
+            The attribute.
+        view : tuple, optional
+            The view on the data.
+        name : str, optional
+            The name of the value to cache. By default this is ``'values'``,
+            which gives the values of the attribute in the view.
+        factory : callable, optional
+            A function with no arguments which computes the value if it is
+            not already in the cache. This is required unless ``name`` is
+            ``'values'``.
+        """
+
+        key = (data.uuid, attribute, _hashable_view(view), name)
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+
+        if factory is None:
+            if name != 'values':
+                raise ValueError("factory should be specified for name={0!r}".format(name))
+            value = np.asarray(data[attribute, view])
+        else:
+            value = factory()
+
+        # We can only make sure that the cache is kept up to date if the
+        # dataset is attached to a hub.
+        if data.hub is None:
+            return value
+
+        with self._lock:
+            if data.hub not in self._hubs:
+                for message_class in INVALIDATING_MESSAGES:
+                    data.hub.subscribe(self, message_class, handler=self._on_data_change)
+                self._hubs.add(data.hub)
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            self._evict()
+
+        return value
+
+    def invalidate(self, data=None):
+        """
+        Remove all entries for a dataset, or all entries if no dataset is given.
+        """
+        with self._lock:
+            if data is None:
+                self._entries.clear()
+            else:
+                for key in list(self._entries):
+                    if key[0] == data.uuid:
+                        self._entries.pop(key)
+
+    def _evict(self):
+        # Remove least recently used entries until we are below the memory
+        # limit. The most recent entry is always kept.
+        while len(self._entries) > 1 and self.nbytes > self.max_bytes:
+            self._entries.popitem(last=False)
+
+    def _on_data_change(self, message):
+        self.invalidate(message.data)
+
+
+# Cache shared by the different plugins
+LAYER_CACHE = LayerCache()
@@ -0,0 +1,121 @@
+import time
+import threading
+from collections import namedtuple
+from functools import wraps
+
+import numpy as np
+
+__all__ = ['Cost', 'TIME_BUDGET', 'calibration', 'time_call', 'choose_strategy',
+           'visible_slices']
+
+TIME_BUDGET = 1.  # default time budget for interactive computations, in seconds
+CALIBRATION_REPEAT = 3  # number of times each calibration measurement is repeated
+
+
+class Cost(namedtuple('Cost', ['seconds', 'nbytes'])):
+    """
+    The predicted cost of a computation, as a run time in seconds and a peak
+    memory usage in bytes.
+    """
+
+    def __add__(self, other):
+        return Cost(self.seconds + other.seconds, self.nbytes + other.nbytes)
+
+
+def calibration(function):
+    """
+    Decorator for calibration functions, which caches the result for each
+    set of arguments for the rest of the session.
+
+    Calibrations are carried out at most once even if the function is called
+    from several threads at once. The cache can be cleared, for example if
+    the set of things to calibrate changes, by calling the ``clear`` method of
+    the decorated function.
+    """
+
+    results = {}
+    lock = threading.Lock()
+
+    @wraps(function)
+    def wrapper(*args):
+        with lock:
+            if args not in results:
+                results[args] = function(*args)
+            return results[args]
+
+    def clear():
+        with lock:
+            results.clear()
+
+    wrapper.clear = clear
+
+    return wrapper
+
+
+def time_call(function, *args, **kwargs):
+    """
+    Return the shortest time taken by a function call over several
+    repetitions, in seconds.
+    """
+    best = np.inf
+    for repeat in range(CALIBRATION_REPEAT):
+        time1 = time.perf_counter()
+        function(*args, **kwargs)
+        best = min(best, time.perf_counter() - time1)
+    return best
+
+
+def choose_strategy(costs, time_budget=TIME_BUDGET, memory_budget=None):
+    """
+    Choose how to carry out a computation given its predicted cost.
+
+    Parameters
+    ----------
+    costs : list of tuple
+        A list of ``(strategy, cost)`` tuples, in order of preference, where
+        ``cost`` is a :class:`Cost`.
+    time_budget : float, optional
+        The maximum run time, in seconds, or `None` for no limit.
+    memory_budget : int, optional
+        The maximum memory usage, in bytes, or `None` for no limit.
+
+    Returns
+    -------
+    strategy
+        The first strategy which is within both budgets, or the fastest
+        strategy if none of them are.
+    """
+
+    for strategy, cost in costs:
+        if ((time_budget is None or cost.seconds <= time_budget) and
+                (memory_budget is None or cost.nbytes <= memory_budget)):
+            return strategy
+
+    return min(costs, key=lambda item: item[1].seconds)[0]
+
+
+def visible_slices(axes, shape):
+    """
+    Return the slices which give the part of a 2D image visible in Matplotlib
+    axes.
+
+    Parameters
+    ----------
+    axes : `~matplotlib.axes.Axes`
+        The axes, in which the image is assumed to be shown with pixel
+        coordinates as data coordinates.
+    shape : tuple
+        The shape of the image, as ``(ny, nx)``.
+
+    Returns
+    -------
+    slices : tuple of slice
+        The slices along ``y`` and ``x``.
+    """
+    slices = []
+    for limits, size in zip((axes.get_ylim(), axes.get_xlim()), shape):
+        lower, upper = sorted(limits)
+        lower = min(max(int(np.floor(lower + 0.5)), 0), size)
+        upper = min(max(int(np.ceil(upper + 0.5)), lower), size)
+        slices.append(slice(lower, upper))
+    return tuple(slices)
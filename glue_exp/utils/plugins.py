@@ -0,0 +1,67 @@
+import importlib
+
+from glue.config import viewer_tool as glue_viewer_tool
+
+__all__ = ['LazyTool', 'lazy_viewer_tool', 'viewer_tool']
+
+
+class LazyTool(object):
+    """
+    A placeholder for a viewer tool in the glue viewer tool registry, which
+    imports the module defining the tool when the tool is first created.
+
+    This lets plugins register their tools at startup without importing the
+    tools and their dependencies. When called, the placeholder imports the
+    module, which should register the real tool with :func:`viewer_tool`
+    (replacing the placeholder), and then returns an instance of the real
+    tool.
+
+    Parameters
+    ----------
+    tool_id : str
+        The ID of the tool.
+    module : str
+        The name of the module defining the tool.
+    shortcut : str, optional
+        The keyboard shortcut of the tool, which is listed by glue before
+        the tool is loaded.
+    """
+
+    def __init__(self, tool_id, module, shortcut=None):
+        self.tool_id = tool_id
+        self.module = module
+        self.shortcut = shortcut
+
+    def load(self):
+        """
+        Import the module defining the tool, and return the tool class.
+        """
+        importlib.import_module(self.module)
+        tool_cls = glue_viewer_tool.members.get(self.tool_id)
+        if tool_cls is None or isinstance(tool_cls, LazyTool):
+            raise ValueError("Module {0} did not register tool '{1}'"
+                             .format(self.module, self.tool_id))
+        return tool_cls
+
+    def __call__(self, *args, **kwargs):
+        return self.load()(*args, **kwargs)
+
+
+def lazy_viewer_tool(tool_id, module, shortcut=None):
+    """
+    Register a placeholder for a tool defined in ``module``, unless the tool
+    is already registered. See :class:`LazyTool` for the parameters.
+    """
+    if tool_id not in glue_viewer_tool.members:
+        glue_viewer_tool.members[tool_id] = LazyTool(tool_id, module, shortcut=shortcut)
+
+
+def viewer_tool(tool_cls):
+    """
+    Register a tool class, like the ``viewer_tool`` decorator from
+    :mod:`glue.config`, but replacing any placeholder registered with
+    :func:`lazy_viewer_tool`.
+    """
+    if isinstance(glue_viewer_tool.members.get(tool_cls.tool_id), LazyTool):
+        del glue_viewer_tool.members[tool_cls.tool_id]
+    return glue_viewer_tool(tool_cls)
@@ -0,0 +1,199 @@
+import os
+import json
+import time
+import threading
+import tracemalloc
+from collections import deque
+
+from glue.logger import logger
+
+__all__ = ['Instrumentation', 'INSTRUMENTATION']
+
+MAX_RECORDS = 1000  # default number of records kept by the instrumentation
+
+
+class _NullStage(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage(object):
+
+    def __init__(self, instrumentation, tool, name, metadata):
+        self.instrumentation = instrumentation
+        self.record = {'tool': tool, 'stage': name,
+                       'thread': threading.current_thread().name}
+        self.record.update(metadata)
+
+    def __enter__(self):
+        if self.instrumentation.memory:
+            self._memory_start = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        self.record['time'] = time.time()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.record['seconds'] = time.perf_counter() - self._start
+        if self.instrumentation.memory:
+            self.record['peak_bytes'] = tracemalloc.get_traced_memory()[1] - self._memory_start
+        self.instrumentation._add(self.record)
+        return False
+
+
+class Instrumentation(object):
+    """
+    Opt-in timing and memory measurements for the stages of interactive
+    operations in the plugins.
+
+    Stages are measured using the :meth:`stage` context manager. When the
+    instrumentation is disabled (the default), this does nothing. When it is
+    enabled, the time taken by each stage (and optionally the peak memory
+    allocated during the stage) is logged to the glue logger and kept in a
+    ring buffer of the last ``max_records`` records, which can be queried with
+    :meth:`records` or written to a JSON file with :meth:`dump`.
+
+    The instrumentation can also be enabled by setting the
+    ``GLUE_EXP_PROFILE`` environment variable to ``1`` (or to ``memory`` to
+    also measure memory) before the package is imported.
+
+    Parameters
+    ----------
+    max_records : int, optional
+        The maximum number of records to keep.
+    """
+
+    def __init__(self, max_records=MAX_RECORDS):
+        self.enabled = False
+        self.memory = False
+        self._started_tracing = False
+        self._records = deque(maxlen=max_records)
+        self._lock = threading.Lock()
+
+    def enable(self, memory=False):
+        """
+        Start recording stages.
+
+        Parameters
+        ----------
+        memory : bool, optional
+            Whether to also measure the peak memory allocated during each
+            stage. This uses :mod:`tracemalloc`, which slows down all memory
+            allocations, so should only be used when investigating memory
+            usage. Measurements are not meaningful for stages running at the
+            same time in different threads. This requires Python 3.9 or later.
+        """
+        if memory and not hasattr(tracemalloc, 'reset_peak'):
+            raise ValueError("Measuring memory requires Python 3.9 or later")
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        elif not memory:
+            self._stop_tracing()
+        self.memory = memory
+        self.enabled = True
+
+    def disable(self):
+        """
+        Stop recording stages.
+        """
+        self._stop_tracing()
+        self.memory = False
+        self.enabled = False
+
+    def _stop_tracing(self):
+        # Tracing started by someone else is left running
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def stage(self, tool, name, **metadata):
+        """
+        Context manager which measures a stage of an operation.
+
+        Parameters
+        ----------
+        tool : str
+            The name of the tool or plugin.
+        name : str
+            The name of the stage.
+        **metadata
+            Any additional information to include in the record, such as the
+            size of the data.
+        """
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, tool, name, metadata)
+
+    def _add(self, record):
+        with self._lock:
+            self._records.append(record)
+        if 'peak_bytes' in record:
+            logger.info("{tool}: {stage} took {seconds:.4f}s and allocated up "
+                        "to {peak_bytes} bytes".format(**record))
+        else:
+            logger.info("{tool}: {stage} took {seconds:.4f}s".format(**record))
+
+    def records(self, tool=None, stage=None):
+        """
+        Return the records, optionally only for a given tool and/or stage.
+
+        Each record is a dictionary which includes the ``tool`` and ``stage``
+        names, the ``thread`` in which the stage ran, the ``time`` at which it
+        started (as a Unix timestamp), the duration in ``seconds``, the
+        ``peak_bytes`` allocated if memory is measured, and any metadata given
+        to :meth:`stage`.
+        """
+        with self._lock:
+            records = list(self._records)
+        return [record for record in records
+                if (tool is None or record['tool'] == tool) and
+                (stage is None or record['stage'] == stage)]
+
+    def dump(self, filename):
+        """
+        Write the records to a JSON file.
+        """
+        with open(filename, 'w') as f:
+            json.dump(self.records(), f, indent=2)
+
+    def clear(self):
+        """
+        Remove all records.
+        """
+        with self._lock:
+            self._records.clear()
+
+
+def _enable_from_environment(instrumentation, environ=os.environ):
+    """
+    Enable the instrumentation if requested by the ``GLUE_EXP_PROFILE``
+    environment variable.
+    """
+
+    profile = environ.get('GLUE_EXP_PROFILE')
+
+    if profile not in ('1', 'memory'):
+        return
+
+    memory = profile == 'memory'
+
+    if memory and not hasattr(tracemalloc, 'reset_peak'):
+        logger.warning("Measuring memory requires Python 3.9 or later, so only "
+                       "timings will be recorded")
+        memory = False
+
+    instrumentation.enable(memory=memory)
+
+
+# Instrumentation shared by the different plugins
+INSTRUMENTATION = Instrumentation()
+
+_enable_from_environment(INSTRUMENTATION)
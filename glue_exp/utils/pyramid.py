@@ -0,0 +1,108 @@
+import numpy as np
+
+__all__ = ['ImagePyramid', 'upsample_cropped_mask']
+
+
+def downsample(array):
+    """
+    Downsample a 2D array by a factor of two by averaging blocks of 2x2 pixels.
+
+    If the dimensions are odd, the last row and/or column are dropped. The
+    blocks are summed one pixel at a time so that no full resolution
+    temporary array is needed.
+    """
+    ny, nx = array.shape
+    fy = 2 if ny > 1 else 1
+    fx = 2 if nx > 1 else 1
+    ny2, nx2 = ny // fy, nx // fx
+    result = np.zeros((ny2, nx2), dtype=np.float32)
+    for dy in range(fy):
+        for dx in range(fx):
+            result += array[dy:ny2 * fy:fy, dx:nx2 * fx:fx]
+    result /= fy * fx
+    return result
+
+
+class ImagePyramid(object):
+    """
+    A set of successively downsampled versions of a 2D image.
+
+    Each level is downsampled by a factor of two compared to the previous one
+    by averaging blocks of pixels. Levels are computed on demand and are then
+    kept, so each level is only computed once.
+
+    Parameters
+    ----------
+    data : `~numpy.ndarray`
+        The full resolution 2D image.
+    """
+
+    def __init__(self, data):
+        self._levels = [data]
+
+    @property
+    def nbytes(self):
+        """
+        The memory used by the downsampled levels, in bytes.
+        """
+        return sum(level.nbytes for level in self._levels[1:])
+
+    def level(self, max_pixels):
+        """
+        Return the highest resolution level with at most ``max_pixels`` pixels.
+
+        Parameters
+        ----------
+        max_pixels : int
+            The maximum number of pixels in the returned image.
+
+        Returns
+        -------
+        factor : int
+            The downsampling factor along each dimension.
+        image : `~numpy.ndarray`
+            The downsampled image.
+        """
+        while self._levels[-1].size > max_pixels and max(self._levels[-1].shape) > 1:
+            self._levels.append(downsample(self._levels[-1]))
+        for index, level in enumerate(self._levels):
+            if level.size <= max_pixels or index == len(self._levels) - 1:
+                return 2 ** index, level
+
+
+def upsample_cropped_mask(slices, mask, factor, shape, full_shape):
+    """
+    Upsample a mask computed on a downsampled image and cropped to its
+    bounding box, without computing the mask for the whole full resolution
+    image.
+
+    Parameters
+    ----------
+    slices : tuple of slice
+        The slices which give the bounding box in the downsampled image.
+    mask : `~numpy.ndarray`
+        The 2D mask inside the bounding box.
+    factor : int
+        The downsampling factor along each dimension.
+    shape : tuple
+        The shape of the downsampled image.
+    full_shape : tuple
+        The shape of the full resolution image.
+
+    Returns
+    -------
+    slices : tuple of slice
+        The slices which give the bounding box in the full resolution image.
+    mask : `~numpy.ndarray`
+        The full resolution mask inside the bounding box.
+    """
+    full_slices = []
+    indices = []
+    for s, n, full_n in zip(slices, shape, full_shape):
+        start = s.start * factor
+        # The last row or column of the downsampled image also covers any
+        # rows or columns dropped when downsampling
+        stop = full_n if s.stop == n else s.stop * factor
+        full_slices.append(slice(start, stop))
+        indices.append(np.minimum(np.arange(start, stop) // factor, n - 1) - s.start)
+    return tuple(full_slices), mask[np.ix_(*indices)]
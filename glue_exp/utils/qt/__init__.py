@@ -0,0 +1 @@
+from .threading import *  # noqa
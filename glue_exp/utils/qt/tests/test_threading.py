@@ -0,0 +1,75 @@
+import threading
+
+from mock import MagicMock
+
+from glue.utils.qt import get_qapp
+
+from ..threading import CoalescingWorker
+
+
+def test_result():
+
+    worker = CoalescingWorker()
+    callback = MagicMock()
+
+    worker.submit(lambda: 1 + 1, callback)
+    worker.wait()
+    get_qapp().processEvents()
+
+    callback.assert_called_once_with(2)
+    assert not worker.running
+
+
+def test_coalesce():
+
+    # While the first call is running, submit several more - only the last of
+    # these should be executed, and only its callback should be called.
+
+    started = threading.Event()
+    release = threading.Event()
+    executed = []
+
+    def func(value):
+        def wrapper():
+            started.set()
+            release.wait()
+            executed.append(value)
+            return value
+        return wrapper
+
+    worker = CoalescingWorker()
+    callback = MagicMock()
+
+    worker.submit(func(0), callback)
+    started.wait()
+
+    for value in range(1, 5):
+        worker.submit(func(value), callback)
+
+    release.set()
+    worker.wait()
+    get_qapp().processEvents()
+
+    assert executed == [0, 4]
+    callback.assert_called_once_with(4)
+
+
+def test_cancel():
+
+    release = threading.Event()
+
+    def func():
+        release.wait()
+        return 1
+
+    worker = CoalescingWorker()
+    callback = MagicMock()
+
+    worker.submit(func, callback)
+    worker.cancel()
+
+    release.set()
+    worker.wait()
+    get_qapp().processEvents()
+
+    assert callback.call_count == 0
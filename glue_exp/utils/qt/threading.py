@@ -0,0 +1,104 @@
+import sys
+import threading
+
+from qtpy import QtCore
+
+__all__ = ['CoalescingWorker']
+
+
+class CoalescingWorker(QtCore.QObject):
+    """
+    Execute function calls on a background thread, keeping only the latest.
+
+    This is intended for interactive tools which trigger an expensive
+    computation on every mouse event. Calls are executed one at a time on a
+    background thread. If several calls are submitted while one is running,
+    only the most recent one is kept, and the result of a call is discarded if
+    a newer call has been submitted since. The callback for the latest call is
+    then executed on the main (GUI) thread. Exceptions raised by the function
+    are passed to :func:`sys.excepthook` on the main thread.
+    """
+
+    _done = QtCore.Signal(object)
+
+    def __init__(self, parent=None):
+        super(CoalescingWorker, self).__init__(parent)
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._pending = None
+        self._thread = None
+        self._done.connect(self._on_done)
+
+    @property
+    def running(self):
+        """
+        Whether a call is currently being executed or is waiting to be.
+        """
+        with self._lock:
+            return self._thread is not None
+
+    def submit(self, func, callback=None):
+        """
+        Schedule a function call, replacing any call not yet started.
+
+        Parameters
+        ----------
+        func : callable
+            The function to call on the background thread, with no arguments.
+        callback : callable, optional
+            A function to call on the main thread with the result of ``func``,
+            unless a newer call has been submitted in the mean time.
+        """
+        with self._lock:
+            self._generation += 1
+            self._pending = (self._generation, func, callback)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+
+    def cancel(self):
+        """
+        Cancel any pending call and discard the result of the current one.
+        """
+        with self._lock:
+            self._generation += 1
+            self._pending = None
+
+    def wait(self, timeout=None):
+        """
+        Wait until all submitted calls have been executed.
+
+        Note that callbacks are only executed once control returns to the Qt
+        event loop.
+        """
+        with self._lock:
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if self._pending is None:
+                    self._thread = None
+                    return
+                generation, func, callback = self._pending
+                self._pending = None
+            try:
+                result = func()
+            except Exception:
+                self._done.emit((generation, callback, None, sys.exc_info()))
+            else:
+                self._done.emit((generation, callback, result, None))
+
+    def _on_done(self, output):
+        generation, callback, result, exc_info = output
+        if generation != self._generation:
+            return
+        if exc_info is not None:
+            # Report the error the same way as for exceptions raised in
+            # other Qt callbacks
+            sys.excepthook(*exc_info)
+        elif callback is not None:
+            callback(result)
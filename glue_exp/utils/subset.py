@@ -0,0 +1,185 @@
+import zlib
+import base64
+
+import numpy as np
+
+from glue.core.subset import SubsetState
+
+__all__ = ['crop_mask', 'CroppedMaskSubsetState']
+
+
+def crop_mask(mask):
+    """
+    Crop a boolean mask to the bounding box of the selected values.
+
+    Parameters
+    ----------
+    mask : `~numpy.ndarray`
+        The boolean mask.
+
+    Returns
+    -------
+    slices : tuple of slice
+        The slices which give the bounding box in the original mask.
+    mask : `~numpy.ndarray`
+        The boolean mask with the shape of the bounding box.
+    """
+
+    slices = []
+
+    for axis in range(mask.ndim):
+        other_axes = tuple(i for i in range(mask.ndim) if i != axis)
+        indices = np.nonzero(np.any(mask, axis=other_axes))[0]
+        if len(indices) == 0:
+            slices = [slice(0, 0)] * mask.ndim
+            break
+        slices.append(slice(indices[0], indices[-1] + 1))
+
+    slices = tuple(slices)
+
+    return slices, mask[slices]
+
+
+def _is_basic(view):
+    # Whether a view only contains integers and slices
+    if view is None:
+        return True
+    if not isinstance(view, tuple):
+        view = (view,)
+    return all(isinstance(v, (slice, int, np.integer)) for v in view)
+
+
+class CroppedMaskSubsetState(SubsetState):
+    """
+    A subset defined by a boolean mask which is only stored inside a bounding
+    box.
+
+    This behaves like :class:`~glue.core.subset.MaskSubsetState` but the
+    memory used, and the size of the subset in saved sessions, scale with the
+    size of the bounding box of the selection rather than with the size of
+    the data. Masks for the data are computed only when needed, for the
+    requested view.
+
+    Parameters
+    ----------
+    slices : tuple of slice
+        The slices which give the bounding box of the selection, in pixel
+        coordinates along ``cids``.
+    mask : `~numpy.ndarray`
+        The boolean mask inside the bounding box.
+    cids : iterable of :class:`~glue.core.component_id.ComponentID`
+        The component IDs along which the mask applies.
+    """
+
+    def __init__(self, slices, mask, cids):
+        self._cids = cids
+        self._mask = np.asarray(mask, dtype=bool)
+        self._slices = tuple(slice(int(s.start), int(s.start) + n)
+                             for s, n in zip(slices, self._mask.shape))
+
+    @classmethod
+    def from_mask(cls, mask, cids):
+        """
+        Create a subset state from a boolean mask with the same shape as the
+        data.
+        """
+        slices, mask = crop_mask(np.asarray(mask, dtype=bool))
+        return cls(slices, mask, cids)
+
+    @property
+    def slices(self):
+        """
+        The slices which give the bounding box of the selection.
+        """
+        return self._slices
+
+    @property
+    def mask(self):
+        """
+        The boolean mask inside the bounding box.
+        """
+        return self._mask
+
+    @property
+    def cids(self):
+        """
+        The component IDs along which the mask applies.
+        """
+        return self._cids
+
+    @property
+    def attributes(self):
+        return self._cids
+
+    def copy(self):
+        return CroppedMaskSubsetState(self.slices, self.mask, self.cids)
+
+    def to_mask(self, data, view=None):
+
+        # For data on the same pixel grid, we can directly find the part of
+        # the bounding box inside the view, without computing the pixel
+        # coordinates of each element in the view.
+        if data.pixel_component_ids == self.cids and _is_basic(view):
+
+            if view is None:
+                view = ()
+            elif not isinstance(view, tuple):
+                view = (view,)
+            view = view + (slice(None),) * (data.ndim - len(view))
+
+            # For each dimension, find the elements of the view inside the
+            # bounding box. Integer indices remove the dimension.
+            result_shape = []
+            result_index = []
+            mask_index = []
+            inside_box = True
+
+            for v, box, size in zip(view, self.slices, data.shape):
+                indices = np.arange(size)[v]
+                inside = (indices >= box.start) & (indices < box.stop)
+                if np.ndim(indices) == 0:
+                    inside_box &= bool(inside)
+                    mask_index.append(int(indices) - box.start)
+                else:
+                    result_shape.append(len(indices))
+                    result_index.append(np.nonzero(inside)[0])
+                    mask_index.append(indices[inside] - box.start)
+
+            result = np.zeros(result_shape, dtype=bool)
+
+            if inside_box:
+                mask = self.mask[tuple(m if np.ndim(m) == 0 else slice(None)
+                                       for m in mask_index)]
+                mask = mask[np.ix_(*[m for m in mask_index if np.ndim(m) > 0])]
+                result[np.ix_(*result_index)] = mask
+
+            return result
+
+        # Otherwise locate each element of data in the coordinate system of
+        # the mask
+        vals = [data[c, view].astype(int) for c in self.cids]
+
+        inside = np.ones(vals[0].shape, dtype=bool)
+        for v, box in zip(vals, self.slices):
+            inside &= (v >= box.start) & (v < box.stop)
+
+        result = np.zeros(vals[0].shape, dtype=bool)
+        result[inside] = self.mask[tuple(v[inside] - box.start
+                                         for v, box in zip(vals, self.slices))]
+
+        return result
+
+    def __gluestate__(self, context):
+        # The mask is packed to one bit per value and compressed
+        packed = zlib.compress(np.packbits(self.mask).tobytes())
+        return dict(cids=[context.id(c) for c in self.cids],
+                    slices=[[s.start, s.stop] for s in self.slices],
+                    mask=base64.b64encode(packed).decode('ascii'))
+
+    @classmethod
+    def __setgluestate__(cls, rec, context):
+        slices = tuple(slice(start, stop) for start, stop in rec['slices'])
+        shape = tuple(s.stop - s.start for s in slices)
+        packed = np.frombuffer(zlib.decompress(base64.b64decode(rec['mask'])), dtype=np.uint8)
+        mask = np.unpackbits(packed)[:int(np.prod(shape))].reshape(shape).astype(bool)
+        return cls(slices, mask, [context.object(c) for c in rec['cids']])
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+from mock import MagicMock
+
+from glue.core import Data, DataCollection
+
+from ..cache import LayerCache
+
+
+class TestLayerCache(object):
+
+    def setup_method(self, method):
+        self.data1 = Data(x=np.arange(12).reshape((3, 4)), label='data1')
+        self.data2 = Data(y=np.ones((5, 6)), label='data2')
+        self.dc = DataCollection([self.data1, self.data2])
+        self.cache = LayerCache()
+
+    def test_values(self):
+
+        values = self.cache.get(self.data1, self.data1.id['x'])
+        np.testing.assert_equal(values, self.data1['x'])
+        assert self.cache.get(self.data1, self.data1.id['x']) is values
+
+        view = (1, slice(None))
+        values = self.cache.get(self.data1, self.data1.id['x'], view)
+        np.testing.assert_equal(values, [4, 5, 6, 7])
+        assert self.cache.get(self.data1, self.data1.id['x'], view) is values
+
+    def test_factory(self):
+
+        factory = MagicMock(return_value=1)
+
+        assert self.cache.get(self.data1, self.data1.id['x'], name='test', factory=factory) == 1
+        assert self.cache.get(self.data1, self.data1.id['x'], name='test', factory=factory) == 1
+        assert factory.call_count == 1
+
+        with pytest.raises(ValueError) as exc:
+            self.cache.get(self.data1, self.data1.id['x'], name='test2')
+        assert exc.value.args[0] == "factory should be specified for name='test2'"
+
+    def test_invalidate_on_update(self):
+
+        factory = MagicMock(return_value=1)
+
+        self.cache.get(self.data1, self.data1.id['x'], name='test', factory=factory)
+        self.cache.get(self.data2, self.data2.id['y'], name='test', factory=factory)
+
+        self.data1.update_components({self.data1.id['x']: np.zeros((3, 4))})
+
+        self.cache.get(self.data1, self.data1.id['x'], name='test', factory=factory)
+        self.cache.get(self.data2, self.data2.id['y'], name='test', factory=factory)
+        assert factory.call_count == 3
+
+        np.testing.assert_equal(self.cache.get(self.data1, self.data1.id['x']), 0)
+
+    def test_invalidate_on_remove(self):
+        self.cache.get(self.data2, self.data2.id['y'], name='test', factory=lambda: 1)
+        self.dc.remove(self.data2)
+        assert len(self.cache._entries) == 0
+
+    def test_no_hub(self):
+        data = Data(x=[1, 2, 3])
+        factory = MagicMock(return_value=1)
+        self.cache.get(data, data.id['x'], name='test', factory=factory)
+        self.cache.get(data, data.id['x'], name='test', factory=factory)
+        assert factory.call_count == 2
+
+    def test_memory_limit(self):
+
+        self.cache.max_bytes = 200
+
+        self.cache.get(self.data1, self.data1.id['x'], name='a', factory=lambda: np.zeros(10))
+        self.cache.get(self.data1, self.data1.id['x'], name='b', factory=lambda: np.zeros(10))
+        self.cache.get(self.data1, self.data1.id['x'], name='a', factory=lambda: np.zeros(10))
+        assert self.cache.nbytes == 160
+
+        # Views onto the data do not count towards the memory used
+        self.cache.get(self.data1, self.data1.id['x'])
+        assert self.cache.nbytes == 160
+
+        # The least recently used entry ('b') should be removed
+        self.cache.get(self.data1, self.data1.id['x'], name='c', factory=lambda: np.zeros(10))
+        assert [key[-1] for key in self.cache._entries] == ['a', 'values', 'c']
+        assert self.cache.nbytes == 160
@@ -0,0 +1,56 @@
+import numpy as np
+from matplotlib.figure import Figure
+
+from ..cost import Cost, calibration, choose_strategy, time_call, visible_slices
+
+
+def test_choose_strategy():
+
+    costs = [('full', Cost(2., 100)), ('window', Cost(0.5, 300)), ('preview', Cost(0.1, 10))]
+
+    assert choose_strategy(costs, time_budget=None) == 'full'
+    assert choose_strategy(costs, time_budget=1.) == 'window'
+    assert choose_strategy(costs, time_budget=1., memory_budget=200) == 'preview'
+
+    # If no strategy is within the budget, the fastest one is used
+    assert choose_strategy(costs, time_budget=0.01) == 'preview'
+
+
+def test_cost_add():
+    assert Cost(1., 2) + Cost(3., 4) == Cost(4., 6)
+
+
+def test_calibration():
+
+    calls = []
+
+    @calibration
+    def calibrate(value):
+        calls.append(value)
+        return value * 2
+
+    assert calibrate(1) == 2
+    assert calibrate(1) == 2
+    assert calibrate(2) == 4
+    assert calls == [1, 2]
+
+    calibrate.clear()
+    assert calibrate(1) == 2
+    assert calls == [1, 2, 1]
+
+
+def test_time_call():
+    assert time_call(np.zeros, 10) >= 0
+
+
+def test_visible_slices():
+
+    axes = Figure().add_subplot(1, 1, 1)
+
+    axes.set_xlim(-0.5, 9.5)
+    axes.set_ylim(-0.5, 4.5)
+    assert visible_slices(axes, (5, 10)) == (slice(0, 5), slice(0, 10))
+
+    axes.set_xlim(2.2, 5.6)
+    axes.set_ylim(3.5, -10)
+    assert visible_slices(axes, (5, 10)) == (slice(0, 4), slice(2, 7))
@@ -0,0 +1,79 @@
+import sys
+import subprocess
+
+import pytest
+
+from glue.config import viewer_tool as glue_viewer_tool
+
+from ..plugins import LazyTool, lazy_viewer_tool
+
+TOOL_MODULE = """
+from glue.viewers.common.tool import Tool
+from glue_exp.utils.plugins import viewer_tool
+
+
+@viewer_tool
+class LazyTestTool(Tool):
+    tool_id = 'lazy_test_tool'
+"""
+
+# Modules imported by glue at startup, before external plugins are loaded
+STARTUP = "import glue.config, glue.logger, glue.viewers.image.qt"
+
+PLUGINS = ['glue_exp.importers.webcam', 'glue_exp.importers.vizier',
+           'glue_exp.tools.contour_selection', 'glue_exp.tools.floodfill_selection',
+           'glue_exp.tools.zoom_buttons']
+
+
+def test_lazy_tool(tmpdir, monkeypatch):
+
+    tmpdir.join('lazy_test_module.py').write(TOOL_MODULE)
+    monkeypatch.syspath_prepend(str(tmpdir))
+
+    try:
+
+        lazy_viewer_tool('lazy_test_tool', 'lazy_test_module', shortcut='x')
+
+        placeholder = glue_viewer_tool.members['lazy_test_tool']
+        assert isinstance(placeholder, LazyTool)
+        assert placeholder.shortcut == 'x'
+        assert 'lazy_test_module' not in sys.modules
+
+        # Creating the tool imports the module, which replaces the placeholder
+        tool = placeholder(viewer=None)
+        tool_cls = glue_viewer_tool.members['lazy_test_tool']
+        assert type(tool) is tool_cls
+        assert tool_cls.__name__ == 'LazyTestTool'
+
+        # Tools which are already loaded are not replaced by placeholders
+        lazy_viewer_tool('lazy_test_tool', 'lazy_test_module')
+        assert glue_viewer_tool.members['lazy_test_tool'] is tool_cls
+
+    finally:
+        glue_viewer_tool.members.pop('lazy_test_tool', None)
+        sys.modules.pop('lazy_test_module', None)
+
+
+def test_lazy_tool_missing():
+    with pytest.raises(ValueError) as exc:
+        LazyTool('lazy_missing_tool', 'glue_exp.utils.plugins')(viewer=None)
+    assert exc.value.args[0] == ("Module glue_exp.utils.plugins did not register "
+                                 "tool 'lazy_missing_tool'")
+
+
+@pytest.mark.parametrize('plugin', PLUGINS)
+def test_setup_imports(plugin):
+
+    # Setting up the plugins should not import any modules other than the
+    # plugins themselves. This is run in a new process, since the modules are
+    # already imported here.
+    code = ("import sys; {0}; before = set(sys.modules); "
+            "from {1} import setup; setup(); "
+            "print(' '.join(sorted(set(sys.modules) - before)))".format(STARTUP, plugin))
+
+    output = subprocess.check_output([sys.executable, '-c', code],
+                                     stderr=subprocess.DEVNULL, universal_newlines=True)
+
+    imported = output.split()
+    assert imported
+    assert all(name.startswith('glue_exp') for name in imported), imported
@@ -0,0 +1,89 @@
+import json
+import tracemalloc
+
+import numpy as np
+
+from .. import profiling
+from ..profiling import Instrumentation
+
+
+def test_disabled():
+    instrumentation = Instrumentation()
+    with instrumentation.stage('tool', 'stage'):
+        pass
+    assert instrumentation.records() == []
+
+
+def test_records(tmpdir):
+
+    instrumentation = Instrumentation(max_records=3)
+    instrumentation.enable()
+
+    for name in ['a', 'b', 'a', 'c']:
+        with instrumentation.stage('tool', name, size=10):
+            pass
+
+    instrumentation.disable()
+
+    with instrumentation.stage('tool', 'd'):
+        pass
+
+    # Only the last three records are kept
+    records = instrumentation.records()
+    assert [record['stage'] for record in records] == ['b', 'a', 'c']
+    assert all(record['size'] == 10 and record['seconds'] >= 0 for record in records)
+    assert 'peak_bytes' not in records[0]
+
+    assert len(instrumentation.records(stage='a')) == 1
+    assert len(instrumentation.records(tool='other')) == 0
+
+    filename = tmpdir.join('records.json').strpath
+    instrumentation.dump(filename)
+    with open(filename) as f:
+        assert json.load(f) == records
+
+    instrumentation.clear()
+    assert instrumentation.records() == []
+
+
+def test_memory():
+
+    instrumentation = Instrumentation()
+    instrumentation.enable(memory=True)
+
+    try:
+        with instrumentation.stage('tool', 'allocate'):
+            array = np.ones(1000000)
+            del array
+    finally:
+        instrumentation.disable()
+
+    assert instrumentation.records()[0]['peak_bytes'] >= 8000000
+
+
+def test_memory_existing_tracing():
+
+    # Tracing which was already running is left running
+    tracemalloc.start()
+
+    try:
+        instrumentation = Instrumentation()
+        instrumentation.enable(memory=True)
+        instrumentation.disable()
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+
+
+def test_enable_from_environment(monkeypatch):
+
+    instrumentation = Instrumentation()
+    profiling._enable_from_environment(instrumentation, {})
+    assert not instrumentation.enabled
+
+    # Without tracemalloc.reset_peak (Python < 3.9), only timings are recorded
+    monkeypatch.delattr(tracemalloc, 'reset_peak')
+    profiling._enable_from_environment(instrumentation, {'GLUE_EXP_PROFILE': 'memory'})
+    assert instrumentation.enabled
+    assert not instrumentation.memory
+    assert not tracemalloc.is_tracing()
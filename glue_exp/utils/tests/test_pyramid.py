@@ -0,0 +1,49 @@
+import numpy as np
+
+from ..pyramid import ImagePyramid, upsample_cropped_mask
+from ..subset import crop_mask
+
+
+def test_pyramid():
+
+    data = np.arange(35, dtype=float).reshape((5, 7))
+    pyramid = ImagePyramid(data)
+
+    factor, level = pyramid.level(100)
+    assert factor == 1
+    assert level is data
+
+    factor, level = pyramid.level(6)
+    assert factor == 2
+    np.testing.assert_allclose(level, [[4, 6, 8], [18, 20, 22]])
+
+    factor, level = pyramid.level(1)
+    assert factor == 4
+    assert level.shape == (1, 1)
+
+    assert pyramid.nbytes == 4 * (6 + 1)
+
+
+def test_upsample_cropped_mask():
+
+    mask = np.array([[1, 0], [0, 1]], dtype=bool)
+    expected = [[1, 1, 0, 0, 0],
+                [1, 1, 0, 0, 0],
+                [0, 0, 1, 1, 1]]
+    slices, result = upsample_cropped_mask((slice(0, 2), slice(0, 2)), mask, 2, (2, 2), (3, 5))
+    assert slices == (slice(0, 3), slice(0, 5))
+    np.testing.assert_equal(result, expected)
+
+    # Upsampling the cropped mask gives the same result as upsampling the
+    # whole mask (with the last row and column also covering any rows and
+    # columns dropped when downsampling) and then cropping it
+    mask = np.zeros((4, 5), dtype=bool)
+    mask[1, 2] = mask[3, 3:] = True
+    for factor, full_shape in [(1, (4, 5)), (2, (9, 11)), (4, (17, 20))]:
+        iy = np.minimum(np.arange(full_shape[0]) // factor, mask.shape[0] - 1)
+        ix = np.minimum(np.arange(full_shape[1]) // factor, mask.shape[1] - 1)
+        expected = crop_mask(mask[np.ix_(iy, ix)])
+        slices, cropped = crop_mask(mask)
+        result = upsample_cropped_mask(slices, cropped, factor, mask.shape, full_shape)
+        assert result[0] == expected[0]
+        np.testing.assert_equal(result[1], expected[1])
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from glue.core import Data, DataCollection
+from glue.core.state import GlueSerializer
+from glue.core.tests.test_state import clone
+
+from ..subset import crop_mask, CroppedMaskSubsetState
+
+
+def test_crop_mask():
+
+    mask = np.zeros((4, 5, 6), dtype=bool)
+    mask[1, 2:4, 3] = True
+    mask[2, 2, 1] = True
+
+    slices, cropped = crop_mask(mask)
+    assert slices == (slice(1, 3), slice(2, 4), slice(1, 4))
+    np.testing.assert_equal(cropped, mask[slices])
+
+    slices, cropped = crop_mask(np.zeros((3, 4), dtype=bool))
+    assert cropped.shape == (0, 0)
+
+
+class TestCroppedMaskSubsetState(object):
+
+    def setup_method(self, method):
+
+        np.random.seed(12345)
+        self.mask = np.zeros((4, 5, 6), dtype=bool)
+        self.mask[1:3, 1:4, 2:5] = np.random.random((2, 3, 3)) > 0.5
+
+        self.data = Data(x=np.ones((4, 5, 6)), label='data')
+        self.state = CroppedMaskSubsetState.from_mask(self.mask, self.data.pixel_component_ids)
+
+    def test_mask(self):
+        assert self.state.slices == (slice(1, 3), slice(1, 4), slice(2, 5))
+        assert self.state.mask.shape == (2, 3, 3)
+
+    @pytest.mark.parametrize('view', [None, 1, -3, (1, slice(None), slice(2, 5)),
+                                      (slice(None, None, -1), 3, slice(1, 6, 2)),
+                                      (0, 0, 0), (1, 2, -2), (slice(2, 3),)])
+    def test_to_mask(self, view):
+        expected = self.mask if view is None else self.mask[view]
+        np.testing.assert_equal(self.state.to_mask(self.data, view), expected)
+
+    def test_to_mask_fancy_view(self):
+        view = (np.array([1, 2, 3]), np.array([1, 2, 0]), np.array([2, 3, 4]))
+        np.testing.assert_equal(self.state.to_mask(self.data, view), self.mask[view])
+
+    def test_subset(self):
+        subset = self.data.new_subset()
+        subset.subset_state = self.state
+        np.testing.assert_equal(subset.to_mask(), self.mask)
+        np.testing.assert_equal(subset.to_mask((2, slice(None))), self.mask[2])
+
+    def test_session(self):
+
+        dc = DataCollection([self.data])
+        dc.new_subset_group(subset_state=self.state, label='flood fill')
+
+        dc2 = clone(dc)
+        np.testing.assert_equal(dc2[0].subsets[0].to_mask(), self.mask)
+
+    def test_session_size(self):
+
+        # The size of the saved subset should scale with the size of the
+        # selection rather than that of the data
+        data = Data(x=np.ones((2000, 2000)), label='large')
+        mask = np.zeros(data.shape, dtype=bool)
+        mask[1000:1010, 500:520] = True
+        state = CroppedMaskSubsetState.from_mask(mask, data.pixel_component_ids)
+
+        record = state.__gluestate__(GlueSerializer(data))
+        assert len(record['mask']) < 100